@@ -1,4 +1,15 @@
 from .helpers import *
 from .client import *
 from .json_client import *
-from .exceptions import *
\ No newline at end of file
+from .exceptions import *
+from .bulk import *
+from .outbox import *
+from .archive import *
+from .pool import *
+from .tokens import *
+from .circuit import *
+from .mirror import *
+from .polling import *
+from .sync import *
+from .autocomplete import *
+from .transport import *
\ No newline at end of file
@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .utils import *
+from .exceptions import *
+
+
+class ArchiveReport:
+    """
+    Progress and outcome of an archive job. The same object is passed to the progress
+    callback after each item and returned at the end.
+
+    @param total:
+               The number of items to process, None if unknown
+    """
+    def __init__(self, total=None):
+        self.total = total
+        self.completed = 0
+        self.skipped = 0
+        self.failed = []
+        self.bytes = 0
+        self.started_at = time.time()
+        self.elapsed = 0.0
+
+    @property
+    def processed(self):
+        return self.completed + self.skipped + len(self.failed)
+
+    @property
+    def throughput(self):
+        return self.bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class _Manifest:
+    """
+    Files already exported to a directory, with their size and SHA-256 digest, persisted so an
+    interrupted job can be restarted without downloading them again. Each new entry is appended
+    to the manifest.json.log journal; close() merges the journal into manifest.json.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, 'manifest.json')
+        self.journal_path = self.path + '.log'
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path) as f:
+                for line in f:
+                    try:
+                        (key, entry) = json.loads(line)
+                    except ValueError:
+                        # the last line of a journal interrupted while written
+                        continue
+                    self.entries[key] = entry
+        self.journal = None
+
+    def is_exported(self, key, verify=False):
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return False
+        path = os.path.join(self.directory, entry['filename'])
+        if not os.path.isfile(path) or os.path.getsize(path) != entry['size']:
+            return False
+        return not verify or file_sha256(path) == entry['sha256']
+
+    def add(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            if self.journal is None:
+                self.journal = open(self.journal_path, 'a')
+            self.journal.write(json.dumps([key, entry], sort_keys=True) + '\n')
+            self.journal.flush()
+
+    def close(self):
+        with self.lock:
+            if self.journal is None and not os.path.exists(self.journal_path):
+                return
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+            part_path = self.path + '.part'
+            with open(part_path, 'w') as f:
+                json.dump(self.entries, f, indent=2, sort_keys=True)
+            os.replace(part_path, self.path)
+            os.remove(self.journal_path)
+
+
+def _run_bounded(workers, task, items, report, progress):
+    # items are (item, error) tuples, consumed lazily: at most two tasks per worker are queued at
+    # any time; an item given with an error is reported as failed without running the task
+    lock = threading.Lock()
+
+    def run(item, error):
+        outcome = None
+        if error is None:
+            try:
+                outcome = task(item)
+            except Exception as e:
+                error = e
+        with lock:
+            if error is not None:
+                report.failed.append((item, error))
+            elif outcome is None:
+                report.skipped += 1
+            else:
+                report.completed += 1
+                report.bytes += outcome
+            report.elapsed = time.time() - report.started_at
+            if progress is not None:
+                progress(report)
+
+    with ThreadPoolExecutor(workers) as executor:
+        pending = set()
+        for (item, error) in items:
+            if len(pending) >= workers * 2:
+                (done, pending) = wait(pending, return_when=FIRST_COMPLETED)
+            pending.add(executor.submit(run, item, error))
+    report.elapsed = time.time() - report.started_at
+    return report
+
+
+"""
+Exports the audit record pdf of every safebox to a directory, resolving the audit record urls
+and streaming the downloads on a pool of workers. Files already listed in the directory
+manifest (same size, and same SHA-256 when verify is True) are skipped.
+
+@param client:
+           A Client object
+@param safeboxes:
+           An iterable of Safebox objects
+@param directory:
+           The destination directory (created if needed); files are named <safebox guid>.pdf
+@param workers:
+           The number of concurrent downloads
+@param progress:
+           An optional callable receiving the ArchiveReport after each safebox
+@param verify:
+           Whether to check the SHA-256 of already exported files before skipping them
+@return: The ArchiveReport of the job; failed contains (safebox, exception) tuples
+"""
+def export_audit_records(client, safeboxes, directory, workers=4, progress=None, verify=False):
+    os.makedirs(directory, exist_ok=True)
+    manifest = _Manifest(directory)
+    report = ArchiveReport(len(safeboxes) if hasattr(safeboxes, '__len__') else None)
+
+    def export(safebox):
+        if safebox.guid is None:
+            raise SendSecureException(0, 'SafeBox GUID cannot be null', '')
+        if manifest.is_exported(safebox.guid, verify):
+            return None
+        filename = safebox.guid + '.pdf'
+        (size, checksum) = client.download_audit_record(safebox, os.path.join(directory, filename))
+        manifest.add(safebox.guid, { 'filename': filename, 'size': size, 'sha256': checksum })
+        return size
+
+    try:
+        return _run_bounded(workers, export, ((safebox, None) for safebox in safeboxes), report, progress)
+    finally:
+        manifest.close()
+
+
+def _iter_documents(client, safeboxes):
+    # yields ((safebox, document), error) tuples; documents shared by several messages are only
+    # downloaded once, a safebox whose messages cannot be listed is yielded with a None document
+    # and its error
+    for safebox in safeboxes:
+        try:
+            if safebox.guid is None:
+                raise SendSecureException(0, 'SafeBox GUID cannot be null', '')
+            seen = set()
+            for message in client.iter_safebox_messages(safebox):
+                for document in getattr(message, 'documents', None) or []:
+                    if document.guid not in seen:
+                        seen.add(document.guid)
+                        yield ((safebox, document), None)
+        except Exception as e:
+            yield ((safebox, None), e)
+
+
+def _document_filename(document):
+    name = os.path.basename(str(getattr(document, 'name', None) or '').replace('\\', '/'))
+    return '%s-%s' % (document.guid, name) if name else document.guid
+
+
+"""
+Downloads the documents of every safebox to a directory. Documents are enumerated from the
+messages of each safebox (a document attached to several messages is downloaded once), and
+their file urls are resolved and downloaded on a pool of workers. Files already listed in the
+directory manifest (same size, and same SHA-256 when verify is True) are skipped.
+
+@param client:
+           A Client object
+@param safeboxes:
+           An iterable of Safebox objects
+@param directory:
+           The destination directory (created if needed); files are named
+           <safebox guid>/<document guid>-<document name>
+@param workers:
+           The number of concurrent downloads
+@param progress:
+           An optional callable receiving the ArchiveReport after each document
+@param verify:
+           Whether to check the SHA-256 of already downloaded files before skipping them
+@return: The ArchiveReport of the job; failed contains ((safebox, document), exception) tuples,
+         document being None when the messages of the safebox could not be listed
+"""
+def download_documents(client, safeboxes, directory, workers=4, progress=None, verify=False):
+    os.makedirs(directory, exist_ok=True)
+    manifest = _Manifest(directory)
+    report = ArchiveReport()
+
+    def download(item):
+        (safebox, document) = item
+        key = '%s/%s' % (safebox.guid, document.guid)
+        if manifest.is_exported(key, verify):
+            return None
+        filename = os.path.join(safebox.guid, _document_filename(document))
+        path = os.path.join(directory, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # the pool already downloads many documents at once, each one is fetched by a single worker
+        (size, checksum) = client.download_document(safebox, document, path, max_workers=1)
+        manifest.add(key, { 'filename': filename, 'size': size, 'sha256': checksum })
+        return size
+
+    try:
+        return _run_bounded(workers, download, _iter_documents(client, safeboxes), report, progress)
+    finally:
+        manifest.close()
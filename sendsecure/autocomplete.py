@@ -0,0 +1,208 @@
+import time
+import bisect
+import threading
+from collections import OrderedDict
+
+
+class RecipientIndex:
+    """
+    RecipientIndex object constructor. A local recipient autocomplete index built from the
+    favorites of the current user and from the results of Client.search_recipient. Lookups are
+    answered from a sorted token list (bisect on the prefix) with a per-prefix result cache; the
+    search_recipient requests made by suggest() are debounced and never repeated within ttl seconds.
+
+    @param client:
+               The Client object used to retrieve the favorites and search the recipients
+    @param limit:
+               The default maximum number of recipients returned by a lookup
+    @param debounce:
+               The number of seconds without a new suggest() call before a search request is sent
+    @param ttl:
+               The number of seconds the search results of a term are considered current
+    @param cache_size:
+               The maximum number of prefixes whose results are cached
+    """
+    def __init__(self, client, limit=10, debounce=0.25, ttl=300, cache_size=1024):
+        self.client = client
+        self.limit = limit
+        self.debounce = debounce
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self._recipients = {}
+        self._tokens = []
+        self._cache = OrderedDict()
+        self._searched = {}
+        self._timer = None
+        self._stop_event = None
+        self._lock = threading.Lock()
+
+    """
+    Adds recipients to the index (a recipient with the email of a favorite does not replace it).
+
+    @param recipients:
+               A list of recipients, as the results of Client.search_recipient (dicts with email,
+               first_name, last_name, company_name, type and id)
+    """
+    def add(self, recipients):
+        with self._lock:
+            for recipient in recipients:
+                if not recipient.get('email'):
+                    continue
+                key = recipient['email'].lower()
+                current = self._recipients.get(key)
+                if current is None or current.get('type') != 'favorite' or recipient.get('type') == 'favorite':
+                    self._recipients[key] = dict(recipient)
+            self._rebuild()
+
+    """
+    Reloads the favorites of the current user into the index (favorites deleted since the
+    previous refresh are removed).
+    """
+    def refresh(self):
+        favorites = [_favorite_recipient(favorite) for favorite in self.client.get_favorites()]
+        with self._lock:
+            for key in [key for (key, recipient) in self._recipients.items() if recipient.get('type') == 'favorite']:
+                del self._recipients[key]
+        self.add(favorites)
+
+    """
+    Looks up the recipients whose email, names or company name start with a term, locally.
+
+    @param term:
+               The search term (case insensitive)
+    @param limit:
+               The maximum number of recipients returned (the index limit if None)
+    @return: A list of recipient dicts, favorites first then by email
+    """
+    def search(self, term, limit=None):
+        term = _normalize(term)
+        limit = self.limit if limit is None else limit
+        if not term:
+            return []
+        with self._lock:
+            keys = self._cache.get(term)
+            if keys is None:
+                keys = self._lookup(term)
+                self._cache[term] = keys
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            else:
+                self._cache.move_to_end(term)
+            return [dict(self._recipients[key]) for key in keys[:limit]]
+
+    """
+    Returns the local recipients matching a term at once and, when they are fewer than the limit
+    and the term was not searched within ttl seconds, schedules a debounced search request; its
+    results are added to the index and the new matches are given to the callback. Each call
+    cancels the request scheduled by the previous one (e.g. on every keystroke).
+
+    @param term:
+               The search term (case insensitive)
+    @param callback:
+               A callable receiving the term and the updated list of recipient dicts
+    @param limit:
+               The maximum number of recipients returned (the index limit if None)
+    @return: A list of recipient dicts
+    """
+    def suggest(self, term, callback=None, limit=None):
+        results = self.search(term, limit)
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            normalized = _normalize(term)
+            searched_at = self._searched.get(normalized)
+            if normalized and len(results) < (self.limit if limit is None else limit) and \
+               (searched_at is None or time.monotonic() - searched_at > self.ttl):
+                self._timer = threading.Timer(self.debounce, self._search_remote, (term, callback, limit))
+                self._timer.daemon = True
+                self._timer.start()
+        return results
+
+    """
+    Starts refreshing the favorites in a background thread.
+
+    @param interval:
+               The number of seconds between two refreshes
+    """
+    def start(self, interval=300):
+        with self._lock:
+            if self._stop_event is not None:
+                return
+            self._stop_event = threading.Event()
+        thread = threading.Thread(target=self._refresh_loop, args=(interval, self._stop_event))
+        thread.daemon = True
+        thread.start()
+
+    """
+    Stops the background refresh and cancels the scheduled search request.
+    """
+    def stop(self):
+        with self._lock:
+            if self._stop_event is not None:
+                self._stop_event.set()
+                self._stop_event = None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _refresh_loop(self, interval, stop_event):
+        while not stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                # the index keeps its previous favorites until the next refresh
+                pass
+            stop_event.wait(interval)
+
+    def _search_remote(self, term, callback, limit):
+        try:
+            result = self.client.search_recipient(term)
+        except Exception:
+            # the local results were already returned
+            return
+        with self._lock:
+            self._searched[_normalize(term)] = time.monotonic()
+        self.add(result.get('results') or [])
+        if callback is not None:
+            callback(term, self.search(term, limit))
+
+    def _lookup(self, term):
+        index = bisect.bisect_left(self._tokens, (term,))
+        keys = set()
+        while index < len(self._tokens) and self._tokens[index][0].startswith(term):
+            keys.add(self._tokens[index][1])
+            index += 1
+        return sorted(keys, key=lambda key: (self._recipients[key].get('type') != 'favorite', key))
+
+    def _rebuild(self):
+        tokens = set()
+        for (key, recipient) in self._recipients.items():
+            for token in _tokens(recipient):
+                tokens.add((token, key))
+        self._tokens = sorted(tokens)
+        self._cache.clear()
+
+
+def _normalize(term):
+    return ' '.join((term or '').lower().split())
+
+
+def _tokens(recipient):
+    names = [_normalize(recipient.get(name)) for name in ('first_name', 'last_name', 'company_name')]
+    tokens = set([recipient['email'].lower(), _normalize(names[0] + ' ' + names[1])])
+    for name in names:
+        if name:
+            tokens.add(name)
+            tokens.update(name.split())
+    tokens.discard('')
+    return tokens
+
+
+def _favorite_recipient(favorite):
+    return { 'id': getattr(favorite, 'id', None),
+             'type': 'favorite',
+             'email': favorite.email,
+             'first_name': favorite.first_name or '',
+             'last_name': favorite.last_name or '',
+             'company_name': favorite.company_name or '' }
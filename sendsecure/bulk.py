@@ -0,0 +1,188 @@
+import threading
+from queue import Queue
+from concurrent.futures import ThreadPoolExecutor
+from .exceptions import *
+
+
+class BulkResult:
+    """
+    BulkResult object constructor.
+
+    @param index:
+               The position of the item in the submitted sequence
+    @param item:
+               The submitted item (updated in place when the operation succeeded)
+    @param error:
+               The exception raised while processing the item, None if it succeeded
+    """
+    def __init__(self, index, item, error=None):
+        self.index = index
+        self.item = item
+        self.error = error
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+
+"""
+Calls function with each item, on a pool of workers. A failing item does not stop the others.
+
+@param function:
+           A callable receiving an item
+@param items:
+           A list of items, or of BulkResult objects already failed (e.g. by a local validation)
+@param workers:
+           The maximum number of concurrent calls
+@return: A list of BulkResult objects, in the order of the items
+"""
+def run_bulk(function, items, workers=4):
+    def run(index, item):
+        if isinstance(item, BulkResult):
+            return item
+        try:
+            function(item)
+        except Exception as e:
+            return BulkResult(index, item, e)
+        return BulkResult(index, item)
+
+    with ThreadPoolExecutor(workers) as executor:
+        return list(executor.map(run, range(len(items)), items))
+
+
+class _Stages:
+    def __init__(self, initializer, uploader, committer):
+        self.initializer = initializer
+        self.uploader = uploader
+        self.committer = committer
+        self.results = Queue()
+
+
+class _SafeboxJob:
+    def __init__(self, index, safebox):
+        self.index = index
+        self.safebox = safebox
+        self.remaining_uploads = 0
+        self.error = None
+        self.lock = threading.Lock()
+
+
+class BulkSubmitter:
+    """
+    BulkSubmitter object constructor. Submits many safeboxes through a pipeline where the
+    initialization, attachment upload and commit stages of different safeboxes overlap.
+
+    @param client:
+               The Client object used to submit the safeboxes
+    @param initialize_workers:
+               The maximum number of concurrent safebox initializations
+    @param upload_workers:
+               The maximum number of concurrent attachment uploads
+    @param commit_workers:
+               The maximum number of concurrent safebox commits (including default security profile lookups)
+    @param max_pending:
+               The maximum number of safeboxes in flight whose result has not been consumed yet
+    """
+    def __init__(self, client, initialize_workers=4, upload_workers=8, commit_workers=4, max_pending=32):
+        self.client = client
+        self.initialize_workers = initialize_workers
+        self.upload_workers = upload_workers
+        self.commit_workers = commit_workers
+        self.max_pending = max_pending
+        self._security_profile_ids = {}
+        self._security_profiles_lock = threading.Lock()
+
+    """
+    Submits the safeboxes (initialize, upload attachments and commit, as Client.submit_safebox does).
+    The safeboxes are read lazily: a new safebox only enters the pipeline when fewer than
+    max_pending results are waiting to be consumed.
+
+    @param safeboxes:
+               An iterable of non-initialized Safebox objects
+    @return: A generator of BulkResult objects, in completion order
+    """
+    def submit(self, safeboxes):
+        with ThreadPoolExecutor(self.initialize_workers) as initializer, \
+             ThreadPoolExecutor(self.upload_workers) as uploader, \
+             ThreadPoolExecutor(self.commit_workers) as committer:
+            stages = _Stages(initializer, uploader, committer)
+            in_flight = 0
+            for index, safebox in enumerate(safeboxes):
+                while in_flight >= self.max_pending:
+                    yield stages.results.get()
+                    in_flight -= 1
+                job = _SafeboxJob(index, safebox)
+                error = self._schedule(stages, initializer, self._initialize, job)
+                if error is not None:
+                    self._finish(stages, job, error)
+                in_flight += 1
+            while in_flight:
+                yield stages.results.get()
+                in_flight -= 1
+
+    def _schedule(self, stages, executor, stage, job, *args):
+        try:
+            executor.submit(stage, stages, job, *args)
+        except RuntimeError as e:
+            # the executors are shut down when the consumer stops iterating
+            return e
+        return None
+
+    def _finish(self, stages, job, error=None):
+        stages.results.put(BulkResult(job.index, job.safebox, error))
+
+    def _initialize(self, stages, job):
+        try:
+            self.client.initialize_safebox(job.safebox)
+        except Exception as e:
+            return self._finish(stages, job, e)
+        attachments = list(job.safebox.attachments)
+        if not attachments:
+            return self._commit_later(stages, job)
+        job.remaining_uploads = len(attachments)
+        for attachment in attachments:
+            error = self._schedule(stages, stages.uploader, self._upload, job, attachment)
+            if error is not None:
+                self._uploaded(stages, job, error)
+
+    def _upload(self, stages, job, attachment):
+        error = None
+        try:
+            self.client.upload_attachment(job.safebox, attachment)
+        except Exception as e:
+            error = e
+        self._uploaded(stages, job, error)
+
+    def _uploaded(self, stages, job, error):
+        with job.lock:
+            if error is not None and job.error is None:
+                job.error = error
+            job.remaining_uploads -= 1
+            if job.remaining_uploads:
+                return
+        if job.error is not None:
+            return self._finish(stages, job, job.error)
+        self._commit_later(stages, job)
+
+    def _commit_later(self, stages, job):
+        error = self._schedule(stages, stages.committer, self._commit, job)
+        if error is not None:
+            self._finish(stages, job, error)
+
+    def _commit(self, stages, job):
+        try:
+            if job.safebox.security_profile_id is None:
+                job.safebox.security_profile_id = self._get_default_security_profile_id(job.safebox.user_email)
+            self.client.commit_safebox(job.safebox)
+        except Exception as e:
+            return self._finish(stages, job, e)
+        self._finish(stages, job)
+
+    def _get_default_security_profile_id(self, user_email):
+        with self._security_profiles_lock:
+            if user_email not in self._security_profile_ids:
+                security_profile = self.client.get_default_security_profile(user_email)
+                if security_profile is None:
+                    raise SendSecureException(0, 'No Security Profile configured', '')
+                self._security_profile_ids[user_email] = security_profile.id
+            return self._security_profile_ids[user_email]
@@ -0,0 +1,138 @@
+import time
+import threading
+from collections import deque
+from . import utils
+from .exceptions import *
+
+
+class _HostCircuit:
+    def __init__(self):
+        self.state = CircuitBreaker.CLOSED
+        self.outcomes = deque()
+        self.opened_at = None
+        self.probes = 0
+        self.probe_successes = 0
+
+
+class CircuitBreaker:
+    """
+    CircuitBreaker object constructor. Tracks the outcome of the requests sent to each host and
+    stops sending requests to a host whose failure rate is too high: the circuit of the host
+    opens and requests fail immediately with CircuitOpenException. After reset_timeout, a few
+    probe requests are let through (half-open); the circuit closes again if they all succeed.
+    Connection errors, timeouts and 5xx responses count as failures.
+
+    @param failure_rate:
+               The failure rate (between 0 and 1) over the window above which the circuit opens
+    @param minimum_requests:
+               The minimum number of requests in the window before the failure rate is considered
+    @param window:
+               The number of seconds over which the failure rate is computed
+    @param reset_timeout:
+               The number of seconds a circuit stays open before letting probe requests through
+    @param probe_requests:
+               The number of successful probe requests needed to close a half-open circuit
+    @param on_state_change:
+               An optional callable receiving the host, the previous state and the new state of a circuit
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_rate=0.5, minimum_requests=10, window=30, reset_timeout=30, probe_requests=1,
+                 on_state_change=None):
+        self.failure_rate = failure_rate
+        self.minimum_requests = minimum_requests
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.probe_requests = probe_requests
+        self.on_state_change = on_state_change
+        self._circuits = {}
+        self._lock = threading.Lock()
+        utils._register_at_fork(self)
+
+    """
+    Returns the state of the circuit of a host (closed, open or half_open).
+    """
+    def state(self, host):
+        with self._lock:
+            circuit = self._circuits.get(host)
+            return circuit.state if circuit else CircuitBreaker.CLOSED
+
+    """
+    Returns the state of the circuit of every host a request was sent to.
+    """
+    def states(self):
+        with self._lock:
+            return dict((host, circuit.state) for (host, circuit) in self._circuits.items())
+
+    """
+    Checks that a request can be sent to a host, raising CircuitOpenException otherwise.
+    Every allowed request must be followed by a call to record_success or record_failure.
+    """
+    def before_request(self, host):
+        changes = []
+        with self._lock:
+            circuit = self._circuits.setdefault(host, _HostCircuit())
+            if circuit.state == CircuitBreaker.OPEN:
+                if time.monotonic() - circuit.opened_at < self.reset_timeout:
+                    raise CircuitOpenException(0, 'Circuit open for ' + host, '')
+                self._set_state(host, circuit, CircuitBreaker.HALF_OPEN, changes)
+            if circuit.state == CircuitBreaker.HALF_OPEN:
+                if circuit.probes >= self.probe_requests:
+                    raise CircuitOpenException(0, 'Circuit half-open for ' + host, '')
+                circuit.probes += 1
+        self._notify(changes)
+
+    def record_success(self, host):
+        self._record(host, True)
+
+    def record_failure(self, host):
+        self._record(host, False)
+
+    def _record(self, host, succeeded):
+        changes = []
+        now = time.monotonic()
+        with self._lock:
+            circuit = self._circuits.setdefault(host, _HostCircuit())
+            if circuit.state == CircuitBreaker.HALF_OPEN:
+                circuit.probes = max(circuit.probes - 1, 0)
+                if not succeeded:
+                    self._open(host, circuit, now, changes)
+                else:
+                    circuit.probe_successes += 1
+                    if circuit.probe_successes >= self.probe_requests:
+                        circuit.outcomes.clear()
+                        self._set_state(host, circuit, CircuitBreaker.CLOSED, changes)
+            elif circuit.state == CircuitBreaker.CLOSED:
+                circuit.outcomes.append((now, succeeded))
+                while circuit.outcomes[0][0] < now - self.window:
+                    circuit.outcomes.popleft()
+                failures = sum(1 for (_, ok) in circuit.outcomes if not ok)
+                if len(circuit.outcomes) >= self.minimum_requests and failures > self.failure_rate * len(circuit.outcomes):
+                    self._open(host, circuit, now, changes)
+        self._notify(changes)
+
+    def _after_fork(self):
+        # the lock may have been held by another thread of the parent, whose probe requests
+        # are never recorded in the child
+        self._lock = threading.Lock()
+        for circuit in self._circuits.values():
+            circuit.probes = 0
+
+    def _open(self, host, circuit, now, changes):
+        circuit.opened_at = now
+        circuit.outcomes.clear()
+        self._set_state(host, circuit, CircuitBreaker.OPEN, changes)
+
+    def _set_state(self, host, circuit, state, changes):
+        changes.append((host, circuit.state, state))
+        circuit.state = state
+        circuit.probes = 0
+        circuit.probe_successes = 0
+
+    def _notify(self, changes):
+        # called outside of the lock so the callback can query the breaker
+        if self.on_state_change is not None:
+            for change in changes:
+                self.on_state_change(*change)
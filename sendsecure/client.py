@@ -3,6 +3,9 @@ from .utils import *
 from .helpers import *
 from .exceptions import *
 from .json_client import *
+from .bulk import *
+from .sync import *
+from . import archive
 
 
 class Client:
@@ -63,7 +66,7 @@ class Client:
             raise UnexpectedServerResponseException(500, 'Unexpected Error', '')
 
     """
-    Client object constructor.
+    Client object constructor. A Client can be shared by threads and by forked processes (see JsonClient).
 
     @param api_token:
                The API Token to be used for authentication with the SendSecure service
@@ -75,9 +78,33 @@ class Client:
                The URL to the SendSecure service ("https://portal.xmedius.com" will be used by default if empty)
     @param locale:
                The locale in which the server errors will be returned ("en" will be used by default if empty)
+    @param lazy_hydration:
+               When True, nested objects of listed safeboxes, participants, messages and favorites are only
+               built on first access (False will be used by default if empty)
+    @param timeout:
+               The connect and read timeout of each request in seconds (unlimited if empty)
+    @param circuit_breaker:
+               A CircuitBreaker (possibly shared with other clients) guarding the requests to each host
+    @param transport:
+               The transport sending the requests: a transport object (UrllibTransport, ConnectionPool,
+               Urllib3Transport...) or its name (urllib, pooled, urllib3, http2 or best); a UrllibTransport
+               by default. The transports created by the client are closed by close()
     """
     def __init__(self, options):
         self.json_client = JsonClient(options)
+        self.lazy_hydration = options.get('lazy_hydration', False)
+
+    """
+    Closes the transport created by the client (see JsonClient.close).
+    """
+    def close(self):
+        self.json_client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
     """
     Retrieves all the current enterprise account's settings specific to a SendSecure Account
@@ -181,6 +208,31 @@ class Client:
             safebox.security_profile_id = self.get_default_security_profile(safebox.user_email).id
         return self.commit_safebox(safebox)
 
+    """
+    Sets a deadline for all the requests made by the current thread within the block, so that a
+    composite operation (e.g. submit_safebox) fails with DeadlineExceededException instead of
+    exceeding its time budget. Nested deadlines cannot extend the enclosing one.
+
+    @param deadline:
+                A number of seconds or a Deadline object
+    @return: A context manager
+    """
+    def deadline(self, deadline):
+        return self.json_client.deadline(deadline)
+
+    """
+    High-level combo that submits many SafeBoxes, overlapping the initialization, upload and commit
+    stages of different SafeBoxes (see BulkSubmitter).
+
+    @param safeboxes:
+                An iterable of non-initialized Safebox objects
+    @param options:
+                Optional BulkSubmitter parameters (initialize_workers, upload_workers, commit_workers, max_pending)
+    @return: A generator of BulkResult objects, in completion order
+    """
+    def submit_safeboxes(self, safeboxes, **options):
+        return BulkSubmitter(self, **options).submit(safeboxes)
+
     """
     Retrieves all the current user account's settings specific to SendSecure Account
 
@@ -198,7 +250,8 @@ class Client:
     def get_favorites(self):
         json_result = self.json_client.get_favorites()
         result = json.loads(json_result)
-        return [Favorite(params=favorite_params) for favorite_params in result['favorites']]
+        return [Favorite(params=favorite_params, lazy=self.lazy_hydration)._mark_clean(favorite_params)
+                for favorite_params in result['favorites']]
 
     """
     Create a new favorite associated to a specific user.
@@ -223,7 +276,7 @@ class Client:
     def update_favorite(self, favorite):
         if favorite.id is None:
             raise SendSecureException(0, 'Favorite id cannot be null', '')
-        result = self.json_client.update_favorite(favorite.id, favorite.to_json())
+        result = self.json_client.update_favorite(favorite.id, favorite.to_patch_json())
         return favorite.update_attributes(result)
 
     """
@@ -239,7 +292,7 @@ class Client:
         if favorite.id is None:
             raise SendSecureException(0, 'Favorite id cannot be null', '')
         favorite.prepare_to_destroy_contact(contact_method_ids)
-        result = self.json_client.update_favorite(favorite.id, favorite.to_json())
+        result = self.json_client.update_favorite(favorite.id, favorite.to_patch_json())
         return favorite.update_attributes(result)
 
     """
@@ -252,6 +305,21 @@ class Client:
     def delete_favorite(self, favorite):
         self.json_client.delete_favorite(favorite.id)
 
+    """
+    High-level combo that makes the favorites of the current user match a desired address book,
+    only creating, updating and deleting the favorites that differ (see FavoriteSynchronizer).
+
+    @param desired:
+                An iterable of Favorite objects, matched with the existing favorites by email
+    @param dry_run:
+                Whether the actions are only planned and reported, without any change
+    @param options:
+                Optional FavoriteSynchronizer parameters (workers, max_requests_per_second, delete_missing)
+    @return: A FavoriteSyncReport object
+    """
+    def sync_favorites(self, desired, dry_run=False, **options):
+        return FavoriteSynchronizer(self, **options).sync(desired, dry_run)
+
     """
     Create a new participant for a specific safebox associated to the current user's account,
     and add the new participant to the Safebox object.
@@ -272,6 +340,80 @@ class Client:
         safebox.participants.append(participant)
         return participant
 
+    """
+    Create many participants for a specific safebox associated to the current user's account, with
+    bounded concurrency. The participants are validated locally first (email present and not already
+    in the safebox or in the batch); a failing participant does not stop the others. The created
+    participants are added to the Safebox object in the order of the input.
+
+    @param safebox:
+                A Safebox object
+    @param participants:
+                An iterable of Participant objects
+    @param workers:
+                The maximum number of concurrent requests
+    @return: A list of BulkResult objects, in the order of the participants
+    """
+    def bulk_create_participants(self, safebox, participants, workers=4):
+        if safebox.guid is None:
+            raise SendSecureException(0, 'SafeBox GUID cannot be null', '')
+        emails = set(participant.email.lower() for participant in safebox.participants if participant.email)
+        items = []
+        for (index, participant) in enumerate(participants):
+            if participant.email is None:
+                items.append(BulkResult(index, participant, SendSecureException(0, 'Participant email cannot be null', '')))
+            elif participant.email.lower() in emails:
+                items.append(BulkResult(index, participant, SendSecureException(0, 'Participant email already in the safebox', '')))
+            else:
+                emails.add(participant.email.lower())
+                items.append(participant)
+
+        def create(participant):
+            result = self.json_client.create_participant(safebox.guid, participant.to_json())
+            participant.update_attributes(result)
+
+        results = run_bulk(create, items, workers)
+        safebox.participants.extend(result.item for result in results if result.succeeded)
+        return results
+
+    """
+    Update many participants of a specific safebox associated to the current user's account, with
+    bounded concurrency (only the changed fields of each participant are sent). The participants are
+    validated locally first (id present and unique in the batch); a failing participant does not stop
+    the others. The participants of the Safebox object with the same id are replaced by the updated ones.
+
+    @param safebox:
+                A Safebox object
+    @param participants:
+                An iterable of Participant objects
+    @param workers:
+                The maximum number of concurrent requests
+    @return: A list of BulkResult objects, in the order of the participants
+    """
+    def bulk_update_participants(self, safebox, participants, workers=4):
+        if safebox.guid is None:
+            raise SendSecureException(0, 'SafeBox GUID cannot be null', '')
+        ids = set()
+        items = []
+        for (index, participant) in enumerate(participants):
+            if getattr(participant, 'id', None) is None:
+                items.append(BulkResult(index, participant, SendSecureException(0, 'Participant id cannot be null', '')))
+            elif participant.id in ids:
+                items.append(BulkResult(index, participant, SendSecureException(0, 'Participant updated twice in the batch', '')))
+            else:
+                ids.add(participant.id)
+                items.append(participant)
+
+        def update(participant):
+            result = self.json_client.update_participant(safebox.guid, participant.id, participant.to_patch_json())
+            participant.update_attributes(result)
+
+        results = run_bulk(update, items, workers)
+        updated = dict((result.item.id, result.item) for result in results if result.succeeded)
+        safebox.participants[:] = [updated.get(getattr(participant, 'id', None), participant)
+                                   for participant in safebox.participants]
+        return results
+
     """
     Update an existing participant of a specific safebox associated to the current user's account.
 
@@ -286,7 +428,7 @@ class Client:
             raise SendSecureException(0, 'SafeBox GUID cannot be null', '')
         if participant.id is None:
             raise SendSecureException(0, 'Participant id cannot be null', '')
-        result = self.json_client.update_participant(safebox.guid, participant.id, participant.to_json())
+        result = self.json_client.update_participant(safebox.guid, participant.id, participant.to_patch_json())
         return participant.update_attributes(result)
 
     """
@@ -306,7 +448,7 @@ class Client:
         if participant.id is None:
             raise SendSecureException(0, 'Participant id cannot be null', '')
         participant.prepare_to_destroy_contact(contact_method_ids)
-        result = self.json_client.update_participant(safebox.guid, participant.id, participant.to_json())
+        result = self.json_client.update_participant(safebox.guid, participant.id, participant.to_patch_json())
         return participant.update_attributes(result)
 
     """
@@ -458,6 +600,32 @@ class Client:
         result = json.loads(json_result)
         return result['url']
 
+    """
+    Download a specific document of a specific safebox associated to the current user's account.
+    When dest is a file path and the file server supports Range requests, a large document is
+    split in parts downloaded concurrently into a pre-allocated file; an interrupted part is
+    resumed from its last received byte. The requests use the timeout, deadline and circuit
+    breaker of the client.
+
+    @param safebox:
+                A Safebox object
+    @param document:
+                An Attachment or Document object
+    @param dest:
+                A file path, a writable binary file object or a callable receiving each chunk of bytes
+    @param max_workers:
+                The maximum number of concurrent ranged requests
+    @param part_size:
+                The size of each ranged request, documents smaller than this are downloaded in one request
+    @param retries:
+                The number of times an interrupted part is resumed before giving up
+    @return: A tuple of the number of bytes written and their SHA-256 hex digest
+    """
+    def download_document(self, safebox, document, dest, max_workers=4, part_size=8388608, retries=3):
+        url = self.get_file_url(safebox, document)
+        return http_download(url, dest, max_workers, part_size, retries=retries,
+                             open_stream=self.json_client.get_file_stream_opener())
+
     """
     Retrieve the audit record url of a specific safebox associated to the current user's account.
 
@@ -485,6 +653,65 @@ class Client:
         url = self.get_audit_record_url(safebox)
         return self.json_client.get_audit_record_pdf(url)
 
+    """
+    Download the audit record pdf of a specific safebox associated to the current user's account,
+    copying the response in chunks so the whole file is never held in memory.
+
+    @param safebox:
+                A Safebox object
+    @param dest:
+                A file path, a writable binary file object or a callable receiving each chunk of bytes
+    @param chunk_size:
+                The size of the chunks read from the response
+    @return: A tuple of the number of bytes written and their SHA-256 hex digest
+    """
+    def download_audit_record(self, safebox, dest, chunk_size=65536):
+        if safebox.guid is None:
+            raise SendSecureException(0, 'SafeBox GUID cannot be null', '')
+        url = self.get_audit_record_url(safebox)
+        with self.json_client.get_audit_record_pdf_stream(url) as stream:
+            return copy_stream(stream, dest, chunk_size)
+
+    """
+    Export the audit record pdf of many safeboxes to a directory, on a pool of workers.
+    Files already exported (according to the manifest.json of the directory) are skipped.
+
+    @param safeboxes:
+                An iterable of Safebox objects
+    @param directory:
+                The destination directory; files are named <safebox guid>.pdf
+    @param workers:
+                The number of concurrent downloads
+    @param progress:
+                An optional callable receiving the ArchiveReport after each safebox
+    @param verify:
+                Whether to check the SHA-256 of already exported files before skipping them
+    @return: An ArchiveReport (completed, skipped, failed, bytes, elapsed, throughput)
+    """
+    def export_audit_records(self, safeboxes, directory, workers=4, progress=None, verify=False):
+        return archive.export_audit_records(self, safeboxes, directory, workers, progress, verify)
+
+    """
+    Download all the documents of many safeboxes to a directory, on a pool of workers.
+    Documents are enumerated from the messages of each safebox and downloaded once even when
+    attached to several messages. Files already downloaded (according to the manifest.json of
+    the directory) are skipped.
+
+    @param safeboxes:
+                An iterable of Safebox objects
+    @param directory:
+                The destination directory; files are named <safebox guid>/<document guid>-<document name>
+    @param workers:
+                The number of concurrent downloads
+    @param progress:
+                An optional callable receiving the ArchiveReport after each document
+    @param verify:
+                Whether to check the SHA-256 of already downloaded files before skipping them
+    @return: An ArchiveReport (completed, skipped, failed, bytes, elapsed, throughput)
+    """
+    def download_safebox_documents(self, safeboxes, directory, workers=4, progress=None, verify=False):
+        return archive.download_documents(self, safeboxes, directory, workers, progress, verify)
+
     """
     Retrieve a filtered list of safeboxes for the current user account.
 
@@ -498,9 +725,25 @@ class Client:
     def get_safeboxes(self, url=None, search_params={}):
         json_result = self.json_client.get_safeboxes(url, search_params)
         result = json.loads(json_result)
-        result['safeboxes'] = [Safebox(params=safebox_params['safebox']) for safebox_params in result['safeboxes']]
+        result['safeboxes'] = [Safebox(params=safebox_params['safebox'], lazy=self.lazy_hydration) for safebox_params in result['safeboxes']]
         return result
 
+    """
+    Iterate over a filtered list of safeboxes for the current user account. The response is
+    parsed incrementally and each Safebox is built only when reached, so memory stays bounded
+    regardless of the page size.
+
+    @param url:
+               The search url (optional)
+    @param params:
+               optional filtering parameters (see get_safeboxes)
+    @return: A generator of Safebox objects
+    """
+    def iter_safeboxes(self, url=None, search_params={}):
+        with self.json_client.get_safeboxes_stream(url, search_params) as stream:
+            for safebox_params in iter_json_array(stream, 'safeboxes'):
+                yield Safebox(params=safebox_params['safebox'], lazy=self.lazy_hydration)
+
     """
     Retrieve a specific Safebox by its guid.
 
@@ -542,7 +785,8 @@ class Client:
             raise SendSecureException(0, 'SafeBox GUID cannot be null', '')
         json_result = self.json_client.get_safebox_participants(safebox.guid)
         result = json.loads(json_result)
-        return [Participant(params=participant_params) for participant_params in result['participants']]
+        return [Participant(params=participant_params, lazy=self.lazy_hydration)._mark_clean(participant_params)
+                for participant_params in result['participants']]
 
     """
     Retrieve all messages info of an existing safebox for the current user account.
@@ -556,7 +800,22 @@ class Client:
             raise SendSecureException(0, 'SafeBox GUID cannot be null', '')
         json_result = self.json_client.get_safebox_messages(safebox.guid)
         result = json.loads(json_result)
-        return [Message(message_params) for message_params in result['messages']]
+        return [Message(message_params, self.lazy_hydration) for message_params in result['messages']]
+
+    """
+    Iterate over all messages of an existing safebox for the current user account, parsing
+    the response incrementally.
+
+    @param safebox:
+                A Safebox object
+    @return: A generator of Message objects
+    """
+    def iter_safebox_messages(self, safebox):
+        if safebox.guid is None:
+            raise SendSecureException(0, 'SafeBox GUID cannot be null', '')
+        with self.json_client.get_safebox_messages_stream(safebox.guid) as stream:
+            for message_params in iter_json_array(stream, 'messages'):
+                yield Message(message_params, self.lazy_hydration)
 
     """
     Retrieve all the security options of an existing safebox for the current user account.
@@ -600,6 +859,21 @@ class Client:
         result = json.loads(json_result)
         return [EventHistory(event_history_params) for event_history_params in result['event_history']]
 
+    """
+    Iterate over the event history of an existing safebox for the current user account, parsing
+    the response incrementally.
+
+    @param safebox:
+                A Safebox object
+    @return: A generator of EventHistory objects
+    """
+    def iter_safebox_event_history(self, safebox):
+        if safebox.guid is None:
+            raise SendSecureException(0, 'SafeBox GUID cannot be null', '')
+        with self.json_client.get_safebox_event_history_stream(safebox.guid) as stream:
+            for event_history_params in iter_json_array(stream, 'event_history'):
+                yield EventHistory(event_history_params)
+
     """
     Archive a specific safebox.
 
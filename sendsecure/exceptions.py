@@ -9,3 +9,15 @@ class SendSecureException(Exception):
 class UnexpectedServerResponseException(SendSecureException):
     def __init__(self, code, message, details):
         SendSecureException.__init__(self, code, message, details)
+
+class RequestTimeoutException(SendSecureException):
+    def __init__(self, code, message, details):
+        SendSecureException.__init__(self, code, message, details)
+
+class DeadlineExceededException(RequestTimeoutException):
+    def __init__(self, code, message, details):
+        RequestTimeoutException.__init__(self, code, message, details)
+
+class CircuitOpenException(SendSecureException):
+    def __init__(self, code, message, details):
+        SendSecureException.__init__(self, code, message, details)
@@ -1,33 +1,97 @@
+import copy
 import json
 from .exceptions import *
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_fast_json = None
+_serialization_plans = {}
+
+
+"""
+Use orjson (when installed) instead of the standard json module to serialize the helper objects.
+The produced json is equivalent but more compact.
+
+@param enabled:
+           Whether the fast backend should be used
+@return: True if the fast backend is in use
+"""
+def enable_fast_json(enabled=True):
+    global _fast_json
+    _fast_json = orjson if enabled else None
+    return _fast_json is not None
+
+
+def _dumps(obj, sort_keys=True):
+    if _fast_json is not None:
+        return _fast_json.dumps(obj, option=_fast_json.OPT_SORT_KEYS if sort_keys else 0).decode('utf-8')
+    return json.dumps(obj, sort_keys=sort_keys)
+
 class _Enum:
     def __init__(self, values):
         for item in values.items():
             self.__dict__[item[0]] = item[1]
 
 
+def _get_id(value):
+    if isinstance(value, JSONable):
+        return value.__dict__.get('id')
+    if isinstance(value, dict):
+        return value.get('id')
+    return None
+
+
 class JSONable:
-    def __init__(self, params):
+    # whether the object remembers its last known server state (see to_patch_dict)
+    _tracks_changes = False
+
+    def __init__(self, params, lazy=False):
 
         if self._is_json(params):
             params = json.loads(params)
 
         self.__dict__.update(params)
 
-        for key, value in self.__dict__.items():
-            if type(value) is list:
-                new_value = []
-                for v in value:
-                    o = self._to_object(key, v)
-                    new_value.append(o if o is not None else v)
-                value = new_value
+        lazy_values = {}
+        for key, value in list(self.__dict__.items()):
+            if lazy and value and isinstance(value, (dict, list)):
+                # nested structures are kept raw until first accessed (see __getattr__)
+                lazy_values[key] = value
+                del self.__dict__[key]
             else:
-                o = self._to_object(key, value)
-                if o is not None:
-                    value = o
-
-            self.__dict__[key] = value
+                self.__dict__[key] = self._hydrate_value(key, value)
+
+        if lazy_values:
+            self.__dict__['_lazy_values'] = lazy_values
+
+    def __getattr__(self, name):
+        lazy_values = self.__dict__.get('_lazy_values')
+        if lazy_values is None or name not in lazy_values:
+            raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+        value = self._hydrate_value(name, lazy_values.pop(name))
+        if not lazy_values:
+            del self.__dict__['_lazy_values']
+        self.__dict__[name] = value
+        return value
+
+    def _hydrate_value(self, key, value):
+        if type(value) is list:
+            new_value = []
+            for v in value:
+                o = self._to_object(key, v)
+                new_value.append(o if o is not None else v)
+            return new_value
+        o = self._to_object(key, value)
+        return value if o is None else o
+
+    def _hydrate(self):
+        lazy_values = self.__dict__.pop('_lazy_values', None)
+        if lazy_values:
+            for key, value in lazy_values.items():
+                self.__dict__[key] = self._hydrate_value(key, value)
 
     def _is_json(self, params):
         try:
@@ -42,7 +106,12 @@ class JSONable:
     def _update_old_attribute(self, key, value, old_value):
         if old_value is None:
             new_value = self._to_object(key, value)
-            return value if new_value is None else new_value
+            if new_value is None:
+                return value
+            if new_value._tracks_changes:
+                # built from a server response
+                new_value._mark_clean()
+            return new_value
         elif isinstance(old_value, JSONable):
             return old_value.update_attributes(value)
         else:
@@ -52,55 +121,186 @@ class JSONable:
         if self._is_json(params):
             params = json.loads(params)
 
+        self._hydrate()
         for key, value in params.items():
             old_value = self.__dict__[key] if key in self.__dict__ else None
             if type(value) is list:
                 if old_value is None:
                     old_value = []
-                for i in range(len(value)):
-                    if len(old_value) - 1 < i:
-                        old_value.append(None)
-                    old_value[i] = self._update_old_attribute(key, value[i], old_value[i])
+                old_value[:] = self._merge_list(key, value, old_value)
             else:
                 old_value = self._update_old_attribute(key, value, old_value)
 
             self.__dict__[key] = old_value
 
+        if self._tracks_changes:
+            self._mark_clean()
         return self
 
+    def _merge_list(self, key, values, old_values):
+        # elements are matched by id when they have one, by position otherwise;
+        # unmatched old elements are kept at the end, in their original order
+        indexes = {}
+        for i, old in enumerate(old_values):
+            old_id = _get_id(old)
+            if old_id is not None and old_id not in indexes:
+                indexes[old_id] = i
+
+        merged = []
+        used = set()
+        for i, value in enumerate(values):
+            index = indexes.get(_get_id(value))
+            if index is None and i < len(old_values) and _get_id(old_values[i]) is None:
+                index = i
+            old = None
+            if index is not None and index not in used:
+                used.add(index)
+                old = old_values[index]
+            merged.append(self._update_old_attribute(key, value, old))
+
+        merged.extend(old for (i, old) in enumerate(old_values) if i not in used)
+        return merged
+
     def _get_ignored_keys(self):
         keys = (
             'created_at',
-            'updated_at'
+            'updated_at',
+            '_snapshot'
         )
         return keys
 
     def _get_sendable_keys(self):
         return None
 
+    def _get_serialization_plan(self):
+        # sendable and ignored keys are constant per class, so they are computed only once
+        plan = _serialization_plans.get(type(self))
+        if plan is None:
+            ignored_keys = frozenset(self._get_ignored_keys())
+            sendable_keys = self._get_sendable_keys()
+            if sendable_keys is not None:
+                sendable_keys = tuple(key for key in sendable_keys if key not in ignored_keys)
+            plan = (sendable_keys, ignored_keys)
+            _serialization_plans[type(self)] = plan
+        return plan
+
     def to_dict(self):
+        self._hydrate()
         content = {}
+        attributes = self.__dict__
 
-        if self._get_sendable_keys() is None:
-            keys = self.__dict__.keys()
-        else:
-            keys = self._get_sendable_keys()
+        (keys, ignored_keys) = self._get_serialization_plan()
+        if keys is None:
+            keys = [key for key in attributes if key not in ignored_keys]
 
         for key in keys:
-            if key not in self._get_ignored_keys():
-                value = self.__dict__.get(key)
-                if value is not None:
-                    if type(value) is list:
-                        content[key] = []
-                        for v in value:
-                            content[key].append(v.to_dict() if isinstance(v, JSONable) else v)
-                    else:
-                        content[key] = value.to_dict() if isinstance(value, JSONable) else value
+            value = attributes.get(key)
+            if value is not None:
+                if type(value) is list:
+                    content[key] = [v.to_dict() if isinstance(v, JSONable) else v for v in value]
+                else:
+                    content[key] = value.to_dict() if isinstance(value, JSONable) else value
+
+        return content
 
+    def to_json(self, sort_keys=True):
+        return _dumps(self.to_dict(), sort_keys)
+
+    def _get_patch_keys(self):
+        # keys sent with every patch, even when unchanged
+        return ()
+
+    def _mark_clean(self, params=None):
+        # remembers the server state of the object: the server params it was just built from
+        # (turned into a snapshot only if a patch is requested) or its current content
+        if params is None:
+            self.__dict__['_snapshot'] = (None, self.to_dict())
+        else:
+            self.__dict__['_snapshot'] = (copy.deepcopy(params), None)
+        return self
+
+    def _get_snapshot(self):
+        snapshot = self.__dict__.get('_snapshot')
+        if snapshot is None:
+            return None
+        (params, content) = snapshot
+        if content is None:
+            content = type(self)(params=params).to_dict()
+            self.__dict__['_snapshot'] = (None, content)
         return content
 
-    def to_json(self):
-        return json.dumps(self.to_dict(), sort_keys=True)
+    """
+    Returns the content of the object that changed since it was retrieved (e.g. by get_favorites or
+    get_safebox_participants) or last updated with a server response: changed fields only, and in
+    lists, only the added or changed elements (elements with an id keep it). Objects built from
+    the caller's own params have no known server state: their whole content is returned.
+    """
+    def to_patch_dict(self):
+        content = self.to_dict()
+        snapshot = self._get_snapshot()
+        if snapshot is None:
+            return content
+        patch = _diff_dict(content, snapshot)
+        for key in self._get_patch_keys():
+            if key in content:
+                patch[key] = content[key]
+        return patch
+
+    """
+    Returns the names of the fields that changed since the object was retrieved or last updated
+    with a server response (all fields without a known server state).
+    """
+    def changed_fields(self):
+        snapshot = self._get_snapshot()
+        if snapshot is None:
+            return sorted(self.to_dict())
+        return sorted(_diff_dict(self.to_dict(), snapshot))
+
+    """
+    Returns whether a field (or any field if None) changed since the last known server state.
+    """
+    def is_dirty(self, field=None):
+        changed = self.changed_fields()
+        return bool(changed) if field is None else field in changed
+
+    def to_patch_json(self, sort_keys=True):
+        return _dumps(self.to_patch_dict(), sort_keys)
+
+
+def _diff_dict(content, snapshot):
+    patch = {}
+    for key, value in content.items():
+        if key not in snapshot:
+            patch[key] = value
+            continue
+        old_value = snapshot[key]
+        if type(value) is list and type(old_value) is list:
+            changes = _diff_list(value, old_value)
+            if changes:
+                patch[key] = changes
+        elif isinstance(value, dict) and isinstance(old_value, dict):
+            changes = _diff_dict(value, old_value)
+            if changes:
+                patch[key] = changes
+        elif value != old_value:
+            patch[key] = value
+    return patch
+
+
+def _diff_list(values, old_values):
+    # elements are matched by id; an element without id is sent unless it is unchanged
+    old_by_id = dict((_get_id(old), old) for old in old_values if _get_id(old) is not None)
+    changes = []
+    for value in values:
+        old = old_by_id.get(_get_id(value))
+        if old is not None and isinstance(value, dict) and isinstance(old, dict):
+            changed = _diff_dict(value, old)
+            if changed:
+                changed['id'] = value['id']
+                changes.append(changed)
+        elif value not in old_values:
+            changes.append(value)
+    return changes
 
 
 class Attachment(JSONable):
@@ -175,16 +375,12 @@ class Contactable(JSONable):
         if self._is_json(params):
             params = json.loads(params)
 
-        if 'contact_methods' in params:
-            contacts_id = []
-            for contact in params['contact_methods']:
-                for key, value in contact.items():
-                    if key == 'id':
-                        contacts_id.append(value)
-
-            for contact in self.__dict__['contact_methods']:
-                if hasattr(contact, 'id') and contact.id not in contacts_id:
-                    self.__dict__['contact_methods'].remove(contact)
+        self._hydrate()
+        if 'contact_methods' in params and 'contact_methods' in self.__dict__:
+            contacts_id = set(_get_id(contact) for contact in params['contact_methods'])
+            contact_methods = self.__dict__['contact_methods']
+            contact_methods[:] = [contact for contact in contact_methods
+                                  if _get_id(contact) is None or _get_id(contact) in contacts_id]
 
         return JSONable.update_attributes(self, params)
 
@@ -212,7 +408,9 @@ class ContactMethod(JSONable):
 
 
 class Favorite(Contactable):
-    def __init__(self, email=None, params=None):
+    _tracks_changes = True
+
+    def __init__(self, email=None, params=None, lazy=False):
         self.first_name = None
         self.last_name = None
         self.email = email
@@ -221,7 +419,7 @@ class Favorite(Contactable):
         self.contact_methods = []
 
         if params is not None:
-            JSONable.__init__(self, params)
+            JSONable.__init__(self, params, lazy)
 
 
     def prepare_to_destroy_contact(self, contact_method_ids):
@@ -235,20 +433,29 @@ class Favorite(Contactable):
         keys += ('id',)
         return keys
 
-    def to_json(self):
+    def to_json(self, sort_keys=True):
         favorite = {'favorite': self.to_dict()}
-        return json.dumps(favorite, sort_keys=True)
+        return _dumps(favorite, sort_keys)
+
+    def _get_patch_keys(self):
+        return ('email',)
+
+    def to_patch_json(self, sort_keys=True):
+        favorite = {'favorite': self.to_patch_dict()}
+        return _dumps(favorite, sort_keys)
 
 
 class Participant(JSONable):
-    def __init__(self, email=None, params=None):
+    _tracks_changes = True
+
+    def __init__(self, email=None, params=None, lazy=False):
         self.first_name = None
         self.last_name = None
         self.email = email
         self.privileged = None
 
         if params is not None:
-            JSONable.__init__(self, params)
+            JSONable.__init__(self, params, lazy)
 
         if not hasattr(self, 'guest_options'):
             self.guest_options = GuestOptions()
@@ -281,9 +488,16 @@ class Participant(JSONable):
                 contact._destroy = '1'
         return self
 
-    def to_json(self):
+    def to_json(self, sort_keys=True):
         participant = {'participant': self.to_dict()}
-        return json.dumps(participant, sort_keys=True)
+        return _dumps(participant, sort_keys)
+
+    def _get_patch_keys(self):
+        return ('email',)
+
+    def to_patch_json(self, sort_keys=True):
+        participant = {'participant': self.to_patch_dict()}
+        return _dumps(participant, sort_keys)
 
 
 class GuestOptions(Contactable):
@@ -303,7 +517,7 @@ class GuestOptions(Contactable):
 
 
 class Safebox(JSONable):
-    def __init__(self, user_email=None, notification_language="en", params=None):
+    def __init__(self, user_email=None, notification_language="en", params=None, lazy=False):
         self.participants = []
         self.subject = None
         self.message = None
@@ -314,7 +528,7 @@ class Safebox(JSONable):
         self.email_notification_enabled = None
 
         if params is not None:
-            JSONable.__init__(self, params)
+            JSONable.__init__(self, params, lazy)
 
         if not hasattr(self, 'security_options'):
             self.security_options = SecurityOptions()
@@ -393,10 +607,8 @@ class Safebox(JSONable):
     def to_dict(self):
         content = JSONable.to_dict(self)
 
-        content['recipients'] = []
-        for item in self.participants:
-            if not hasattr(item, 'type') or item.type == "guest":
-                content['recipients'].append(item.to_dict())
+        content['recipients'] = [item.to_dict() for item in self.participants
+                                 if not hasattr(item, 'type') or item.type == "guest"]
 
         self._append_document_ids_to_dict(content)
 
@@ -405,10 +617,7 @@ class Safebox(JSONable):
         return content
 
     def _append_document_ids_to_dict(self, content):
-        content['document_ids'] = []
-        if hasattr(self, 'attachments'):
-            for item in self.attachments:
-                content['document_ids'].append(item.guid)
+        content['document_ids'] = [item.guid for item in self.attachments] if hasattr(self, 'attachments') else []
 
     def _temporary_document(self, file_size):
         if hasattr(self, 'public_encryption_key'):
@@ -420,9 +629,9 @@ class Safebox(JSONable):
                  "multipart": False
                 }
 
-    def to_json(self):
+    def to_json(self, sort_keys=True):
         safebox = {'safebox': self.to_dict()}
-        return json.dumps(safebox, sort_keys=True)
+        return _dumps(safebox, sort_keys)
 
 
 class DownloadActivity(JSONable):
@@ -439,7 +648,14 @@ class DownloadActivityDetail(JSONable):
 
 
 class Document(JSONable):
-    pass
+    # documents listed in messages and download activity are identified by their id
+    @property
+    def guid(self):
+        return self.__dict__.get('guid', self.__dict__.get('id'))
+
+    @guid.setter
+    def guid(self, value):
+        self.__dict__['guid'] = value
 
 
 class EventHistory(JSONable):
@@ -508,8 +724,8 @@ class Reply(JSONable):
         )
         return keys
 
-    def to_json(self):
-        return json.dumps({'safebox' : self.to_dict()}, sort_keys=True)
+    def to_json(self, sort_keys=True):
+        return _dumps({'safebox' : self.to_dict()}, sort_keys)
 
 class ConsentMessage(JSONable):
     pass
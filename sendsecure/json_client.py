@@ -1,12 +1,71 @@
 import os
 import io
+import re
+import socket
+import threading
+import contextlib
+from . import utils
 from .utils import *
+from .transport import *
 from .exceptions import *
 
 
+class _Route:
+    """
+    URL path template compiled once, e.g. 'api/v2/safeboxes/{safebox_guid}/messages.json'.
+    Expanded values are percent-encoded as a single path segment.
+    """
+    def __init__(self, template):
+        self.parts = re.split(r'\{(\w+)\}', template)
+
+    def expand(self, values):
+        if len(self.parts) == 1:
+            return self.parts[0]
+        parts = list(self.parts)
+        for i in range(1, len(parts), 2):
+            parts[i] = quote(str(values[parts[i]]), safe='')
+        return ''.join(parts)
+
+
+_ROUTES = dict((name, _Route(template)) for (name, template) in {
+    'new_safebox': 'api/v2/safeboxes/new.json',
+    'safeboxes': 'api/v2/safeboxes.json',
+    'safebox': 'api/v2/safeboxes/{safebox_guid}.json',
+    'uploads': 'api/v2/safeboxes/{safebox_guid}/uploads.json',
+    'participants': 'api/v2/safeboxes/{safebox_guid}/participants.json',
+    'participant': 'api/v2/safeboxes/{safebox_guid}/participants/{participant_id}.json',
+    'messages': 'api/v2/safeboxes/{safebox_guid}/messages.json',
+    'message_read': 'api/v2/safeboxes/{safebox_guid}/messages/{message_id}/read',
+    'message_unread': 'api/v2/safeboxes/{safebox_guid}/messages/{message_id}/unread',
+    'add_time': 'api/v2/safeboxes/{safebox_guid}/add_time.json',
+    'close': 'api/v2/safeboxes/{safebox_guid}/close.json',
+    'delete_content': 'api/v2/safeboxes/{safebox_guid}/delete_content.json',
+    'mark_as_read': 'api/v2/safeboxes/{safebox_guid}/mark_as_read.json',
+    'mark_as_unread': 'api/v2/safeboxes/{safebox_guid}/mark_as_unread.json',
+    'document_url': 'api/v2/safeboxes/{safebox_guid}/documents/{document_guid}/url.json',
+    'audit_record_pdf': 'api/v2/safeboxes/{safebox_guid}/audit_record_pdf.json',
+    'security_options': 'api/v2/safeboxes/{safebox_guid}/security_options.json',
+    'download_activity': 'api/v2/safeboxes/{safebox_guid}/download_activity.json',
+    'event_history': 'api/v2/safeboxes/{safebox_guid}/event_history.json',
+    'archive': 'api/v2/safeboxes/{safebox_guid}/tag/archive',
+    'unarchive': 'api/v2/safeboxes/{safebox_guid}/untag/archive',
+    'follow': 'api/v2/safeboxes/{safebox_guid}/follow',
+    'unfollow': 'api/v2/safeboxes/{safebox_guid}/unfollow',
+    'recipients_autocomplete': 'api/v2/recipients/autocomplete',
+    'security_profiles': 'api/v2/enterprises/{enterprise_account}/security_profiles.json',
+    'enterprise_settings': 'api/v2/enterprises/{enterprise_account}/settings.json',
+    'user_settings': 'api/v2/enterprises/{enterprise_account}/users/{user_id}/settings.json',
+    'favorites': 'api/v2/enterprises/{enterprise_account}/users/{user_id}/favorites.json',
+    'favorite': 'api/v2/enterprises/{enterprise_account}/users/{user_id}/favorites/{favorite_id}.json',
+    'consent_message_group': 'api/v2/enterprises/{enterprise_account}/consent_message_groups/{consent_group_id}',
+}.items())
+
+
 class JsonClient:
     """
-    JsonClient object constructor.
+    JsonClient object constructor. A JsonClient can be shared by threads (the SendSecure endpoint
+    is looked up once, under a lock) and by processes forked after its creation (the pooled
+    connections are not inherited, see ConnectionPool).
 
     @param api_token:
                The API Token to be used for authentication with the SendSecure service
@@ -18,6 +77,19 @@ class JsonClient:
                The URL to the SendSecure service ("https://portal.xmedius.com" will be used by default if empty)
     @param locale:
                The locale in which the server errors will be returned ("en" will be used by default if empty)
+    @param connection_pool:
+               A ConnectionPool shared with other clients (urlopen is used by default if empty)
+    @param transport:
+               The transport sending the requests (a transport object, or a name given to
+               create_transport), the connection_pool or else a UrllibTransport by default
+    @param endpoint_cache:
+               A dict shared with other clients, caching the SendSecure endpoint of each enterprise account
+    @param request_limiter:
+               A semaphore (or any context manager) acquired around each request
+    @param timeout:
+               The connect and read timeout of each request in seconds (unlimited if empty)
+    @param circuit_breaker:
+               A CircuitBreaker (possibly shared with other clients) guarding the requests to each host
     """
     def __init__(self, options):
         self.locale = options.get('locale', 'en')
@@ -26,6 +98,24 @@ class JsonClient:
         self.sendsecure_endpoint = None
         self.token = str(options.get('token'))
         self.user_id = options.get('user_id')
+        self._base_url = (None, None)
+        self._locale_query = (None, None)
+        self._endpoint_lock = threading.Lock()
+        self.connection_pool = options.get('connection_pool')
+        transport = options.get('transport') or self.connection_pool
+        # transports created by the client (from a name, or the default one) are closed by close()
+        self._owned_transport = None
+        if transport is None:
+            transport = self._owned_transport = UrllibTransport()
+        elif isinstance(transport, str):
+            transport = self._owned_transport = create_transport(transport)
+        self.transport = transport
+        self.endpoint_cache = options.get('endpoint_cache')
+        self.request_limiter = options.get('request_limiter') or contextlib.nullcontext()
+        self.timeout = options.get('timeout')
+        self.circuit_breaker = options.get('circuit_breaker')
+        self._local = threading.local()
+        utils._register_at_fork(self)
 
     """
     Pre-creates a SafeBox on the SendSecure system and initializes the Safebox object accordingly.
@@ -36,7 +126,7 @@ class JsonClient:
     """
     def new_safebox(self, user_email):
         params = {'user_email': user_email}
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes/new.json'], params)
+        url = self._route_url('new_safebox', params)
         return self._do_get(url, 'application/json')
 
     """
@@ -49,7 +139,7 @@ class JsonClient:
     @return: The json containing the temporary document GUID and the upload URL
     """
     def new_file(self, safebox_guid, file_params):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes/', safebox_guid, 'uploads.json'])
+        url = self._route_url('uploads', safebox_guid=safebox_guid)
         return self._do_post(url, 'application/json', file_params, 'application/json')
 
     """
@@ -72,13 +162,13 @@ class JsonClient:
         status_line = None
         response_body = None
         if type(source) == str:
-            (status_code, status_line, response_body) = http_upload_filepath(str(upload_url), source, content_type, filename)
+            (status_code, status_line, response_body) = self._send(http_upload_filepath, str(upload_url), source, content_type, filename)
         elif self._is_file(source):
             upload_filename = filename or source.name.split('/')[-1]
             upload_filesize = filesize or (os.path.getsize(source.name) - source.tell())
-            (status_code, status_line, response_body) = http_upload_raw_stream(str(upload_url), source, content_type, upload_filename, upload_filesize)
+            (status_code, status_line, response_body) = self._send(http_upload_raw_stream, str(upload_url), source, content_type, upload_filename, upload_filesize)
         else:
-            (status_code, status_line, response_body) = http_upload_raw_stream(str(upload_url), source, content_type, filename, filesize)
+            (status_code, status_line, response_body) = self._send(http_upload_raw_stream, str(upload_url), source, content_type, filename, filesize)
         if status_code >= 400:
             raise SendSecureException(status_code, status_line, response_body)
         return response_body
@@ -92,7 +182,7 @@ class JsonClient:
     @return: The json containing the guid, preview url and encryption key of the created SafeBox
     """
     def commit_safebox(self, safebox_json):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes.json'])
+        url = self._route_url('safeboxes')
         return self._do_post(url, 'application/json', safebox_json, 'application/json')
 
     """
@@ -104,7 +194,7 @@ class JsonClient:
     """
     def get_security_profiles(self, user_email):
         params = {'user_email': user_email}
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/enterprises', self.enterprise_account, 'security_profiles.json'], params)
+        url = self._route_url('security_profiles', params, enterprise_account=self.enterprise_account)
         return self._do_get(url, 'application/json')
 
     """
@@ -113,7 +203,7 @@ class JsonClient:
     @return: The json containing the enterprise settings
     """
     def get_enterprise_settings(self):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/enterprises', self.enterprise_account, 'settings.json'])
+        url = self._route_url('enterprise_settings', enterprise_account=self.enterprise_account)
         return self._do_get(url, 'application/json')
 
     """
@@ -122,7 +212,7 @@ class JsonClient:
     @return: The json containing the user settings
     """
     def get_user_settings(self):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/enterprises', self.enterprise_account, 'users', self.user_id, 'settings.json'])
+        url = self._route_url('user_settings', enterprise_account=self.enterprise_account, user_id=self.user_id)
         return self._do_get(url, 'application/json')
 
     """
@@ -131,7 +221,7 @@ class JsonClient:
     @return: The json containing a list of Favorite
     """
     def get_favorites(self):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/enterprises', self.enterprise_account, 'users', self.user_id, 'favorites.json'])
+        url = self._route_url('favorites', enterprise_account=self.enterprise_account, user_id=self.user_id)
         return self._do_get(url, 'application/json')
 
     """
@@ -142,7 +232,7 @@ class JsonClient:
     @return: The json containing all the informations of the created Favorite
     """
     def create_favorite(self, favorite_json):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/enterprises', self.enterprise_account, 'users', self.user_id, 'favorites.json'])
+        url = self._route_url('favorites', enterprise_account=self.enterprise_account, user_id=self.user_id)
         return self._do_post(url, 'application/json', favorite_json, 'application/json')
 
     """
@@ -156,7 +246,7 @@ class JsonClient:
     @return: The json containing all the informations of the updated Favorite
     """
     def update_favorite(self, favorite_id, favorite_json):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/enterprises', self.enterprise_account, 'users', self.user_id, 'favorites', str(favorite_id) + '.json'])
+        url = self._route_url('favorite', enterprise_account=self.enterprise_account, user_id=self.user_id, favorite_id=favorite_id)
         return self._do_patch(url, 'application/json', favorite_json, 'application/json')
 
     """
@@ -167,7 +257,7 @@ class JsonClient:
     @return: Nothing
     """
     def delete_favorite(self, favorite_id):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/enterprises', self.enterprise_account, 'users', self.user_id, 'favorites', str(favorite_id) + '.json'])
+        url = self._route_url('favorite', enterprise_account=self.enterprise_account, user_id=self.user_id, favorite_id=favorite_id)
         return self._do_delete(url, 'application/json')
 
     """
@@ -180,7 +270,7 @@ class JsonClient:
     @return: The json containing all the informations of the created Participant
     """
     def create_participant(self, safebox_guid, participant_json):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes', safebox_guid, 'participants.json'])
+        url = self._route_url('participants', safebox_guid=safebox_guid)
         return self._do_post(url, 'application/json', participant_json, 'application/json')
 
     """
@@ -196,7 +286,7 @@ class JsonClient:
     @return: The json containing all the informations of the updated Participant
     """
     def update_participant(self, safebox_guid, participant_id, participant_json):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes', safebox_guid, 'participants', participant_id + '.json'])
+        url = self._route_url('participant', safebox_guid=safebox_guid, participant_id=participant_id)
         return self._do_patch(url, 'application/json', participant_json, 'application/json')
 
     """
@@ -208,7 +298,7 @@ class JsonClient:
     @return: The json containing the search result
     """
     def search_recipient(self, term):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/recipients/autocomplete?term=' + term])
+        url = self._route_url('recipients_autocomplete', {'term': term})
         return self._do_get(url, 'application/json')
 
     """
@@ -222,7 +312,7 @@ class JsonClient:
     @return: The json containing the request result
     """
     def reply(self, safebox_guid, reply_params):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes', safebox_guid, '/messages.json'])
+        url = self._route_url('messages', safebox_guid=safebox_guid)
         return self._do_post(url, 'application/json', reply_params, 'application/json')
 
     """
@@ -235,7 +325,7 @@ class JsonClient:
     @return: The json containing the new expiration date
     """
     def add_time(self, safebox_guid, add_time_json):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes', safebox_guid, 'add_time.json'])
+        url = self._route_url('add_time', safebox_guid=safebox_guid)
         return self._do_patch(url, 'application/json', add_time_json, 'application/json')
 
     """
@@ -246,7 +336,7 @@ class JsonClient:
     @return: The json containing the request result
     """
     def close_safebox(self, safebox_guid):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes', safebox_guid, 'close.json'])
+        url = self._route_url('close', safebox_guid=safebox_guid)
         return self._do_patch(url, 'application/json', '', 'application/json')
 
     """
@@ -257,7 +347,7 @@ class JsonClient:
     @return: The json containing the request result
     """
     def delete_safebox_content(self, safebox_guid):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes', safebox_guid, 'delete_content.json'])
+        url = self._route_url('delete_content', safebox_guid=safebox_guid)
         return self._do_patch(url, 'application/json', '', 'application/json')
 
     """
@@ -268,7 +358,7 @@ class JsonClient:
     @return: The json containing the request result
     """
     def mark_as_read(self, safebox_guid):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes', safebox_guid, 'mark_as_read.json'])
+        url = self._route_url('mark_as_read', safebox_guid=safebox_guid)
         return self._do_patch(url, 'application/json', '', 'application/json')
 
     """
@@ -279,7 +369,7 @@ class JsonClient:
     @return: The json containing the request result
     """
     def mark_as_unread(self, safebox_guid):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes', safebox_guid, 'mark_as_unread.json'])
+        url = self._route_url('mark_as_unread', safebox_guid=safebox_guid)
         return self._do_patch(url, 'application/json', '', 'application/json')
 
     """
@@ -292,7 +382,7 @@ class JsonClient:
     @return: The json containing the request result
     """
     def mark_as_read_message(self, safebox_guid, message_id):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes', safebox_guid, 'messages', str(message_id), 'read'])
+        url = self._route_url('message_read', safebox_guid=safebox_guid, message_id=message_id)
         return self._do_patch(url, 'application/json', '', 'application/json')
 
     """
@@ -305,7 +395,7 @@ class JsonClient:
     @return: The json containing the request result
     """
     def mark_as_unread_message(self, safebox_guid, message_id):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes', safebox_guid, 'messages', str(message_id), 'unread'])
+        url = self._route_url('message_unread', safebox_guid=safebox_guid, message_id=message_id)
         return self._do_patch(url, 'application/json', '', 'application/json')
 
     """
@@ -322,7 +412,7 @@ class JsonClient:
     """
     def get_file_url(self, safebox_guid, document_guid, user_email):
         params = {'user_email': user_email}
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes', safebox_guid, 'documents', document_guid, 'url.json'], params)
+        url = self._route_url('document_url', params, safebox_guid=safebox_guid, document_guid=document_guid)
         return self._do_get(url, 'application/json')
 
     """
@@ -333,7 +423,7 @@ class JsonClient:
     @return: The json containing the url
     """
     def get_audit_record_url(self, safebox_guid):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes', safebox_guid, 'audit_record_pdf.json'])
+        url = self._route_url('audit_record_pdf', safebox_guid=safebox_guid)
         return self._do_get(url, 'application/json')
 
     """
@@ -346,6 +436,33 @@ class JsonClient:
     def get_audit_record_pdf(self, url):
         return self._get(url, 'application/pdf')
 
+    """
+    Retrieve the audit record of an existing safebox as an unread response stream.
+
+    @param url:
+            The url of the safebox audit record
+    @return: The response stream of the pdf
+    """
+    def get_audit_record_pdf_stream(self, url):
+        return self._get_stream(url, 'application/pdf')
+
+    """
+    Returns the callable opening the response streams of a file url (e.g. the url of a document)
+    with the timeout, request limit and circuit breaker of the client. The deadline of the calling
+    thread also bounds the streams opened from other threads, e.g. the ranges of a download.
+
+    @return: A callable receiving the url and optional request headers, returning an unread response stream
+    """
+    def get_file_stream_opener(self):
+        deadline = getattr(self._local, 'deadline', None)
+
+        def open_stream(url, headers=None):
+            if deadline is None:
+                return self._send(http_get_stream, url, '*/*', None, headers)
+            with self.deadline(deadline):
+                return self._send(http_get_stream, url, '*/*', None, headers)
+        return open_stream
+
     """
     Retrieve a filtered list of safeboxes for the current user account.
 
@@ -358,9 +475,24 @@ class JsonClient:
     """
     def get_safeboxes(self, url, search_params):
         if url is None:
-            url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes.json'], search_params)
+            url = self._route_url('safeboxes', search_params)
         return self._do_get(url, 'application/json')
 
+    """
+    Retrieve a filtered list of safeboxes for the current user account as an unread response stream.
+
+    @param url:
+            The complete search url
+    @param search_params:
+           The optional filtering parameters
+
+    @return: The response stream of the json containing the list of Safebox
+    """
+    def get_safeboxes_stream(self, url, search_params):
+        if url is None:
+            url = self._route_url('safeboxes', search_params)
+        return self._do_get_stream(url, 'application/json')
+
     """
     Retrieve all info of an existing safebox for the current user account.
 
@@ -372,10 +504,10 @@ class JsonClient:
              If no sections are specified, it will return all safebox infos.
     """
     def get_safebox_info(self, safebox_guid, sections):
-        params = ''
+        params = None
         if sections:
             params = {'sections': sections}
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes', safebox_guid + '.json'], params)
+        url = self._route_url('safebox', params, safebox_guid=safebox_guid)
         return self._do_get(url, 'application/json')
 
     """
@@ -386,7 +518,7 @@ class JsonClient:
     @return: The json containing the list of participants
     """
     def get_safebox_participants(self, safebox_guid):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes', safebox_guid, 'participants.json'])
+        url = self._route_url('participants', safebox_guid=safebox_guid)
         return self._do_get(url, 'application/json')
 
     """
@@ -397,9 +529,20 @@ class JsonClient:
     @return: The json containing the list of messages
     """
     def get_safebox_messages(self, safebox_guid):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes', safebox_guid, 'messages.json'])
+        url = self._route_url('messages', safebox_guid=safebox_guid)
         return self._do_get(url, 'application/json')
 
+    """
+    Retrieve all messages info of an existing safebox as an unread response stream.
+
+    @param safebox_guid:
+               The guid of the safebox
+    @return: The response stream of the json containing the list of messages
+    """
+    def get_safebox_messages_stream(self, safebox_guid):
+        url = self._route_url('messages', safebox_guid=safebox_guid)
+        return self._do_get_stream(url, 'application/json')
+
     """
     Retrieve all security options info of an existing safebox for the current user account.
 
@@ -408,7 +551,7 @@ class JsonClient:
     @return: The json containing the Security Options
     """
     def get_safebox_security_options(self, safebox_guid):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes', safebox_guid, 'security_options.json'])
+        url = self._route_url('security_options', safebox_guid=safebox_guid)
         return self._do_get(url, 'application/json')
 
     """
@@ -419,7 +562,7 @@ class JsonClient:
     @return: The json containing the Download Activity
     """
     def get_safebox_download_activity(self, safebox_guid):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes', safebox_guid, 'download_activity.json'])
+        url = self._route_url('download_activity', safebox_guid=safebox_guid)
         return self._do_get(url, 'application/json')
 
     """
@@ -431,9 +574,21 @@ class JsonClient:
     @return: The json containing a list of EventHistory
     """
     def get_safebox_event_history(self, safebox_guid):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes', safebox_guid, 'event_history.json'])
+        url = self._route_url('event_history', safebox_guid=safebox_guid)
         return self._do_get(url, 'application/json')
 
+    """
+    Retrieve all event_history info of an existing safebox as an unread response stream.
+
+    @param safebox_guid:
+               The guid of the safebox
+
+    @return: The response stream of the json containing a list of EventHistory
+    """
+    def get_safebox_event_history_stream(self, safebox_guid):
+        url = self._route_url('event_history', safebox_guid=safebox_guid)
+        return self._do_get_stream(url, 'application/json')
+
     """
     Archive a specific safebox
 
@@ -444,7 +599,7 @@ class JsonClient:
     @return: The json containing the request result
     """
     def archive_safebox(self, safebox_guid, user_email):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes', safebox_guid, '/tag/archive'])
+        url = self._route_url('archive', safebox_guid=safebox_guid)
         return self._do_post(url, 'application/json', user_email, 'application/json')
 
     """
@@ -457,7 +612,7 @@ class JsonClient:
     @return: The json containing the request result
     """
     def unarchive_safebox(self, safebox_guid, user_email):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes', safebox_guid, '/untag/archive'])
+        url = self._route_url('unarchive', safebox_guid=safebox_guid)
         return self._do_post(url, 'application/json', user_email, 'application/json')
 
 
@@ -469,7 +624,7 @@ class JsonClient:
     @return: An object containing the request result
     """
     def unfollow(self, safebox_guid):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes', safebox_guid, '/unfollow'])
+        url = self._route_url('unfollow', safebox_guid=safebox_guid)
         return self._do_patch(url, 'application/json', '', 'application/json')
 
     """
@@ -480,7 +635,7 @@ class JsonClient:
     @return: An object containing the request result
     """
     def follow(self, safebox_guid):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/safeboxes', safebox_guid, '/follow'])
+        url = self._route_url('follow', safebox_guid=safebox_guid)
         return self._do_patch(url, 'application/json', '', 'application/json')
 
 
@@ -492,47 +647,159 @@ class JsonClient:
     @return: The json containing the list of all the localized messages
     """
     def get_consent_group_messages(self, consent_group_id):
-        url = urljoin([self._get_sendsecure_endpoint(), 'api/v2/enterprises', self.enterprise_account, '/consent_message_groups', str(consent_group_id)])
+        url = self._route_url('consent_message_group', enterprise_account=self.enterprise_account, consent_group_id=consent_group_id)
         return self._do_get(url, 'application/json')
 
+    """
+    Closes the transport created by the client (a transport or connection pool given in the options
+    is left open, as it may be shared).
+    """
+    def close(self):
+        if self._owned_transport is not None:
+            self._owned_transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
     def _get_sendsecure_endpoint(self):
-        if not self.sendsecure_endpoint:
-            url = urljoin([self.endpoint, 'services', self.enterprise_account, 'sendsecure/server/url'])
-            new_endpoint = self._get(url, 'text/plain')
-            self.sendsecure_endpoint = new_endpoint
-        return self.sendsecure_endpoint
+        endpoint = self.sendsecure_endpoint
+        if endpoint:
+            return endpoint
+        # concurrent first requests wait for a single endpoint lookup
+        with self._endpoint_lock:
+            if not self.sendsecure_endpoint:
+                key = (self.endpoint, self.enterprise_account)
+                if self.endpoint_cache is not None and key in self.endpoint_cache:
+                    self.sendsecure_endpoint = self.endpoint_cache[key]
+                    return self.sendsecure_endpoint
+                url = urljoin([self.endpoint, 'services', self.enterprise_account, 'sendsecure/server/url'])
+                new_endpoint = self._get(url, 'text/plain')
+                self.sendsecure_endpoint = new_endpoint
+                if self.endpoint_cache is not None:
+                    self.endpoint_cache[key] = new_endpoint
+            return self.sendsecure_endpoint
+
+    def _route_url(self, name, query=None, **values):
+        endpoint = self._get_sendsecure_endpoint()
+        # the cached values are replaced as a whole so concurrent threads never see half an update
+        (base_endpoint, base_url) = self._base_url
+        if endpoint != base_endpoint:
+            base_url = endpoint.rstrip('/') + '/'
+            self._base_url = (endpoint, base_url)
+        url = base_url + _ROUTES[name].expand(values)
+        if query:
+            url += '?' + encode_query(query)
+        return url
+
+    def _with_locale(self, url):
+        locale = self.locale
+        (query_locale, locale_query) = self._locale_query
+        if locale != query_locale:
+            locale_query = encode_query({'locale': locale})
+            self._locale_query = (locale, locale_query)
+        return url + ('&' if '?' in url else '?') + locale_query
+
+    def _after_fork(self):
+        # the lock may have been held by another thread of the parent
+        self._endpoint_lock = threading.Lock()
 
     def _do_get(self, url, accept):
-        params = {'locale': self.locale}
-        new_url = urljoin([url], params)
-        return self._get(new_url, accept)
+        return self._get(self._with_locale(url), accept)
 
     def _get(self, url, accept):
-        (status_code, status_line, response_body) = http_get(url, accept, self.token)
+        (status_code, status_line, response_body) = self._send(http_get, url, accept, self.token, pool=self.transport)
         if status_code >= 400:
             raise SendSecureException(status_code, status_line, response_body)
         return response_body
 
+    def _do_get_stream(self, url, accept):
+        return self._get_stream(self._with_locale(url), accept)
+
+    def _get_stream(self, url, accept):
+        response = self._send(http_get_stream, url, accept, self.token)
+        if response.status >= 400:
+            with response:
+                raise SendSecureException(response.status, response.reason, response.read().decode('utf-8'))
+        return response
+
     def _do_post(self, url, content_type, body, accept):
-        params = {'locale': self.locale}
-        (status_code, status_line, response_body) = http_post(urljoin([url], params), content_type, body, accept, self.token)
+        (status_code, status_line, response_body) = self._send(http_post, self._with_locale(url), content_type, body, accept, self.token, pool=self.transport)
         if status_code >= 400:
             raise SendSecureException(status_code, status_line, response_body)
         return response_body
 
     def _do_patch(self, url, content_type, body, accept):
-        params = {'locale': self.locale}
-        (status_code, status_line, response_body) = http_patch(urljoin([url], params), content_type, body, accept, self.token)
+        (status_code, status_line, response_body) = self._send(http_patch, self._with_locale(url), content_type, body, accept, self.token, pool=self.transport)
         if status_code >= 400:
             raise SendSecureException(status_code, status_line, response_body)
         return response_body
 
     def _do_delete(self, url, accept):
-        params = {'locale': self.locale}
-        (status_code, status_line, response_body) = http_delete(urljoin([url], params), accept, self.token)
+        (status_code, status_line, response_body) = self._send(http_delete, self._with_locale(url), accept, self.token, pool=self.transport)
         if status_code >= 400:
             raise SendSecureException(status_code, status_line, response_body)
         return response_body
 
+    """
+    Sets a deadline for all the requests made by the current thread within the block, e.g. all the
+    requests of a composite operation. Nested deadlines cannot extend the enclosing one.
+
+    @param deadline:
+                A number of seconds or a Deadline object
+    """
+    @contextlib.contextmanager
+    def deadline(self, deadline):
+        if not isinstance(deadline, Deadline):
+            deadline = Deadline(deadline)
+        previous = getattr(self._local, 'deadline', None)
+        if previous is not None and previous.expires_at < deadline.expires_at:
+            deadline = previous
+        self._local.deadline = deadline
+        try:
+            yield deadline
+        finally:
+            self._local.deadline = previous
+
+    def _send(self, function, url, *args, **kwargs):
+        deadline = getattr(self._local, 'deadline', None)
+        timeout = self.timeout if deadline is None else deadline.timeout(self.timeout)
+        if self.circuit_breaker is None:
+            return self._send_timed(function, url, args, kwargs, timeout, deadline)
+        host = urlparse(url).netloc
+        self.circuit_breaker.before_request(host)
+        try:
+            result = self._send_timed(function, url, args, kwargs, timeout, deadline)
+        except urllib.error.HTTPError as e:
+            self._record_outcome(host, e.code)
+            raise
+        except (OSError, http.client.HTTPException, RequestTimeoutException):
+            self.circuit_breaker.record_failure(host)
+            raise
+        except:
+            self.circuit_breaker.record_success(host)
+            raise
+        self._record_outcome(host, result[0] if type(result) == tuple else result.status)
+        return result
+
+    def _record_outcome(self, host, status_code):
+        if status_code >= 500:
+            self.circuit_breaker.record_failure(host)
+        else:
+            self.circuit_breaker.record_success(host)
+
+    def _send_timed(self, function, url, args, kwargs, timeout, deadline):
+        try:
+            with self.request_limiter:
+                return function(url, *args, timeout=timeout, **kwargs)
+        except (socket.timeout, urllib.error.URLError) as e:
+            if isinstance(e, urllib.error.URLError) and not isinstance(e.reason, socket.timeout):
+                raise
+            if deadline is not None and deadline.expired:
+                raise DeadlineExceededException(0, 'Deadline exceeded', str(e))
+            raise RequestTimeoutException(0, 'Request timed out', str(e))
+
     def _is_file(self, obj): 
         return isinstance(obj, (io.TextIOBase, io.BufferedIOBase, io.RawIOBase, io.IOBase))
\ No newline at end of file
@@ -0,0 +1,261 @@
+import json
+import time
+import sqlite3
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from .helpers import *
+from .exceptions import *
+
+
+class SafeboxMirror:
+    """
+    SafeboxMirror object constructor. A local (SQLite) copy of the safeboxes of the current user,
+    with their participants, messages and event history, kept up to date by sync() and queried
+    without any request to the SendSecure service.
+
+    @param client:
+               The Client object used to synchronize the mirror
+    @param path:
+               The path of the SQLite database file
+    """
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        connection = sqlite3.connect(path)
+        try:
+            # readers are not blocked while a sync is writing
+            connection.execute('PRAGMA journal_mode=WAL')
+        finally:
+            connection.close()
+        with self._transaction() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS safeboxes ('
+                               'guid TEXT PRIMARY KEY, '
+                               'status TEXT, '
+                               'subject TEXT, '
+                               'user_email TEXT, '
+                               'latest_activity TEXT, '
+                               'signature TEXT NOT NULL, '
+                               'summary TEXT NOT NULL, '
+                               'detail TEXT, '
+                               'synced_at REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS safeboxes_activity ON safeboxes (status, latest_activity)')
+            connection.execute('CREATE TABLE IF NOT EXISTS participants ('
+                               'safebox_guid TEXT NOT NULL, '
+                               'position INTEGER NOT NULL, '
+                               'email TEXT, '
+                               'first_name TEXT, '
+                               'last_name TEXT, '
+                               'data TEXT NOT NULL, '
+                               'PRIMARY KEY (safebox_guid, position))')
+            connection.execute('CREATE INDEX IF NOT EXISTS participants_email ON participants (email)')
+            for table in ('messages', 'event_history'):
+                connection.execute('CREATE TABLE IF NOT EXISTS %s ('
+                                   'safebox_guid TEXT NOT NULL, '
+                                   'position INTEGER NOT NULL, '
+                                   'data TEXT NOT NULL, '
+                                   'PRIMARY KEY (safebox_guid, position))' % table)
+
+    """
+    Synchronizes the mirror with the SendSecure service. The safebox lists are read page by page,
+    and only the safeboxes whose status, activity or unread count changed since the last sync
+    are fetched again (with their participants, messages and event history). The lists being
+    ordered by latest activity, an incremental sync stops at the first page without any change.
+
+    @param statuses:
+               The statuses of the safeboxes to synchronize (in_progress, closed, content_deleted...),
+               all safeboxes if None
+    @param full:
+               Whether to read every page; safeboxes no longer listed are then removed from the
+               mirror (only when statuses is None)
+    @param per_page:
+               The number of safeboxes per page
+    @param workers:
+               The number of safeboxes fetched concurrently
+    @return: A dict with the number of listed, refreshed and removed safeboxes
+    """
+    def sync(self, statuses=None, full=False, per_page=100, workers=4):
+        report = { 'listed': 0, 'refreshed': 0, 'removed': 0 }
+        listed = set()
+        with ThreadPoolExecutor(workers) as executor:
+            for status in (statuses or [None]):
+                for page in self._iter_pages(status, per_page):
+                    changed = self._changed(page)
+                    details = executor.map(self._fetch_detail, [summary['guid'] for summary in changed])
+                    with self._transaction() as connection:
+                        for (summary, detail) in zip(changed, details):
+                            self._store(connection, summary, detail)
+                    listed.update(summary['guid'] for summary in page)
+                    report['listed'] += len(page)
+                    report['refreshed'] += len(changed)
+                    if not changed and not full:
+                        break
+        if full and statuses is None:
+            report['removed'] = self._remove_unlisted(listed)
+        return report
+
+    """
+    Retrieves a safebox of the mirror, with its participants, messages and event history.
+
+    @param safebox_guid:
+               The guid of the safebox
+    @return: A Safebox object, or None if the safebox is not in the mirror
+    """
+    def get_safebox(self, safebox_guid):
+        with self._transaction() as connection:
+            row = connection.execute('SELECT summary, detail FROM safeboxes WHERE guid = ?', (safebox_guid,)).fetchone()
+        if row is None:
+            return None
+        params = json.loads(row[0])
+        if row[1] is not None:
+            params.update(json.loads(row[1]))
+        return Safebox(params=params)
+
+    """
+    Searches the safeboxes of the mirror, most recently active first.
+
+    @param term:
+               A term to look for in the subject and in the email and names of the participants (optional)
+    @param status:
+               The status of the safeboxes (optional)
+    @param limit:
+               The maximum number of safeboxes returned
+    @param offset:
+               The number of safeboxes to skip
+    @return: A list of Safebox objects (without participants, messages and event history)
+    """
+    def search(self, term=None, status=None, limit=100, offset=0):
+        (where, params) = self._filters(term, status)
+        with self._transaction() as connection:
+            rows = connection.execute('SELECT summary FROM safeboxes' + where +
+                                      ' ORDER BY latest_activity DESC, guid LIMIT ? OFFSET ?',
+                                      params + [limit, offset]).fetchall()
+        return [Safebox(params=json.loads(row[0])) for row in rows]
+
+    """
+    Counts the safeboxes of the mirror matching a search.
+
+    @param term:
+               A term to look for in the subject and in the email and names of the participants (optional)
+    @param status:
+               The status of the safeboxes (optional)
+    @return: The number of matching safeboxes
+    """
+    def count(self, term=None, status=None):
+        (where, params) = self._filters(term, status)
+        with self._transaction() as connection:
+            return connection.execute('SELECT COUNT(*) FROM safeboxes' + where, params).fetchone()[0]
+
+    """
+    Retrieves the participants of a safebox of the mirror.
+
+    @return: A list of Participant objects
+    """
+    def get_participants(self, safebox_guid):
+        return [Participant(params=params)._mark_clean(params) for params in self._get_rows('participants', safebox_guid)]
+
+    """
+    Retrieves the messages of a safebox of the mirror.
+
+    @return: A list of Message objects
+    """
+    def get_messages(self, safebox_guid):
+        return [Message(params) for params in self._get_rows('messages', safebox_guid)]
+
+    """
+    Retrieves the event history of a safebox of the mirror.
+
+    @return: A list of EventHistory objects
+    """
+    def get_event_history(self, safebox_guid):
+        return [EventHistory(params) for params in self._get_rows('event_history', safebox_guid)]
+
+    def _iter_pages(self, status, per_page):
+        search_params = { 'per_page': per_page }
+        if status is not None:
+            search_params['status'] = status
+        url = None
+        while True:
+            result = json.loads(self.client.json_client.get_safeboxes(url, search_params))
+            page = [item['safebox'] for item in result['safeboxes']]
+            if page:
+                yield page
+            url = result.get('next_page_url')
+            if not url or not page:
+                return
+
+    def _changed(self, page):
+        guids = [summary['guid'] for summary in page]
+        with self._transaction() as connection:
+            signatures = dict(connection.execute('SELECT guid, signature FROM safeboxes WHERE guid IN (%s)' %
+                                                 ','.join('?' * len(guids)), guids).fetchall())
+        return [summary for summary in page if signatures.get(summary['guid']) != _signature(summary)]
+
+    def _fetch_detail(self, safebox_guid):
+        result = json.loads(self.client.json_client.get_safebox_info(safebox_guid, 'participants,messages,event_history'))
+        return result['safebox']
+
+    def _store(self, connection, summary, detail):
+        guid = summary['guid']
+        connection.execute('INSERT OR REPLACE INTO safeboxes (guid, status, subject, user_email, latest_activity, '
+                           'signature, summary, detail, synced_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                           (guid, summary.get('status'), summary.get('subject'), summary.get('user_email'),
+                            summary.get('latest_activity'), _signature(summary), json.dumps(summary),
+                            json.dumps(detail), time.time()))
+        for table in ('participants', 'messages', 'event_history'):
+            connection.execute('DELETE FROM %s WHERE safebox_guid = ?' % table, (guid,))
+        connection.executemany('INSERT INTO participants (safebox_guid, position, email, first_name, last_name, data) '
+                               'VALUES (?, ?, ?, ?, ?, ?)',
+                               [(guid, position, participant.get('email'), participant.get('first_name'),
+                                 participant.get('last_name'), json.dumps(participant))
+                                for (position, participant) in enumerate(detail.get('participants') or [])])
+        for table in ('messages', 'event_history'):
+            connection.executemany('INSERT INTO %s (safebox_guid, position, data) VALUES (?, ?, ?)' % table,
+                                   [(guid, position, json.dumps(params))
+                                    for (position, params) in enumerate(detail.get(table) or [])])
+
+    def _remove_unlisted(self, listed):
+        with self._transaction() as connection:
+            guids = [row[0] for row in connection.execute('SELECT guid FROM safeboxes').fetchall() if row[0] not in listed]
+            for table in ('participants', 'messages', 'event_history'):
+                connection.executemany('DELETE FROM %s WHERE safebox_guid = ?' % table, [(guid,) for guid in guids])
+            connection.executemany('DELETE FROM safeboxes WHERE guid = ?', [(guid,) for guid in guids])
+        return len(guids)
+
+    def _filters(self, term, status):
+        conditions = []
+        params = []
+        if status is not None:
+            conditions.append('status = ?')
+            params.append(status)
+        if term:
+            pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            conditions.append("(subject LIKE ? ESCAPE '\\' OR guid IN (SELECT safebox_guid FROM participants "
+                              "WHERE email LIKE ? ESCAPE '\\' OR first_name LIKE ? ESCAPE '\\' OR last_name LIKE ? ESCAPE '\\'))")
+            params.extend([pattern] * 4)
+        return ((' WHERE ' + ' AND '.join(conditions)) if conditions else '', params)
+
+    def _get_rows(self, table, safebox_guid):
+        with self._transaction() as connection:
+            rows = connection.execute('SELECT data FROM %s WHERE safebox_guid = ? ORDER BY position' % table,
+                                      (safebox_guid,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    @contextmanager
+    def _transaction(self):
+        # a short-lived connection per transaction keeps the mirror usable from any thread
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            connection.execute('BEGIN')
+            try:
+                yield connection
+            except:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+        finally:
+            connection.close()
+
+
+def _signature(summary):
+    return json.dumps([summary.get('status'), summary.get('updated_at'), summary.get('latest_activity'),
+                       summary.get('unread_count')])
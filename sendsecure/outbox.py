@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
+from .helpers import *
+from .exceptions import *
+
+
+class OutboxJob:
+    """
+    OutboxJob object constructor.
+
+    @param id:
+               The id of the job in the outbox
+    @param status:
+               The last checkpointed stage: pending, initialized, committed or failed
+    @param attempts:
+               The number of failed processing attempts
+    @param error:
+               The message of the last error (if any)
+    @param safebox:
+               The Safebox object, as of the last checkpoint
+    """
+    PENDING = 'pending'
+    INITIALIZED = 'initialized'
+    COMMITTED = 'committed'
+    FAILED = 'failed'
+
+    def __init__(self, id, status, attempts, error, safebox):
+        self.id = id
+        self.status = status
+        self.attempts = attempts
+        self.error = error
+        self.safebox = safebox
+
+
+class SafeboxOutbox:
+    """
+    SafeboxOutbox object constructor. A persistent (SQLite) queue of safeboxes to submit, where
+    every stage of the submission is checkpointed so a job interrupted by a crash resumes
+    where it stopped. Several threads or processes can share the same database file.
+
+    @param client:
+               The Client object used to submit the safeboxes
+    @param path:
+               The path of the SQLite database file
+    @param max_attempts:
+               The number of failed attempts after which a job is marked as failed
+    @param lease_seconds:
+               How long a claimed job is reserved for a worker before another worker may resume it
+    @param retry_delay:
+               The number of seconds to wait before retrying a job after a failure
+    """
+    def __init__(self, client, path, max_attempts=5, lease_seconds=300, retry_delay=30):
+        self.client = client
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+        with self._transaction() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS safebox_jobs ('
+                               'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                               'status TEXT NOT NULL, '
+                               'state TEXT NOT NULL, '
+                               'attempts INTEGER NOT NULL DEFAULT 0, '
+                               'error TEXT, '
+                               'worker TEXT, '
+                               'lease_expires REAL, '
+                               'updated_at REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS safebox_jobs_status ON safebox_jobs (status, lease_expires)')
+
+    """
+    Adds a safebox to the outbox. Attachments must be file paths, as streams cannot be persisted.
+
+    @param safebox:
+               A non-initialized Safebox object, as expected by Client.submit_safebox
+    @return: The id of the new job
+    """
+    def enqueue(self, safebox):
+        for attachment in safebox.attachments:
+            if type(attachment.source) != str:
+                raise SendSecureException(0, 'Only attachments with a file path source can be queued', '')
+        state = json.dumps(_dump_safebox(safebox))
+        with self._transaction() as connection:
+            cursor = connection.execute('INSERT INTO safebox_jobs (status, state, updated_at) VALUES (?, ?, ?)',
+                                        (OutboxJob.PENDING, state, time.time()))
+            return cursor.lastrowid
+
+    """
+    Retrieves a job of the outbox.
+
+    @param job_id:
+               The id of the job
+    @return: An OutboxJob object, or None if the job does not exist
+    """
+    def get_job(self, job_id):
+        with self._transaction() as connection:
+            row = connection.execute('SELECT id, status, attempts, error, state FROM safebox_jobs WHERE id = ?',
+                                     (job_id,)).fetchone()
+        return _load_job(row) if row else None
+
+    """
+    Counts the jobs of the outbox by status.
+
+    @return: A dict of job counts by status
+    """
+    def counts(self):
+        with self._transaction() as connection:
+            return dict(connection.execute('SELECT status, COUNT(*) FROM safebox_jobs GROUP BY status').fetchall())
+
+    """
+    Claims the next available job and submits its safebox, resuming from its last checkpoint.
+
+    @param worker_id:
+               A unique name of the calling worker (host, process and thread by default)
+    @return: The processed OutboxJob, or None if no job is available
+    """
+    def process_next(self, worker_id=None):
+        worker_id = worker_id or _default_worker_id()
+        job = self._claim(worker_id)
+        if job is None:
+            return None
+        try:
+            self._submit(job, worker_id)
+        except Exception as e:
+            self._fail(job, worker_id, e)
+        return job
+
+    """
+    Processes jobs until the outbox is empty (or forever).
+
+    @param worker_id:
+               A unique name of the calling worker (host, process and thread by default)
+    @param stop_when_empty:
+               Whether to return when no job is available instead of polling
+    @param poll_interval:
+               The number of seconds to wait between polls when no job is available
+    @return: The number of processed jobs
+    """
+    def run(self, worker_id=None, stop_when_empty=True, poll_interval=1.0):
+        processed = 0
+        while True:
+            job = self.process_next(worker_id)
+            if job is not None:
+                processed += 1
+            elif stop_when_empty:
+                return processed
+            else:
+                time.sleep(poll_interval)
+
+    def _submit(self, job, worker_id):
+        safebox = job.safebox
+        if job.status == OutboxJob.PENDING:
+            self.client.initialize_safebox(safebox)
+            job.status = OutboxJob.INITIALIZED
+            self._checkpoint(job, worker_id)
+        for attachment in safebox.attachments:
+            if attachment.guid is None:
+                self.client.upload_attachment(safebox, attachment)
+                self._checkpoint(job, worker_id)
+        if safebox.security_profile_id is None:
+            safebox.security_profile_id = self.client.get_default_security_profile(safebox.user_email).id
+        self.client.commit_safebox(safebox)
+        job.status = OutboxJob.COMMITTED
+        job.error = None
+        self._checkpoint(job, worker_id, release=True)
+
+    def _claim(self, worker_id):
+        now = time.time()
+        with self._transaction() as connection:
+            row = connection.execute('SELECT id, status, attempts, error, state FROM safebox_jobs '
+                                     'WHERE status IN (?, ?) AND (lease_expires IS NULL OR lease_expires < ?) '
+                                     'ORDER BY id LIMIT 1',
+                                     (OutboxJob.PENDING, OutboxJob.INITIALIZED, now)).fetchone()
+            if row is None:
+                return None
+            connection.execute('UPDATE safebox_jobs SET worker = ?, lease_expires = ?, updated_at = ? WHERE id = ?',
+                               (worker_id, now + self.lease_seconds, now, row[0]))
+        return _load_job(row)
+
+    def _checkpoint(self, job, worker_id, release=False):
+        now = time.time()
+        lease_expires = None if release else now + self.lease_seconds
+        with self._transaction() as connection:
+            cursor = connection.execute('UPDATE safebox_jobs SET status = ?, state = ?, error = ?, lease_expires = ?, '
+                                        'worker = ?, updated_at = ? WHERE id = ? AND worker = ?',
+                                        (job.status, json.dumps(_dump_safebox(job.safebox)), job.error, lease_expires,
+                                         None if release else worker_id, now, job.id, worker_id))
+            if cursor.rowcount == 0:
+                raise SendSecureException(0, 'The outbox job was claimed by another worker', '')
+
+    def _fail(self, job, worker_id, error):
+        job.attempts += 1
+        job.error = str(error)
+        failed_status = None
+        if job.attempts >= self.max_attempts:
+            failed_status = job.status = OutboxJob.FAILED
+        # the stage and state are left as they were last checkpointed
+        with self._transaction() as connection:
+            connection.execute('UPDATE safebox_jobs SET status = COALESCE(?, status), attempts = ?, error = ?, '
+                               'worker = NULL, lease_expires = ?, updated_at = ? WHERE id = ? AND worker = ?',
+                               (failed_status, job.attempts, job.error, time.time() + self.retry_delay,
+                                time.time(), job.id, worker_id))
+
+    @contextmanager
+    def _transaction(self):
+        # a short-lived connection per transaction keeps the outbox usable from any thread or process
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield connection
+            except:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+        finally:
+            connection.close()
+
+
+def _default_worker_id():
+    return '%s:%d:%d' % (socket.gethostname(), os.getpid(), threading.get_ident())
+
+
+def _dump_safebox(safebox):
+    state = dict((key, getattr(safebox, key, None)) for key in ('guid', 'upload_url', 'public_encryption_key', 'subject',
+        'message', 'security_profile_id', 'user_email', 'notification_language', 'email_notification_enabled'))
+    state['participants'] = [{ 'first_name': participant.first_name,
+                               'last_name': participant.last_name,
+                               'email': participant.email,
+                               'privileged': participant.privileged,
+                               'guest_options': participant.guest_options.to_dict() }
+                             for participant in safebox.participants]
+    state['security_options'] = safebox.security_options.to_dict()
+    state['attachments'] = [{ 'source': attachment.source,
+                              'content_type': attachment.content_type,
+                              'filename': attachment.filename,
+                              'size': attachment.size,
+                              'guid': attachment.guid }
+                            for attachment in safebox.attachments]
+    return state
+
+
+def _load_safebox(state):
+    attachments = state.pop('attachments')
+    safebox = Safebox(params=state)
+    for params in attachments:
+        attachment = Attachment(params)
+        attachment.guid = params['guid']
+        safebox.attachments.append(attachment)
+    return safebox
+
+
+def _load_job(row):
+    (job_id, status, attempts, error, state) = row
+    return OutboxJob(job_id, status, attempts, error, _load_safebox(json.loads(state)))
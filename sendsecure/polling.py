@@ -0,0 +1,353 @@
+import json
+import time
+import heapq
+import sqlite3
+import threading
+from contextlib import contextmanager
+from .helpers import *
+from .exceptions import *
+
+
+class PollResult:
+    """
+    PollResult object constructor.
+
+    @param safebox:
+               The polled Safebox object
+    @param messages:
+               The Message objects added since the previous poll
+    @param events:
+               The EventHistory objects added since the previous poll
+    @param error:
+               The exception raised while polling the safebox, None if the poll succeeded
+    """
+    def __init__(self, safebox, messages=None, events=None, error=None):
+        self.safebox = safebox
+        self.messages = messages or []
+        self.events = events or []
+        self.error = error
+
+    @property
+    def changed(self):
+        return bool(self.messages or self.events)
+
+
+class _Cursor:
+    """
+    High-water mark of a list ordered by a timestamp: the latest timestamp seen, and the keys of
+    the items seen with that timestamp (several items can share it).
+    """
+    def __init__(self, params=None):
+        params = params or {}
+        self.timestamp = params.get('timestamp')
+        self.keys = set(params.get('keys', []))
+
+    def advance(self, items, get_timestamp, get_key):
+        new_items = [item for item in items if self._is_new(get_timestamp(item), get_key(item))]
+        for item in new_items:
+            timestamp = get_timestamp(item)
+            if self.timestamp is None or timestamp > self.timestamp:
+                (self.timestamp, self.keys) = (timestamp, set())
+            if timestamp == self.timestamp:
+                self.keys.add(get_key(item))
+        return new_items
+
+    def to_dict(self):
+        return { 'timestamp': self.timestamp, 'keys': sorted(self.keys) }
+
+    def _is_new(self, timestamp, key):
+        if self.timestamp is None or timestamp > self.timestamp:
+            return True
+        return timestamp == self.timestamp and key not in self.keys
+
+
+class _WatchedSafebox:
+    def __init__(self, safebox, cursors, interval):
+        self.safebox = safebox
+        self.messages = _Cursor(cursors.get('messages'))
+        self.events = _Cursor(cursors.get('events'))
+        self.interval = interval
+        self.due = 0.0
+
+
+class SafeboxPoller:
+    """
+    SafeboxPoller object constructor. Polls the messages and event history of watched safeboxes
+    and only returns the items added since the previous poll, remembering a high-water mark per
+    safebox. Safeboxes with new activity are polled every min_interval seconds; the interval of
+    idle safeboxes grows by the backoff factor after each poll without news, up to max_interval.
+
+    @param client:
+               The Client object used to poll the safeboxes
+    @param min_interval:
+               The number of seconds between two polls of an active safebox
+    @param max_interval:
+               The maximum number of seconds between two polls of an idle safebox
+    @param backoff:
+               The factor applied to the interval of a safebox after a poll without news
+    """
+    def __init__(self, client, min_interval=30, max_interval=900, backoff=2.0):
+        self.client = client
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self._watched = {}
+        self._schedule = []
+        self._lock = threading.Lock()
+
+    """
+    Starts watching a safebox.
+
+    @param safebox:
+               A Safebox object
+    @param cursors:
+               The high-water marks of the safebox saved from cursors(), to resume after a restart
+    @param skip_existing:
+               Whether the items already in the safebox are skipped (only later items are returned)
+    """
+    def watch(self, safebox, cursors=None, skip_existing=False):
+        if safebox.guid is None:
+            raise SendSecureException(0, 'SafeBox GUID cannot be null', '')
+        watched = _WatchedSafebox(safebox, cursors or {}, self.min_interval)
+        if skip_existing and cursors is None:
+            self._poll(watched)
+            watched.due = time.monotonic() + watched.interval
+        with self._lock:
+            self._watched[safebox.guid] = watched
+            heapq.heappush(self._schedule, (watched.due, safebox.guid))
+
+    """
+    Stops watching a safebox.
+
+    @param safebox_guid:
+               The guid of the safebox
+    """
+    def unwatch(self, safebox_guid):
+        with self._lock:
+            self._watched.pop(safebox_guid, None)
+
+    """
+    Returns the high-water marks of every watched safebox, to be saved and given back to watch()
+    after a restart.
+
+    @return: A dict of json-serializable cursors by safebox guid
+    """
+    def cursors(self):
+        with self._lock:
+            return dict((guid, { 'messages': watched.messages.to_dict(), 'events': watched.events.to_dict() })
+                        for (guid, watched) in self._watched.items())
+
+    """
+    Returns the number of seconds before the next safebox is due, 0 if one is already due and
+    None if no safebox is watched.
+    """
+    def next_poll_in(self):
+        with self._lock:
+            self._discard_stale()
+            if not self._schedule:
+                return None
+            return max(self._schedule[0][0] - time.monotonic(), 0.0)
+
+    """
+    Polls the safeboxes that are due.
+
+    @return: A list of PollResult objects, one per polled safebox (with or without news)
+    """
+    def poll_due(self):
+        results = []
+        while True:
+            with self._lock:
+                self._discard_stale()
+                if not self._schedule or self._schedule[0][0] > time.monotonic():
+                    return results
+                (_, guid) = heapq.heappop(self._schedule)
+                watched = self._watched[guid]
+            result = self._poll(watched)
+            with self._lock:
+                if self._watched.get(guid) is watched:
+                    watched.due = time.monotonic() + watched.interval
+                    heapq.heappush(self._schedule, (watched.due, guid))
+            results.append(result)
+
+    """
+    Polls the due safeboxes until stopped, sleeping until the next one is due.
+
+    @param callback:
+               A callable receiving each PollResult with news or with an error
+    @param stop_event:
+               A threading.Event stopping the loop when set (runs forever if None)
+    """
+    def run(self, callback, stop_event=None):
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            for result in self.poll_due():
+                if result.changed or result.error is not None:
+                    callback(result)
+            delay = self.next_poll_in()
+            stop_event.wait(self.min_interval if delay is None else delay)
+
+    def _poll(self, watched):
+        try:
+            messages = list(self.client.iter_safebox_messages(watched.safebox))
+            events = list(self.client.iter_safebox_event_history(watched.safebox))
+        except Exception as e:
+            watched.interval = min(watched.interval * self.backoff, self.max_interval)
+            return PollResult(watched.safebox, error=e)
+        # the cursors only move once both lists were received
+        messages = watched.messages.advance(messages, _message_date, _message_key)
+        events = watched.events.advance(events, _event_date, _event_key)
+        if messages or events:
+            watched.interval = self.min_interval
+        else:
+            watched.interval = min(watched.interval * self.backoff, self.max_interval)
+        return PollResult(watched.safebox, messages, events)
+
+    def _discard_stale(self):
+        # entries of unwatched (or watched again) safeboxes are dropped lazily
+        while self._schedule:
+            (due, guid) = self._schedule[0]
+            watched = self._watched.get(guid)
+            if watched is not None and watched.due == due:
+                return
+            heapq.heappop(self._schedule)
+
+
+def _message_date(message):
+    return getattr(message, 'created_at', None) or ''
+
+
+def _message_key(message):
+    return str(getattr(message, 'id', None) or getattr(message, 'note', ''))
+
+
+def _event_date(event):
+    date = getattr(event, 'date', None)
+    return date if isinstance(date, str) else ''
+
+
+def _event_key(event):
+    return '%s|%s' % (getattr(event, 'type', ''), getattr(event, 'message', ''))
+
+
+class UnreadWatcher:
+    """
+    UnreadWatcher object constructor. Follows the unread safeboxes of the current user with the
+    'unread' status filter of the safebox list, so a single paginated list request replaces the
+    polling of every safebox, and reports the safeboxes that became unread or read since the
+    previous poll. Several processes can watch the same account: with a shared database path,
+    each transition is reported by only one of them.
+
+    @param client:
+               The Client object used to list the unread safeboxes
+    @param on_unread:
+               An optional callable receiving each Safebox object that became unread
+    @param on_read:
+               An optional callable receiving the guid of each safebox that is no longer unread
+    @param path:
+               The path of the SQLite database shared by the watching processes (optional)
+    @param per_page:
+               The number of safeboxes per list request
+    @param retention:
+               The number of seconds transitions are remembered in the shared database
+    """
+    def __init__(self, client, on_unread=None, on_read=None, path=None, per_page=100, retention=604800):
+        self.client = client
+        self.on_unread = on_unread
+        self.on_read = on_read
+        self.path = path
+        self.per_page = per_page
+        self.retention = retention
+        self.unread = {}
+        self._initialized = False
+        if path is not None:
+            with self._transaction() as connection:
+                connection.execute('CREATE TABLE IF NOT EXISTS unread_transitions ('
+                                   'key TEXT PRIMARY KEY, '
+                                   'created_at REAL NOT NULL)')
+
+    """
+    Lists the unread safeboxes and reports the transitions since the previous poll.
+
+    @param skip_existing:
+               Whether the safeboxes already unread at the first poll are not reported
+    @return: A tuple of the list of Safebox objects that became unread and the list of guids of
+             the safeboxes that are no longer unread (transitions reported by another process excluded)
+    """
+    def poll(self, skip_existing=False):
+        unread = {}
+        safeboxes = {}
+        url = None
+        while True:
+            result = self.client.get_safeboxes(url, { 'status': 'unread', 'per_page': self.per_page })
+            for safebox in result['safeboxes']:
+                unread[safebox.guid] = _unread_marker(safebox)
+                safeboxes[safebox.guid] = safebox
+            url = result.get('next_page_url')
+            if not url or not result['safeboxes']:
+                break
+        previous = self.unread
+        became_unread = [guid for (guid, marker) in unread.items() if previous.get(guid) != marker]
+        became_read = [guid for guid in previous if guid not in unread]
+        if skip_existing and not self._initialized:
+            became_unread = []
+        claimed = self._claim([('unread', guid, unread[guid]) for guid in became_unread] +
+                              [('read', guid, previous[guid]) for guid in became_read])
+        (self.unread, self._initialized) = (unread, True)
+        became_unread = [safeboxes[guid] for guid in became_unread if ('unread', guid, unread[guid]) in claimed]
+        became_read = [guid for guid in became_read if ('read', guid, previous[guid]) in claimed]
+        for safebox in became_unread:
+            if self.on_unread is not None:
+                self.on_unread(safebox)
+        for guid in became_read:
+            if self.on_read is not None:
+                self.on_read(guid)
+        return (became_unread, became_read)
+
+    """
+    Polls the unread safeboxes until stopped.
+
+    @param interval:
+               The number of seconds between two polls
+    @param stop_event:
+               A threading.Event stopping the loop when set (runs forever if None)
+    @param skip_existing:
+               Whether the safeboxes already unread at the first poll are not reported
+    """
+    def run(self, interval=30, stop_event=None, skip_existing=False):
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            self.poll(skip_existing)
+            stop_event.wait(interval)
+
+    def _claim(self, transitions):
+        if self.path is None or not transitions:
+            return set(transitions)
+        now = time.time()
+        claimed = set()
+        with self._transaction() as connection:
+            connection.execute('DELETE FROM unread_transitions WHERE created_at < ?', (now - self.retention,))
+            for transition in transitions:
+                cursor = connection.execute('INSERT OR IGNORE INTO unread_transitions (key, created_at) VALUES (?, ?)',
+                                            (json.dumps(transition), now))
+                if cursor.rowcount:
+                    claimed.add(transition)
+        return claimed
+
+    @contextmanager
+    def _transaction(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield connection
+            except:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+        finally:
+            connection.close()
+
+
+def _unread_marker(safebox):
+    # a safebox becoming unread again after new activity is a new transition
+    return getattr(safebox, 'latest_activity', None) or getattr(safebox, 'updated_at', None)
@@ -0,0 +1,118 @@
+import threading
+from collections import OrderedDict
+from . import utils
+from .utils import *
+from .transport import *
+from .client import *
+
+
+class ClientPool:
+    """
+    ClientPool object constructor. Hands out one Client per enterprise account and user, all
+    backed by a single ConnectionPool and a single cache of SendSecure endpoints, so sockets
+    and memory grow with the number of hosts rather than with the number of tenants and users.
+
+    @param options:
+               The options shared by all clients (endpoint, locale, lazy_hydration, transport...)
+    @param max_idle_per_host:
+               The maximum number of idle connections kept open per host
+    @param max_requests_per_tenant:
+               The maximum number of concurrent requests of the clients of an enterprise account
+               (unlimited if None)
+    @param max_clients:
+               The maximum number of clients kept, the least recently used ones being discarded
+               first (unlimited if None)
+    """
+    def __init__(self, options=None, max_idle_per_host=10, max_requests_per_tenant=None, max_clients=None):
+        self.options = dict(options or {})
+        self.max_requests_per_tenant = max_requests_per_tenant
+        self.max_clients = max_clients
+        self.connection_pool = ConnectionPool(max_idle_per_host, self.options.get('timeout'))
+        self._named_transport = None
+        if isinstance(self.options.get('transport'), str):
+            # a named transport is created once and shared by all clients
+            self._named_transport = create_transport(self.options['transport'])
+            self.options['transport'] = self._named_transport
+        self.endpoint_cache = {}
+        self._clients = OrderedDict()
+        self._limiters = {}
+        self._lock = threading.Lock()
+        utils._register_at_fork(self)
+
+    """
+    Returns the client of a user of an enterprise account, creating it on first use.
+
+    @param enterprise_account:
+               The SendSecure enterprise account
+    @param user_id:
+               The user id of the user
+    @param token:
+               The API Token of the user (replaces the token of an existing client when it changed)
+    @return: A Client object
+    """
+    def get(self, enterprise_account, user_id, token):
+        key = (enterprise_account, user_id)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = Client(dict(self.options,
+                                     enterprise_account=enterprise_account,
+                                     user_id=user_id,
+                                     token=token,
+                                     connection_pool=self.connection_pool,
+                                     endpoint_cache=self.endpoint_cache,
+                                     request_limiter=self._get_limiter(enterprise_account)))
+                self._clients[key] = client
+                if self.max_clients is not None and len(self._clients) > self.max_clients:
+                    self._clients.popitem(last=False)
+            else:
+                self._clients.move_to_end(key)
+                client.json_client.token = str(token)
+        return client
+
+    """
+    Discards the client of a user, e.g. when the user is deactivated.
+
+    @param enterprise_account:
+               The SendSecure enterprise account
+    @param user_id:
+               The user id of the user
+    """
+    def discard(self, enterprise_account, user_id):
+        with self._lock:
+            self._clients.pop((enterprise_account, user_id), None)
+
+    """
+    Discards all clients and closes the idle connections of the pool.
+    """
+    def close(self):
+        with self._lock:
+            self._clients.clear()
+        self.connection_pool.close()
+        if self._named_transport is not None:
+            self._named_transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._clients)
+
+    def _after_fork(self):
+        # the lock and the request slots of the tenants may have been held by threads of the parent
+        self._lock = threading.Lock()
+        self._limiters = {}
+        for ((enterprise_account, user_id), client) in self._clients.items():
+            limiter = self._get_limiter(enterprise_account)
+            if limiter is not None:
+                client.json_client.request_limiter = limiter
+
+    def _get_limiter(self, enterprise_account):
+        if self.max_requests_per_tenant is None:
+            return None
+        if enterprise_account not in self._limiters:
+            self._limiters[enterprise_account] = threading.BoundedSemaphore(self.max_requests_per_tenant)
+        return self._limiters[enterprise_account]
@@ -0,0 +1,210 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .helpers import *
+from .exceptions import *
+
+
+class FavoriteSyncAction:
+    """
+    FavoriteSyncAction object constructor.
+
+    @param type:
+               The action made on the favorite (create, update or delete)
+    @param favorite:
+               The Favorite object created, updated (with its pending changes) or deleted
+    @param changes:
+               The names of the changed fields of an updated favorite
+    """
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+
+    def __init__(self, type, favorite, changes=None):
+        self.type = type
+        self.favorite = favorite
+        self.changes = changes or []
+        self.error = None
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+
+class FavoriteSyncReport:
+    """
+    FavoriteSyncReport object constructor.
+
+    @param actions:
+               The FavoriteSyncAction objects of the plan, in the order of the desired favorites
+               (deletions last)
+    @param unchanged:
+               The number of favorites already matching the desired ones
+    @param dry_run:
+               Whether the actions were only planned
+    """
+    def __init__(self, actions, unchanged, dry_run):
+        self.actions = actions
+        self.unchanged = unchanged
+        self.dry_run = dry_run
+
+    @property
+    def created(self):
+        return [action for action in self.actions if action.type == FavoriteSyncAction.CREATE]
+
+    @property
+    def updated(self):
+        return [action for action in self.actions if action.type == FavoriteSyncAction.UPDATE]
+
+    @property
+    def deleted(self):
+        return [action for action in self.actions if action.type == FavoriteSyncAction.DELETE]
+
+    @property
+    def failed(self):
+        return [action for action in self.actions if action.error is not None]
+
+
+class _RateLimiter:
+    def __init__(self, max_requests_per_second):
+        self.interval = 1.0 / max_requests_per_second if max_requests_per_second else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class FavoriteSynchronizer:
+    """
+    FavoriteSynchronizer object constructor. Makes the favorites of the current user match a
+    desired address book with the fewest requests: the existing favorites are indexed by email,
+    only the missing, different and extra favorites are created, updated (changed fields and
+    contact methods only) and deleted.
+
+    @param client:
+               The Client object used to synchronize the favorites
+    @param workers:
+               The maximum number of concurrent requests
+    @param max_requests_per_second:
+               The maximum number of requests sent per second (unlimited if None)
+    @param delete_missing:
+               Whether the existing favorites missing from the desired ones are deleted
+    """
+    def __init__(self, client, workers=4, max_requests_per_second=None, delete_missing=True):
+        self.client = client
+        self.workers = workers
+        self.max_requests_per_second = max_requests_per_second
+        self.delete_missing = delete_missing
+
+    """
+    Computes the actions making the existing favorites match the desired ones, without sending them.
+    The existing favorites to update are changed in place: their pending changes are the update.
+
+    @param desired:
+               An iterable of Favorite objects (the favorites with the same email are matched,
+               ignoring case; None attributes are left unchanged)
+    @param existing:
+               The list of existing Favorite objects (retrieved with Client.get_favorites if None)
+    @return: A tuple of the list of FavoriteSyncAction objects and the number of unchanged favorites
+    """
+    def plan(self, desired, existing=None):
+        if existing is None:
+            existing = self.client.get_favorites()
+        index = {}
+        extra = []
+        for favorite in existing:
+            key = _email_key(favorite.email)
+            if key in index:
+                extra.append(favorite)
+            else:
+                index[key] = favorite
+
+        actions = []
+        unchanged = 0
+        seen = set()
+        for favorite in desired:
+            if favorite.email is None:
+                raise SendSecureException(0, 'Favorite email cannot be null', '')
+            key = _email_key(favorite.email)
+            if key in seen:
+                raise SendSecureException(0, 'Duplicate favorite email: ' + favorite.email, '')
+            seen.add(key)
+            current = index.pop(key, None)
+            if current is None:
+                actions.append(FavoriteSyncAction(FavoriteSyncAction.CREATE, favorite))
+            elif _apply(current, favorite):
+                actions.append(FavoriteSyncAction(FavoriteSyncAction.UPDATE, current, current.changed_fields()))
+            else:
+                unchanged += 1
+
+        if self.delete_missing:
+            actions.extend(FavoriteSyncAction(FavoriteSyncAction.DELETE, favorite)
+                           for favorite in list(index.values()) + extra)
+        return (actions, unchanged)
+
+    """
+    Makes the existing favorites match the desired ones. A failed action does not stop the others;
+    its exception is kept in the report.
+
+    @param desired:
+               An iterable of Favorite objects (see plan)
+    @param dry_run:
+               Whether the actions are only planned and reported, without any change
+    @return: A FavoriteSyncReport object
+    """
+    def sync(self, desired, dry_run=False):
+        (actions, unchanged) = self.plan(desired)
+        if not dry_run and actions:
+            limiter = _RateLimiter(self.max_requests_per_second)
+            with ThreadPoolExecutor(self.workers) as executor:
+                list(executor.map(lambda action: self._execute(action, limiter), actions))
+        return FavoriteSyncReport(actions, unchanged, dry_run)
+
+    def _execute(self, action, limiter):
+        limiter.wait()
+        try:
+            if action.type == FavoriteSyncAction.CREATE:
+                self.client.create_favorite(action.favorite)
+            elif action.type == FavoriteSyncAction.UPDATE:
+                self.client.update_favorite(action.favorite)
+            else:
+                self.client.delete_favorite(action.favorite)
+        except Exception as e:
+            action.error = e
+
+
+def _email_key(email):
+    # an existing favorite may have no email
+    return (email or '').strip().lower()
+
+
+def _contact_key(contact):
+    # contact methods returned by the server may omit their destination or destination type
+    return (getattr(contact, 'destination', None) or '', getattr(contact, 'destination_type', None) or '')
+
+
+def _apply(current, favorite):
+    # copies the desired attributes and contact methods into the existing favorite,
+    # returning whether it changed
+    for (key, value) in favorite.to_dict().items():
+        if key not in ('email', 'contact_methods') and current.__dict__.get(key) != value:
+            setattr(current, key, value)
+
+    desired_contacts = set(_contact_key(contact) for contact in favorite.contact_methods)
+    current_contacts = set(_contact_key(contact) for contact in current.contact_methods)
+    current.prepare_to_destroy_contact([contact.id for contact in current.contact_methods
+                                        if _contact_key(contact) not in desired_contacts])
+    for contact in favorite.contact_methods:
+        if _contact_key(contact) not in current_contacts:
+            current_contacts.add(_contact_key(contact))
+            current.contact_methods.append(ContactMethod({ 'destination': getattr(contact, 'destination', None),
+                                                           'destination_type': getattr(contact, 'destination_type', None) }))
+    return current.is_dirty()
@@ -0,0 +1,147 @@
+import os
+import json
+import threading
+import urllib.error
+from . import utils
+from .client import *
+from .exceptions import *
+
+
+class TokenManager:
+    """
+    TokenManager object constructor. Caches the API tokens returned by Client.get_user_token per
+    enterprise account, username and device id, so the login round-trips are only made when no
+    token is known or when the server rejects the cached one. Tokens can also be kept in an
+    encrypted file shared by several processes.
+
+    @param path:
+               The path of the token store file (tokens are only kept in memory if empty)
+    @param cipher:
+               The object encrypting the token store, with encrypt(bytes) and decrypt(bytes) methods,
+               e.g. a cryptography.fernet.Fernet object (required with a path)
+    """
+    def __init__(self, path=None, cipher=None):
+        if path is not None and cipher is None:
+            raise SendSecureException(0, 'A cipher is required to store tokens on disk', '')
+        self.path = path
+        self.cipher = cipher
+        self._tokens = {}
+        self._store_mtime = None
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        utils._register_at_fork(self)
+
+    """
+    Returns the API token of a user, from the cache or from Client.get_user_token.
+    The parameters are those of Client.get_user_token.
+
+    @return: The token details (token and user_id) of the user
+    """
+    def get_token(self, enterprise_account, username, password, device_id, device_name,
+        application_type='SendSecure Python', endpoint='https://portal.xmedius.com', one_time_password=''):
+        key = _token_key(enterprise_account, username, device_id)
+        with self._get_key_lock(key):
+            token = self._lookup(key)
+            if token is None:
+                token = Client.get_user_token(enterprise_account, username, password, device_id, device_name,
+                                              application_type, endpoint, one_time_password)
+                self._save(key, token)
+            return token
+
+    """
+    Forgets the cached API token of a user.
+
+    @param enterprise_account:
+            The SendSecure enterprise account
+    @param username:
+            The username of the user
+    @param device_id:
+            The unique ID of the device used to get the Token
+    @param token:
+            The rejected token; a different token cached in the meantime (e.g. by another process) is kept
+    """
+    def invalidate(self, enterprise_account, username, device_id, token=None):
+        key = _token_key(enterprise_account, username, device_id)
+        with self._get_key_lock(key):
+            self._save(key, None, token)
+
+    """
+    Calls function with the token details of a user. When the server rejects the token
+    (401 Unauthorized, as a SendSecureException or an urllib HTTPError), the token is invalidated
+    and the call is made once more with a new one.
+    The other parameters are those of Client.get_user_token.
+
+    @param function:
+            A callable receiving the token details (token and user_id)
+    @return: The value returned by function
+    """
+    def with_token(self, function, enterprise_account, username, password, device_id, device_name,
+        application_type='SendSecure Python', endpoint='https://portal.xmedius.com', one_time_password=''):
+        args = (enterprise_account, username, password, device_id, device_name, application_type, endpoint, one_time_password)
+        token = self.get_token(*args)
+        try:
+            return function(token)
+        except (SendSecureException, urllib.error.HTTPError) as e:
+            # HTTPError is raised by requests sent with urlopen
+            if e.code != 401:
+                raise
+        self.invalidate(enterprise_account, username, device_id, token['token'])
+        return function(self.get_token(*args))
+
+    def _after_fork(self):
+        # the locks may have been held by other threads of the parent
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _get_key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _lookup(self, key):
+        with self._lock:
+            if key not in self._tokens and self.path is not None:
+                self._reload()
+            return self._tokens.get(key)
+
+    def _save(self, key, token, replaced_token=None):
+        with self._lock:
+            if self.path is not None:
+                # merge the tokens saved by other processes before writing the store
+                self._reload()
+            current = self._tokens.get(key)
+            if token is None and replaced_token is not None and current is not None and current['token'] != replaced_token:
+                return
+            if token is None:
+                self._tokens.pop(key, None)
+            else:
+                self._tokens[key] = token
+            if self.path is not None:
+                self._write()
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._store_mtime:
+            return
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        try:
+            self._tokens = json.loads(self.cipher.decrypt(data).decode('utf-8'))
+        except Exception:
+            # a store encrypted with another key (or corrupted) is replaced on the next save
+            self._tokens = {}
+        self._store_mtime = mtime
+
+    def _write(self):
+        part_path = '%s.%d.part' % (self.path, os.getpid())
+        with open(part_path, 'wb') as f:
+            f.write(self.cipher.encrypt(json.dumps(self._tokens).encode('utf-8')))
+        os.chmod(part_path, 0o600)
+        os.replace(part_path, self.path)
+        self._store_mtime = os.stat(self.path).st_mtime_ns
+
+
+def _token_key(enterprise_account, username, device_id):
+    return json.dumps([enterprise_account, username, device_id])
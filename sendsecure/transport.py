@@ -0,0 +1,181 @@
+import ssl
+import socket
+import threading
+import urllib.error
+from urllib import request
+from . import utils
+from .utils import *
+from .exceptions import *
+
+try:
+    import urllib3
+except ImportError:
+    urllib3 = None
+
+try:
+    # h2 is the HTTP/2 implementation used by httpx
+    import h2
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class UrllibTransport:
+    """
+    UrllibTransport object constructor. Sends each request on a new connection with urlopen
+    (proxies configured in the environment are used).
+
+    A transport is any object with the request and close methods of this class; ConnectionPool
+    is the pooled transport of the standard library.
+    """
+    def __init__(self):
+        pass
+
+    """
+    Sends a request and reads the whole response.
+
+    @param method:
+               The HTTP method
+    @param url:
+               The URL of the request
+    @param body:
+               The body of the request (bytes), None if empty
+    @param headers:
+               A dict of request headers
+    @param timeout:
+               The socket timeout of the request in seconds (None for the global default)
+    @return: A tuple of the status code, the reason and the decoded body (also for error statuses)
+    """
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        req = request.Request(url, body, headers or {}, method=method)
+        try:
+            res = utils._urlopen(req, timeout)
+        except urllib.error.HTTPError as e:
+            with e:
+                return (e.code, e.reason, e.read().decode('utf-8'))
+        with res:
+            return (res.status, res.reason, res.read().decode('utf-8'))
+
+    """
+    Releases the connections of the transport.
+    """
+    def close(self):
+        pass
+
+
+class Urllib3Transport:
+    """
+    Urllib3Transport object constructor. Sends the requests on the persistent connections of a
+    urllib3 PoolManager (requires the urllib3 package). Connection errors are raised as
+    ConnectionError and timeouts as socket.timeout, as with the other transports.
+
+    @param max_idle_per_host:
+               The maximum number of connections kept open per host
+    @param block:
+               Whether a request waits for a connection of the host when max_idle_per_host are in
+               use (otherwise an extra connection is opened and discarded after use)
+    """
+    def __init__(self, max_idle_per_host=10, block=False):
+        if urllib3 is None:
+            raise SendSecureException(0, 'The urllib3 package is required by Urllib3Transport', '')
+        self._options = dict(maxsize=max_idle_per_host, block=block,
+                             cert_reqs='CERT_REQUIRED', ca_certs=utils._get_cacert_path())
+        self._manager = urllib3.PoolManager(**self._options)
+        utils._register_at_fork(self)
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        try:
+            response = self._manager.request(method, url, body=body, headers=headers or {},
+                                             timeout=urllib3.Timeout(connect=timeout, read=timeout),
+                                             retries=False, redirect=False)
+        except urllib3.exceptions.TimeoutError as e:
+            raise socket.timeout(str(e))
+        except urllib3.exceptions.HTTPError as e:
+            raise ConnectionError(str(e))
+        return (response.status, response.reason, response.data.decode('utf-8'))
+
+    def close(self):
+        self._manager.clear()
+
+    def _after_fork(self):
+        # the connections of the parent are left alone (their pool locks may be held)
+        self._manager = urllib3.PoolManager(**self._options)
+
+
+class Http2Transport:
+    """
+    Http2Transport object constructor. Sends the requests over HTTP/2 with httpx (requires the
+    httpx and h2 packages, e.g. pip install httpx[http2]): the concurrent requests to a host are
+    multiplexed as streams of a single connection instead of one connection (and TLS handshake)
+    each. Hosts not supporting HTTP/2 are reached over HTTP/1.1.
+
+    @param max_streams_per_host:
+               The maximum number of concurrent requests to a host; further requests wait for a
+               stream (servers usually accept 100 concurrent streams per connection)
+    @param max_connections:
+               The maximum number of connections of the transport, all hosts included
+    """
+    def __init__(self, max_streams_per_host=100, max_connections=10):
+        if httpx is None:
+            raise SendSecureException(0, 'The httpx and h2 packages are required by Http2Transport', '')
+        self.max_streams_per_host = max_streams_per_host
+        self.max_connections = max_connections
+        self._client = self._create_client()
+        self._streams = {}
+        self._lock = threading.Lock()
+        utils._register_at_fork(self)
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        with self._get_streams(urlparse(url).netloc):
+            try:
+                response = self._client.request(method, url, content=body, headers=headers or {}, timeout=timeout)
+            except httpx.TimeoutException as e:
+                raise socket.timeout(str(e))
+            except httpx.TransportError as e:
+                raise ConnectionError(str(e))
+        return (response.status_code, response.reason_phrase, response.content.decode('utf-8'))
+
+    def close(self):
+        self._client.close()
+
+    def _create_client(self):
+        # an explicit context: httpx < 0.28 disables the verification when verify is None
+        context = ssl.create_default_context(cafile=utils._get_cacert_path())
+        return httpx.Client(http2=True, verify=context,
+                            limits=httpx.Limits(max_connections=self.max_connections))
+
+    def _after_fork(self):
+        # closing the inherited client would send GOAWAY frames on the connections of the parent
+        self._client = self._create_client()
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def _get_streams(self, host):
+        with self._lock:
+            if host not in self._streams:
+                self._streams[host] = threading.BoundedSemaphore(self.max_streams_per_host)
+            return self._streams[host]
+
+
+_TRANSPORTS = {
+    'urllib': UrllibTransport,
+    'pooled': ConnectionPool,
+    'urllib3': Urllib3Transport,
+    'http2': Http2Transport,
+}
+
+
+"""
+Creates a transport from its name.
+
+@param name:
+           urllib (a new connection per request), pooled (ConnectionPool), urllib3 (Urllib3Transport),
+           http2 (Http2Transport) or best (urllib3 when installed, pooled otherwise)
+@return: A transport object
+"""
+def create_transport(name='best'):
+    if name == 'best':
+        name = 'pooled' if urllib3 is None else 'urllib3'
+    if name not in _TRANSPORTS:
+        raise SendSecureException(0, 'Unknown transport: ' + str(name), '')
+    return _TRANSPORTS[name]()
@@ -4,12 +4,42 @@ import sys
 
 import re
 import os
+import json
+import codecs
+import hashlib
 import platform
 import urllib
 import secrets
+import ssl
+import time
+import socket
+import weakref
+import threading
+import http.client
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from urllib import request
-from urllib.parse import urlparse, urlunparse
+from urllib.parse import urlparse, urlunparse, urlencode, quote
+
+from .exceptions import *
+
+_fork_sensitive = weakref.WeakSet()
+
+
+def _register_at_fork(obj):
+    # obj._after_fork() is called in the child process after os.fork()
+    _fork_sensitive.add(obj)
+
+
+def _after_fork_in_child():
+    for obj in list(_fork_sensitive):
+        obj._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
 
 def _get_cacert_path():
     if platform.system().lower() == 'windows':
@@ -29,6 +59,9 @@ def urljoin(parts, params=None):
     parsed_url[4] = '&'.join(url_params)
     return urlunparse(parsed_url)
 
+def encode_query(params):
+    return urlencode(params, safe='@:,/', quote_via=quote)
+
 def _get_http_status(status_lines):
     last_status_line = status_lines[0]
     for line in status_lines:
@@ -38,46 +71,390 @@ def _get_http_status(status_lines):
     m = re.match(r'HTTP\/\S*\s*\d+\s*(.*?)\s*$', last_status_line)
     return m.groups(1)[0] if m else ''
 
-def _request(url, method, accept, auth_token=None, body=''):
+class Deadline:
+    """
+    Time budget of an operation made of several requests. Each request gets the remaining time
+    as its timeout (or its own timeout when shorter), and no request is sent once it expired.
+
+    @param seconds:
+               The number of seconds from now after which the deadline expires
+    """
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    """
+    Returns the timeout of the next request, raising DeadlineExceededException if the deadline expired.
+
+    @param timeout:
+               The timeout of the request itself (None if unlimited)
+    """
+    def timeout(self, timeout=None):
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceededException(0, 'Deadline exceeded', '')
+        return remaining if timeout is None else min(timeout, remaining)
+
+
+def _urlopen(req, timeout=None):
+    if timeout is None:
+        return request.urlopen(req)
+    return request.urlopen(req, timeout=timeout)
+
+def _request(url, method, accept, auth_token=None, body='', pool=None, timeout=None):
+    if pool is not None:
+        headers = {'Content-type': "application/json", 'Accept': "application/json"}
+        if auth_token:
+            headers['authorization-token'] = auth_token
+        return pool.request(method, url, body.encode('utf8'), headers, timeout)
     req = request.Request(url, body.encode('utf8'), method=method)
     req.add_header('Content-type', "application/json")
     req.add_header('Accept', "application/json")
     if auth_token:
         req.add_header('authorization-token', auth_token)
-    res = request.urlopen(req);
+    res = _urlopen(req, timeout);
     content = res.read().decode('utf-8')
     return (res.status, res.reason, content)
 
 
-def http_get(url, accept="application/json", auth_token=None):
-    return _request(url, 'GET', accept, auth_token=auth_token)
+class ConnectionPool:
+    """
+    Thread-safe pool of persistent (keep-alive) HTTP connections, keyed by scheme, host and port,
+    so many clients talking to the same hosts reuse a handful of sockets instead of opening one
+    per request. Unlike urlopen, proxies configured in the environment are not used.
+    Also usable as the transport of a JsonClient (see UrllibTransport). A process forked while
+    the pool has idle connections starts with an empty pool: the sockets stay with the parent.
+
+    @param max_idle_per_host:
+               The maximum number of idle connections kept open per host
+    @param timeout:
+               The socket timeout in seconds of new connections (None for the global default)
+    """
+    def __init__(self, max_idle_per_host=10, timeout=None):
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._ssl_context = None
+        _register_at_fork(self)
+
+    """
+    Sends a request on an idle connection to the host of url (or a new one) and reads the whole
+    response. A request failing because the server closed an idle connection is sent again once
+    on a new connection.
+
+    @param timeout:
+               The socket timeout of the request (the timeout of the pool if None)
+    @return: A tuple of the status code, the reason and the decoded body
+    """
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        parsed = urlparse(url)
+        key = (parsed.scheme, parsed.hostname, parsed.port)
+        path = urlunparse(('', '', parsed.path or '/', parsed.params, parsed.query, ''))
+        timeout = self.timeout if timeout is None else timeout
+        while True:
+            (connection, reused) = self._acquire(key)
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+            try:
+                connection.request(method, path, body, headers or {})
+                response = connection.getresponse()
+                content = response.read()
+            except (ConnectionResetError, BrokenPipeError, http.client.BadStatusLine):
+                connection.close()
+                if reused:
+                    continue
+                raise
+            except:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(key, connection)
+            return (response.status, response.reason, content.decode('utf-8'))
+
+    """
+    Closes all the idle connections of the pool.
+    """
+    def close(self):
+        with self._lock:
+            (idle, self._idle) = (self._idle, {})
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def _after_fork(self):
+        # the lock may have been held by another thread of the parent; closing the inherited
+        # sockets only releases the descriptors of the child (nothing is sent to the server)
+        self._lock = threading.Lock()
+        (idle, self._idle) = (self._idle, {})
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def _acquire(self, key):
+        with self._lock:
+            connections = self._idle.get(key)
+            if connections:
+                return (connections.pop(), True)
+        (scheme, host, port) = key
+        if scheme == 'https':
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context(cafile=_get_cacert_path())
+            connection = http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self._ssl_context)
+        else:
+            connection = http.client.HTTPConnection(host, port, timeout=self.timeout)
+        return (connection, False)
+
+    def _release(self, key, connection):
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            if len(connections) < self.max_idle_per_host:
+                connections.append(connection)
+                return
+        connection.close()
+
+
+def http_get_stream(url, accept="application/json", auth_token=None, headers=None, timeout=None):
+    req = request.Request(url, method='GET')
+    req.add_header('Accept', accept)
+    if auth_token:
+        req.add_header('authorization-token', auth_token)
+    for (name, value) in (headers or {}).items():
+        req.add_header(name, value)
+    return _urlopen(req, timeout)
+
+
+def file_sha256(path, chunk_size=65536):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _get_range_total(response):
+    if response.status != 206:
+        return None
+    m = re.match(r'bytes\s+\d+-\d+/(\d+)', response.headers.get('Content-Range', ''))
+    return int(m.group(1)) if m else None
 
 
-def http_post(url, content_type, body, accept="application/json", auth_token=None):
-    return _request(url, 'POST', accept, body=body, auth_token=auth_token)
+def _open_file_stream(url, headers=None):
+    return http_get_stream(url, '*/*', headers=headers)
 
 
-def http_put(url, content_type, body, accept="application/json", auth_token=None):
-    return _request(url, 'PUT', accept, body=body, auth_token=auth_token)
+def _open_range(open_stream, url, start, end=''):
+    response = open_stream(url, {'Range': 'bytes=%d-%s' % (start, end)})
+    if response.status != 206:
+        response.close()
+        raise urllib.error.HTTPError(url, response.status, 'Range request not honored', response.headers, None)
+    return response
 
-def http_patch(url, content_type, body, accept="application/json", auth_token=None):
-    return _request(url, 'PATCH', accept, body=body, auth_token=auth_token)
 
-def http_delete(url, accept="application/json", auth_token=None):
-    return _request(url, 'DELETE', accept, auth_token=auth_token)
+class _ResumableStream:
+    """
+    A response stream of a whole file whose interrupted reads are resumed with a Range request
+    from the last byte read, up to retries times (only when the size of the file is known).
+    """
+    def __init__(self, open_stream, url, response, retries):
+        self.open_stream = open_stream
+        self.url = url
+        self.response = response
+        self.retries = retries
+        self.position = 0
+        self.total = _get_range_total(response)
+        if self.total is None and response.headers.get('Content-Length', '').isdigit():
+            self.total = int(response.headers['Content-Length'])
 
-def http_upload_filepath(url, filepath, content_type, alternate_filename = None):
+    def read(self, size):
+        attempt = 0
+        while True:
+            try:
+                if self.response is None:
+                    self.response = _open_range(self.open_stream, self.url, self.position)
+                chunk = self.response.read(size)
+                if not chunk and self.total is not None and self.position < self.total:
+                    raise http.client.IncompleteRead(b'', self.total - self.position)
+                self.position += len(chunk)
+                return chunk
+            except urllib.error.HTTPError:
+                raise
+            except (OSError, http.client.HTTPException):
+                if self.response is not None:
+                    self.response.close()
+                    self.response = None
+                attempt += 1
+                if attempt > self.retries or self.total is None:
+                    raise
+
+    def close(self):
+        if self.response is not None:
+            self.response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _download_range(open_stream, url, path, start, end, response, chunk_size, retries, cancelled):
+    position = start
+    attempt = 0
+    with open(path, 'r+b') as f:
+        while position <= end:
+            try:
+                if response is None:
+                    if cancelled.is_set():
+                        return
+                    response = _open_range(open_stream, url, position, end)
+                with response:
+                    f.seek(position)
+                    while position <= end:
+                        if cancelled.is_set():
+                            # another range failed, the download is abandoned
+                            return
+                        chunk = response.read(min(chunk_size, end - position + 1))
+                        if not chunk:
+                            raise http.client.IncompleteRead(b'', end - position + 1)
+                        f.write(chunk)
+                        position += len(chunk)
+            except urllib.error.HTTPError:
+                raise
+            except (OSError, http.client.HTTPException):
+                # resume the range from the last byte written
+                response = None
+                attempt += 1
+                if attempt > retries:
+                    raise
+
+
+def http_download(url, dest, max_workers=4, part_size=8388608, chunk_size=65536, retries=3, open_stream=None):
+    """
+    Downloads url to dest (see copy_stream). When dest is a file path and the server honors
+    Range requests, a file larger than part_size is split into ranges fetched concurrently by
+    up to max_workers connections and written in place into a pre-allocated file; an
+    interrupted range (or single stream, when the server honors Range requests) is resumed
+    from its last written byte, up to retries times, and a failed range cancels the others.
+    open_stream is the callable opening the response streams, called with the url and the
+    request headers (a plain GET without timeout by default).
+    Returns the number of bytes written and their SHA-256 hex digest.
+    """
+    open_stream = open_stream or _open_file_stream
+    if not isinstance(dest, (str, os.PathLike)) or max_workers < 2:
+        with _ResumableStream(open_stream, url, open_stream(url), retries) as stream:
+            return copy_stream(stream, dest, chunk_size)
+
+    try:
+        response = open_stream(url, {'Range': 'bytes=0-%d' % (part_size - 1)})
+    except urllib.error.HTTPError as e:
+        if e.code != 416:
+            raise
+        # empty files cannot satisfy any range
+        with _ResumableStream(open_stream, url, open_stream(url), retries) as stream:
+            return copy_stream(stream, dest, chunk_size)
+
+    with response:
+        total = _get_range_total(response)
+        if total is None or total <= part_size:
+            with _ResumableStream(open_stream, url, response, retries) as stream:
+                return copy_stream(stream, dest, chunk_size)
+
+        part_path = os.fspath(dest) + '.part'
+        cancelled = threading.Event()
+        try:
+            with open(part_path, 'wb') as f:
+                f.truncate(total)
+            with ThreadPoolExecutor(max_workers) as executor:
+                futures = [executor.submit(_download_range, open_stream, url, part_path, start,
+                                           min(start + part_size, total) - 1, response if start == 0 else None,
+                                           chunk_size, retries, cancelled)
+                           for start in range(0, total, part_size)]
+                try:
+                    for future in as_completed(futures):
+                        future.result()
+                except:
+                    cancelled.set()
+                    for future in futures:
+                        future.cancel()
+                    raise
+            os.replace(part_path, dest)
+        except:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+    return (total, file_sha256(dest, chunk_size))
+
+
+def copy_stream(source, dest, chunk_size=65536):
+    """
+    Copies the source stream in chunks to dest, which can be a file path (written atomically
+    through a temporary '.part' file), a writable file object or a callable receiving each chunk.
+    Returns the number of bytes written and their SHA-256 hex digest.
+    """
+    if isinstance(dest, (str, os.PathLike)):
+        part_path = os.fspath(dest) + '.part'
+        try:
+            with open(part_path, 'wb') as f:
+                result = copy_stream(source, f, chunk_size)
+            os.replace(part_path, dest)
+        except:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        return result
+
+    write = dest.write if hasattr(dest, 'write') else dest
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        write(chunk)
+        digest.update(chunk)
+        size += len(chunk)
+    return (size, digest.hexdigest())
+
+
+def http_get(url, accept="application/json", auth_token=None, pool=None, timeout=None):
+    return _request(url, 'GET', accept, auth_token=auth_token, pool=pool, timeout=timeout)
+
+
+def http_post(url, content_type, body, accept="application/json", auth_token=None, pool=None, timeout=None):
+    return _request(url, 'POST', accept, body=body, auth_token=auth_token, pool=pool, timeout=timeout)
+
+
+def http_put(url, content_type, body, accept="application/json", auth_token=None, pool=None, timeout=None):
+    return _request(url, 'PUT', accept, body=body, auth_token=auth_token, pool=pool, timeout=timeout)
+
+def http_patch(url, content_type, body, accept="application/json", auth_token=None, pool=None, timeout=None):
+    return _request(url, 'PATCH', accept, body=body, auth_token=auth_token, pool=pool, timeout=timeout)
+
+def http_delete(url, accept="application/json", auth_token=None, pool=None, timeout=None):
+    return _request(url, 'DELETE', accept, auth_token=auth_token, pool=pool, timeout=timeout)
+
+def http_upload_filepath(url, filepath, content_type, alternate_filename = None, timeout=None):
     filename = alternate_filename or os.path.basename(filepath)
     with open(filepath, 'rb') as filestream:
-        return http_upload_raw_stream(url, filestream, content_type, filename, 0)
+        return http_upload_raw_stream(url, filestream, content_type, filename, 0, timeout)
 
-def http_upload_raw_stream(url, stream, content_type, filename, filesize=0):
+def http_upload_raw_stream(url, stream, content_type, filename, filesize=0, timeout=None):
     try:
         (multipart, body) = make_file_multipart(filename, stream, content_type)
 
         req = request.Request(url, data=body, method='POST')
         req.add_header('Content-type', multipart)
-        res = request.urlopen(req)
+        res = _urlopen(req, timeout)
         return (res.status, res.reason, res.read().decode('utf-8'))
     except urllib.error.HTTPError as e:
         print(e.headers)  # Read the body of the error response
@@ -107,3 +484,104 @@ def get_part_header(name, filename, content_type):
     return ('Content-Disposition: form-data; '
             'name="{}"; filename="{}"\r\n'
             'Content-Type: {}\r\n\r\n').format(name, filename, content_type).encode('utf-8')
+
+
+class _JsonStreamReader:
+    """
+    Minimal pull reader over a byte stream containing a JSON document. Only the
+    data needed to decode the next value is kept in memory.
+    """
+    _decoder = json.JSONDecoder()
+    _whitespace = ' \t\n\r'
+
+    def __init__(self, stream, chunk_size):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            text = self.text_decoder.decode(b'', final=True)
+        elif isinstance(chunk, str):
+            text = chunk
+        else:
+            text = self.text_decoder.decode(chunk)
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in self._whitespace:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def next_char(self):
+        char = self.peek()
+        if not char:
+            raise json.JSONDecodeError('Unexpected end of JSON stream', self.buffer, self.pos)
+        self.pos += 1
+        return char
+
+    def expect(self, expected):
+        if self.next_char() != expected:
+            raise json.JSONDecodeError('Expecting ' + repr(expected), self.buffer, self.pos - 1)
+
+    def value(self):
+        while True:
+            self.peek()
+            try:
+                obj, end = self._decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # a number or literal ending exactly at the buffer boundary may be truncated
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return obj
+
+
+def iter_json_array(stream, key, chunk_size=65536):
+    """
+    Incrementally decodes the JSON object read from stream and yields, one by one, the
+    elements of the array found under the given top-level key. Other top-level values are
+    decoded and discarded.
+    """
+    reader = _JsonStreamReader(stream, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        name = reader.value()
+        reader.expect(':')
+        if name == key and reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.expect(']')
+            else:
+                while True:
+                    yield reader.value()
+                    separator = reader.next_char()
+                    if separator == ']':
+                        break
+                    if separator != ',':
+                        raise json.JSONDecodeError("Expecting ',' delimiter", reader.buffer, reader.pos - 1)
+        else:
+            reader.value()
+        separator = reader.next_char()
+        if separator == '}':
+            return
+        if separator != ',':
+            raise json.JSONDecodeError("Expecting ',' delimiter", reader.buffer, reader.pos - 1)
@@ -0,0 +1,141 @@
+from sendsecure import *
+import sendsecure.archive
+import io
+import os
+import shutil
+import hashlib
+import tempfile
+import unittest
+try:
+    from unittest.mock import Mock, patch
+except ImportError:
+    from mock import Mock, patch
+
+class TestArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.client = Client({ 'token': 'USER|489b3b1f-b411-428e-be5b-2abbace87689',
+                               'user_id': '123456',
+                               'enterprise_account': 'acme',
+                               'endpoint': 'https://awesome.portal' })
+        self.client.json_client.get_audit_record_url = Mock(side_effect=lambda guid: json.dumps({ 'url': 'https://fileserver/' + guid }))
+        self.client.json_client.get_audit_record_pdf_stream = Mock(side_effect=lambda url: io.BytesIO(self._pdf(url.split('/')[-1])))
+        self.safeboxes = [Safebox(params={ 'guid': 'safebox%d' % i, 'status': 'closed' }) for i in range(5)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _pdf(self, guid):
+        return ('%PDF-1.4 audit record of ' + guid).encode('utf-8')
+
+    def test_export_audit_records(self):
+        reports = []
+        report = self.client.export_audit_records(self.safeboxes, self.directory, workers=3, progress=reports.append)
+        self.assertEqual(report.completed, 5)
+        self.assertEqual(report.skipped, 0)
+        self.assertEqual(report.failed, [])
+        self.assertEqual(report.bytes, sum(len(self._pdf(sb.guid)) for sb in self.safeboxes))
+        self.assertEqual(len(reports), 5)
+        for safebox in self.safeboxes:
+            with open(os.path.join(self.directory, safebox.guid + '.pdf'), 'rb') as f:
+                self.assertEqual(f.read(), self._pdf(safebox.guid))
+        with open(os.path.join(self.directory, 'manifest.json')) as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest['safebox0']['sha256'], hashlib.sha256(self._pdf('safebox0')).hexdigest())
+
+    def test_export_audit_records_skips_exported_files(self):
+        self.client.export_audit_records(self.safeboxes[:3], self.directory)
+        with open(os.path.join(self.directory, 'safebox1.pdf'), 'wb') as f:
+            f.write(b'truncated')
+        report = self.client.export_audit_records(iter(self.safeboxes), self.directory)
+        self.assertIsNone(report.total)
+        self.assertEqual(report.skipped, 2)
+        self.assertEqual(report.completed, 3)
+        self.assertEqual(self.client.json_client.get_audit_record_pdf_stream.call_count, 6)
+
+    def test_export_audit_records_verifies_checksums(self):
+        self.client.export_audit_records(self.safeboxes[:1], self.directory)
+        with open(os.path.join(self.directory, 'safebox0.pdf'), 'r+b') as f:
+            f.write(b'X')
+        self.assertEqual(self.client.export_audit_records(self.safeboxes[:1], self.directory).skipped, 1)
+        self.assertEqual(self.client.export_audit_records(self.safeboxes[:1], self.directory, verify=True).completed, 1)
+
+    def test_export_audit_records_reports_failures(self):
+        self.safeboxes.append(Safebox(params={ 'guid': None }))
+        report = self.client.export_audit_records(self.safeboxes, self.directory)
+        self.assertEqual(report.completed, 5)
+        self.assertEqual(len(report.failed), 1)
+        self.assertIs(report.failed[0][0], self.safeboxes[-1])
+        self.assertEqual(report.processed, 6)
+
+    def test_manifest_journal_is_read_after_an_interruption(self):
+        self.client.export_audit_records(self.safeboxes[:1], self.directory)
+        manifest = sendsecure.archive._Manifest(self.directory)
+        manifest.add('safebox1', { 'filename': 'safebox1.pdf', 'size': 1, 'sha256': '' })
+        with open(manifest.journal_path, 'a') as f:
+            f.write('["safebox2", {"filen')
+        # the job is interrupted before close: the journal is not merged
+        manifest = sendsecure.archive._Manifest(self.directory)
+        self.assertEqual(sorted(manifest.entries), ['safebox0', 'safebox1'])
+        manifest.close()
+        self.assertFalse(os.path.exists(manifest.journal_path))
+        with open(os.path.join(self.directory, 'manifest.json')) as f:
+            self.assertEqual(sorted(json.load(f)), ['safebox0', 'safebox1'])
+
+
+    def _messages(self, guid):
+        documents = [{ 'id': guid + '-doc%d' % i, 'name': 'file%d.pdf' % i } for i in range(3)]
+        return { 'messages': [{ 'id': 1, 'documents': documents[:2] },
+                              { 'id': 2, 'documents': documents[1:] },
+                              { 'id': 3, 'documents': [] }] }
+
+    def _setup_documents(self):
+        self.client.json_client.get_safebox_messages_stream = Mock(side_effect=lambda guid: io.BytesIO(json.dumps(self._messages(guid)).encode('utf-8')))
+        self.client.json_client.get_file_url = Mock(side_effect=lambda safebox_guid, document_guid, user_email: json.dumps({ 'url': 'https://fileserver/' + document_guid }))
+        def download_document(url, dest, *args, **kwargs):
+            with open(dest, 'wb') as f:
+                f.write(url.encode('utf-8'))
+            return (len(url), hashlib.sha256(url.encode('utf-8')).hexdigest())
+        return download_document
+
+    def test_download_safebox_documents(self):
+        with patch('sendsecure.client.http_download', side_effect=self._setup_documents()):
+            report = self.client.download_safebox_documents(self.safeboxes[:2], self.directory, workers=2)
+        self.assertEqual(report.completed, 6)
+        self.assertEqual(report.failed, [])
+        self.assertEqual(self.client.json_client.get_file_url.call_count, 6)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.directory, 'safebox1'))),
+                         ['safebox1-doc0-file0.pdf', 'safebox1-doc1-file1.pdf', 'safebox1-doc2-file2.pdf'])
+        with open(os.path.join(self.directory, 'safebox1', 'safebox1-doc2-file2.pdf'), 'rb') as f:
+            self.assertEqual(f.read(), b'https://fileserver/safebox1-doc2')
+        with open(os.path.join(self.directory, 'manifest.json')) as f:
+            self.assertEqual(len(json.load(f)), 6)
+
+    def test_download_safebox_documents_skips_downloaded_files(self):
+        with patch('sendsecure.client.http_download', side_effect=self._setup_documents()) as http_download:
+            self.client.download_safebox_documents(self.safeboxes[:1], self.directory)
+            report = self.client.download_safebox_documents(self.safeboxes[:2], self.directory)
+        self.assertEqual(report.skipped, 3)
+        self.assertEqual(report.completed, 3)
+        self.assertEqual(http_download.call_count, 6)
+
+    def test_download_safebox_documents_reports_failures(self):
+        download_document = self._setup_documents()
+        def get_messages_stream(guid):
+            if guid == 'safebox1':
+                raise SendSecureException(404, 'Not Found', '')
+            return io.BytesIO(json.dumps(self._messages(guid)).encode('utf-8'))
+        self.client.json_client.get_safebox_messages_stream = Mock(side_effect=get_messages_stream)
+        with patch('sendsecure.client.http_download', side_effect=download_document):
+            report = self.client.download_safebox_documents(self.safeboxes[:3], self.directory)
+        self.assertEqual(report.completed, 6)
+        self.assertEqual(len(report.failed), 1)
+        ((safebox, document), error) = report.failed[0]
+        self.assertIs(safebox, self.safeboxes[1])
+        self.assertIsNone(document)
+        self.assertEqual(error.message, 'Not Found')
+
+
+if __name__ == '__main__':
+    unittest.main()
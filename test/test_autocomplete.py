@@ -0,0 +1,78 @@
+from sendsecure import *
+import threading
+import unittest
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
+class TestRecipientIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Client({ 'token': 'USER|489b3b1f-b411-428e-be5b-2abbace87689',
+                               'user_id': '123456',
+                               'enterprise_account': 'acme',
+                               'endpoint': 'https://awesome.portal' })
+        self.client.json_client.get_favorites = Mock(return_value=json.dumps({ 'favorites': [
+            { 'id': 1, 'email': 'john.smith@example.com', 'first_name': 'John', 'last_name': 'Smith', 'company_name': 'Acme Inc' },
+            { 'id': 2, 'email': 'jane.doe@example.com', 'first_name': 'Jane', 'last_name': 'Doe' }] }))
+        self.client.json_client.search_recipient = Mock(return_value=json.dumps({ 'results': [
+            { 'id': 7, 'type': 'user', 'email': 'johanna.user@example.com', 'first_name': 'Johanna', 'last_name': 'User', 'company_name': '' },
+            { 'id': 9, 'type': 'user', 'email': 'john.smith@example.com', 'first_name': 'John', 'last_name': 'Smith', 'company_name': '' }] }))
+        self.index = RecipientIndex(self.client, debounce=0.01)
+
+    def tearDown(self):
+        self.index.stop()
+
+    def test_search_matches_prefixes_of_emails_and_names(self):
+        self.index.refresh()
+        self.assertEqual([r['email'] for r in self.index.search('jo')], ['john.smith@example.com'])
+        self.assertEqual([r['email'] for r in self.index.search('DOE')], ['jane.doe@example.com'])
+        self.assertEqual([r['email'] for r in self.index.search('acme')], ['john.smith@example.com'])
+        self.assertEqual([r['email'] for r in self.index.search('john  sm')], ['john.smith@example.com'])
+        self.assertEqual([r['email'] for r in self.index.search('j', limit=1)], ['jane.doe@example.com'])
+        self.assertEqual(self.index.search('x'), [])
+        self.assertEqual(self.index.search(' '), [])
+        self.client.json_client.search_recipient.assert_not_called()
+
+    def test_refresh_removes_deleted_favorites(self):
+        self.index.refresh()
+        self.client.json_client.get_favorites = Mock(return_value=json.dumps({ 'favorites': [] }))
+        self.index.refresh()
+        self.assertEqual(self.index.search('j'), [])
+
+    def test_suggest_searches_once_after_debounce(self):
+        self.index.refresh()
+        done = threading.Event()
+        received = []
+        def callback(term, results):
+            received.append((term, [r['email'] for r in results]))
+            done.set()
+        for term in ('jo', 'joh'):
+            self.assertEqual([r['email'] for r in self.index.suggest(term, callback)], ['john.smith@example.com'])
+        self.assertTrue(done.wait(2))
+        self.client.json_client.search_recipient.assert_called_once_with('joh')
+        # a search result never replaces a favorite
+        self.assertEqual(received, [('joh', ['john.smith@example.com', 'johanna.user@example.com'])])
+        self.assertEqual(self.index.search('john')[0]['type'], 'favorite')
+        self.index.suggest('johx', callback)
+        self.index.suggest('joh', callback)
+        self.assertIsNone(self.index._timer)
+
+    def test_suggest_skips_search_when_enough_local_results(self):
+        self.index.refresh()
+        self.index.suggest('j', limit=2)
+        self.assertIsNone(self.index._timer)
+
+    def test_background_refresh(self):
+        self.index.start(interval=60)
+        for _ in range(200):
+            if self.index.search('jane'):
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual([r['email'] for r in self.index.search('jane')], ['jane.doe@example.com'])
+        self.index.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
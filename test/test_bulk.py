@@ -0,0 +1,87 @@
+from sendsecure import *
+import threading
+import unittest
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
+class TestBulkSubmitter(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Client({ 'token': 'USER|489b3b1f-b411-428e-be5b-2abbace87689',
+                               'user_id': '123456',
+                               'enterprise_account': 'acme',
+                               'endpoint': 'https://awesome.portal' })
+        self.client.json_client.get_enterprise_settings = Mock(return_value=json.dumps({ 'default_security_profile_id': 10 }))
+        self.client.json_client.get_security_profiles = Mock(return_value=json.dumps({ 'security_profiles': [{ 'id': 5 }, { 'id': 10 }] }))
+        self.client.json_client.new_safebox = Mock(side_effect=lambda user_email: json.dumps({ 'guid': 'guid-' + user_email,
+                                                                                                'public_encryption_key': 'key',
+                                                                                                'upload_url': 'upload_url' }))
+        self.client.json_client.upload_file = Mock(side_effect=lambda url, source, *args: json.dumps({ 'temporary_document': { 'document_guid': 'doc-' + source } }))
+        self.client.json_client.commit_safebox = Mock(side_effect=lambda safebox_json: json.dumps({ 'guid': json.loads(safebox_json)['safebox']['guid'],
+                                                                                                     'status': 'in_progress' }))
+
+    def _safebox(self, user_email, attachments=2):
+        safebox = Safebox(user_email=user_email)
+        safebox.participants.append(Participant(email='recipient@test.xmedius.com'))
+        for i in range(attachments):
+            safebox.attachments.append(Attachment({ 'source': user_email + '-' + str(i) + '.pdf' }))
+        return safebox
+
+    def test_submit(self):
+        safeboxes = [self._safebox('user%d@acme.com' % (i % 3), attachments=i % 3) for i in range(10)]
+        results = list(BulkSubmitter(self.client).submit(safeboxes))
+        self.assertEqual(sorted(result.index for result in results), list(range(10)))
+        for result in results:
+            self.assertTrue(result.succeeded)
+            self.assertIs(result.item, safeboxes[result.index])
+            self.assertEqual(result.item.status, 'in_progress')
+            self.assertEqual(result.item.security_profile_id, 10)
+            self.assertEqual([a.guid for a in result.item.attachments], ['doc-' + a.source for a in result.item.attachments])
+        self.assertEqual(self.client.json_client.new_safebox.call_count, 10)
+        self.assertEqual(self.client.json_client.commit_safebox.call_count, 10)
+        self.assertEqual(self.client.json_client.get_security_profiles.call_count, 3)
+
+    def test_submit_reports_failures_without_aborting(self):
+        def upload_file(url, source, *args):
+            if source.startswith('bad'):
+                raise SendSecureException(500, 'Upload failed', '')
+            return json.dumps({ 'temporary_document': { 'document_guid': 'doc-' + source } })
+        self.client.json_client.upload_file = Mock(side_effect=upload_file)
+        safeboxes = [self._safebox('good@acme.com'), self._safebox('bad@acme.com'), self._safebox('good2@acme.com')]
+        results = sorted(self.client.submit_safeboxes(safeboxes), key=lambda result: result.index)
+        self.assertEqual([result.succeeded for result in results], [True, False, True])
+        self.assertEqual(results[1].error.message, 'Upload failed')
+        self.assertEqual(self.client.json_client.commit_safebox.call_count, 2)
+
+    def test_submit_applies_backpressure(self):
+        started = []
+        def new_safebox(user_email):
+            started.append(user_email)
+            return json.dumps({ 'guid': 'guid-' + user_email, 'upload_url': 'upload_url' })
+        self.client.json_client.new_safebox = Mock(side_effect=new_safebox)
+        results = BulkSubmitter(self.client, max_pending=2).submit(self._safebox('user%d@acme.com' % i, 0) for i in range(10))
+        next(results)
+        self.assertLessEqual(len(started), 3)
+        self.assertEqual(len(list(results)), 9)
+        self.assertEqual(len(started), 10)
+
+    def test_submit_overlaps_stages(self):
+        committing = threading.Event()
+        def new_safebox(user_email):
+            if user_email == 'second@acme.com':
+                # the second safebox can only be initialized while the first one is being committed
+                self.assertTrue(committing.wait(5))
+            return json.dumps({ 'guid': 'guid-' + user_email, 'upload_url': 'upload_url' })
+        def commit_safebox(safebox_json):
+            committing.set()
+            return json.dumps({ 'guid': json.loads(safebox_json)['safebox']['guid'] })
+        self.client.json_client.new_safebox = Mock(side_effect=new_safebox)
+        self.client.json_client.commit_safebox = Mock(side_effect=commit_safebox)
+        results = list(BulkSubmitter(self.client).submit([self._safebox('first@acme.com'), self._safebox('second@acme.com')]))
+        self.assertTrue(all(result.succeeded for result in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+from sendsecure import *
+import sendsecure.utils
+import socket
+import unittest
+try:
+    from unittest.mock import Mock, patch
+except ImportError:
+    from mock import Mock, patch
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = patch('sendsecure.circuit.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.changes = []
+        self.breaker = CircuitBreaker(failure_rate=0.5, minimum_requests=4, window=10, reset_timeout=30,
+                                      on_state_change=lambda *change: self.changes.append(change))
+
+    def _requests(self, outcomes, host='portal'):
+        for succeeded in outcomes:
+            self.breaker.before_request(host)
+            if succeeded:
+                self.breaker.record_success(host)
+            else:
+                self.breaker.record_failure(host)
+
+    def test_opens_above_failure_rate(self):
+        self._requests([False, True, False])
+        self.assertEqual(self.breaker.state('portal'), CircuitBreaker.CLOSED)
+        self._requests([False])
+        self.assertEqual(self.breaker.state('portal'), CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.state('other'), CircuitBreaker.CLOSED)
+        with self.assertRaises(CircuitOpenException):
+            self.breaker.before_request('portal')
+        self.breaker.before_request('other')
+        self.assertEqual(self.changes, [('portal', CircuitBreaker.CLOSED, CircuitBreaker.OPEN)])
+
+    def test_failures_outside_window_are_forgotten(self):
+        self._requests([False, False, False])
+        self.now += 11
+        self._requests([True, True, False])
+        self.assertEqual(self.breaker.state('portal'), CircuitBreaker.CLOSED)
+
+    def test_half_open_probe_closes_circuit(self):
+        self._requests([False] * 4)
+        self.now += 30
+        self.breaker.before_request('portal')
+        self.assertEqual(self.breaker.state('portal'), CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(CircuitOpenException):
+            self.breaker.before_request('portal')
+        self.breaker.record_success('portal')
+        self.assertEqual(self.breaker.states(), { 'portal': CircuitBreaker.CLOSED })
+        self.assertEqual([change[2] for change in self.changes], [CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN, CircuitBreaker.CLOSED])
+
+    def test_half_open_probe_failure_reopens_circuit(self):
+        self._requests([False] * 4)
+        self.now += 30
+        self._requests([False])
+        self.assertEqual(self.breaker.state('portal'), CircuitBreaker.OPEN)
+        self.now += 29
+        with self.assertRaises(CircuitOpenException):
+            self.breaker.before_request('portal')
+
+    def test_state_is_reset_after_fork(self):
+        self._requests([False] * 4)
+        self.now += 30
+        self.breaker.before_request('portal')
+        self.breaker._lock.acquire()
+        sendsecure.utils._after_fork_in_child()
+        self.assertTrue(self.breaker._lock.acquire(False))
+        self.breaker._lock.release()
+        # the probe of the parent is never recorded in the child
+        self.breaker.before_request('portal')
+        self.assertEqual(self.breaker.state('portal'), CircuitBreaker.HALF_OPEN)
+
+    def test_json_client_integration(self):
+        client = JsonClient({ 'token': 'USER|489b3b1f-b411-428e-be5b-2abbace87689',
+                              'user_id': '123456',
+                              'enterprise_account': 'acme',
+                              'endpoint': 'https://awesome.portal',
+                              'circuit_breaker': self.breaker })
+        client.sendsecure_endpoint = 'https://awesome.sendsecure.portal/'
+        responses = [(503, 'Service Unavailable', ''), (404, 'Not Found', ''), socket.timeout('timed out')]
+        with patch('sendsecure.json_client.http_get', side_effect=responses) as http_get:
+            for i in range(3):
+                with self.assertRaises(SendSecureException):
+                    client.get_user_settings()
+            self.assertEqual(self.breaker.state('awesome.sendsecure.portal'), CircuitBreaker.CLOSED)
+        with patch('sendsecure.json_client.http_get', side_effect=ConnectionRefusedError()) as http_get:
+            with self.assertRaises(ConnectionRefusedError):
+                client.get_user_settings()
+            self.assertEqual(self.breaker.state('awesome.sendsecure.portal'), CircuitBreaker.OPEN)
+            with self.assertRaises(CircuitOpenException):
+                client.get_user_settings()
+            self.assertEqual(http_get.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
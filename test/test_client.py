@@ -1,9 +1,11 @@
 from sendsecure import *
+import io
+import hashlib
 import unittest
 try:
-    from unittest.mock import Mock
+    from unittest.mock import Mock, patch, ANY
 except ImportError:
-    from mock import Mock
+    from mock import Mock, patch, ANY
 
 class TestClient(unittest.TestCase):
     client = Client({ 'token': 'USER|489b3b1f-b411-428e-be5b-2abbace87689',
@@ -276,6 +278,24 @@ class TestClient(unittest.TestCase):
         self.assertEqual(favorite.contact_methods[0].created_at, '2017-04-28T17:14:55.304Z')
         self.assertEqual(favorite.contact_methods[0].updated_at, '2017-04-28T17:14:55.304Z')
 
+    def test_update_favorite_sends_all_fields_of_caller_built_favorite(self):
+        favorite = Favorite(params={ 'id': 456, 'email': 'a@b.com', 'first_name': 'New', 'company_name': 'NewCo' })
+        self.client.json_client.update_favorite = Mock(return_value=json.dumps({ 'id': 456, 'email': 'a@b.com' }))
+        self.client.update_favorite(favorite)
+        payload = json.loads(self.client.json_client.update_favorite.call_args[0][1])
+        self.assertEqual(payload['favorite']['first_name'], 'New')
+        self.assertEqual(payload['favorite']['company_name'], 'NewCo')
+
+    def test_update_retrieved_favorite_sends_changes_only(self):
+        self.client.json_client.get_favorites = Mock(return_value=json.dumps({ 'favorites': [
+            { 'id': 456, 'email': 'a@b.com', 'first_name': 'Old', 'company_name': 'Acme',
+              'contact_methods': [{ 'id': 1, 'destination': '+15145550000', 'destination_type': 'office_phone' }] }] }))
+        favorite = self.client.get_favorites()[0]
+        favorite.first_name = 'New'
+        self.client.json_client.update_favorite = Mock(return_value=json.dumps({ 'id': 456, 'email': 'a@b.com', 'first_name': 'New' }))
+        self.client.update_favorite(favorite)
+        self.client.json_client.update_favorite.assert_called_once_with(456, json.dumps({ 'favorite': { 'email': 'a@b.com', 'first_name': 'New' } }, sort_keys=True))
+
     def test_update_favorite_should_fail_when_id_is_missing(self):
         favorite = Favorite(params=json.dumps({ 'email': 'john.smith@example.com',
                                                 'id': None,
@@ -439,6 +459,47 @@ class TestClient(unittest.TestCase):
             self.client.create_participant(sb, participant)
         self.assertIn('SafeBox GUID cannot be null', context.exception.message)
 
+    def _participants_safebox(self):
+        return Safebox(params={ 'guid': '1c820789a50747df8746aa5d71922a3f',
+                                'participants': [{ 'id': 'p0', 'email': 'existing@example.com' }] })
+
+    def test_bulk_create_participants(self):
+        safebox = self._participants_safebox()
+        def create_participant(safebox_guid, participant_json):
+            email = json.loads(participant_json)['participant']['email']
+            if email == 'failing@example.com':
+                raise SendSecureException(422, 'Invalid participant', '')
+            return json.dumps({ 'id': 'id-' + email, 'email': email })
+        self.client.json_client.create_participant = Mock(side_effect=create_participant)
+        participants = [Participant(email='guest%d@example.com' % i) for i in range(20)]
+        participants[3] = Participant(email='failing@example.com')
+        participants[5] = Participant()
+        participants[7] = Participant(email='EXISTING@example.com')
+        participants[9] = Participant(email='guest0@example.com')
+        results = self.client.bulk_create_participants(safebox, participants, workers=4)
+        self.assertEqual([result.index for result in results], list(range(20)))
+        self.assertEqual([result.index for result in results if not result.succeeded], [3, 5, 7, 9])
+        self.assertEqual(results[3].error.code, 422)
+        self.assertIn('email cannot be null', results[5].error.message)
+        self.assertIn('already in the safebox', results[7].error.message)
+        self.assertEqual(self.client.json_client.create_participant.call_count, 17)
+        self.assertEqual([participant.email for participant in safebox.participants],
+                         ['existing@example.com'] + ['guest%d@example.com' % i for i in range(20) if i not in (3, 5, 7, 9)])
+        self.assertEqual(safebox.participants[1].id, 'id-guest0@example.com')
+
+    def test_bulk_update_participants(self):
+        safebox = self._participants_safebox()
+        self.client.json_client.update_participant = Mock(side_effect=lambda safebox_guid, participant_id, participant_json:
+                                                          json.dumps(dict(json.loads(participant_json)['participant'], id=participant_id)))
+        updated = Participant().update_attributes({ 'id': 'p0', 'email': 'existing@example.com', 'first_name': 'Old' })
+        updated.first_name = 'New'
+        results = self.client.bulk_update_participants(safebox, [updated, Participant(email='new@example.com')])
+        self.assertTrue(results[0].succeeded)
+        self.assertIn('id cannot be null', results[1].error.message)
+        self.client.json_client.update_participant.assert_called_once_with('1c820789a50747df8746aa5d71922a3f', 'p0',
+            json.dumps({ 'participant': { 'email': 'existing@example.com', 'first_name': 'New' } }, sort_keys=True))
+        self.assertIs(safebox.participants[0], updated)
+
     def test_update_participant(self):
         participant = Participant(params=json.dumps({ 'id': '7a3c51e00a004917a8f5db807180fcc5',
                                                       'first_name': '',
@@ -869,6 +930,45 @@ class TestClient(unittest.TestCase):
             self.client.get_audit_record_url(sb)
         self.assertIn('SafeBox GUID cannot be null', context.exception.message)
 
+    def test_download_audit_record(self):
+        pdf = b'%PDF-1.4\n\xe2\xe3\xcf\xd3' * 1000
+        self.client.json_client.get_audit_record_url = Mock(return_value=json.dumps({ 'url': 'https://fileserver/audit.pdf' }))
+        self.client.json_client.get_audit_record_pdf_stream = Mock(return_value=io.BytesIO(pdf))
+        dest = io.BytesIO()
+        (size, checksum) = self.client.download_audit_record(self.safebox, dest, chunk_size=1024)
+        self.client.json_client.get_audit_record_pdf_stream.assert_called_once_with('https://fileserver/audit.pdf')
+        self.assertEqual(dest.getvalue(), pdf)
+        self.assertEqual(size, len(pdf))
+        self.assertEqual(checksum, hashlib.sha256(pdf).hexdigest())
+
+    def test_download_audit_record_to_callback(self):
+        self.client.json_client.get_audit_record_url = Mock(return_value=json.dumps({ 'url': 'https://fileserver/audit.pdf' }))
+        self.client.json_client.get_audit_record_pdf_stream = Mock(return_value=io.BytesIO(b'0123456789'))
+        chunks = []
+        (size, checksum) = self.client.download_audit_record(self.safebox, chunks.append, chunk_size=4)
+        self.assertEqual(chunks, [b'0123', b'4567', b'89'])
+        self.assertEqual(size, 10)
+
+    def test_download_audit_record_should_fail_when_safebox_GUID_is_missing(self):
+        sb = Safebox(params=json.dumps({ 'guid': None }))
+        with self.assertRaises(SendSecureException) as context:
+            self.client.download_audit_record(sb, io.BytesIO())
+        self.assertIn('SafeBox GUID cannot be null', context.exception.message)
+
+    def test_download_document(self):
+        self.client.json_client.get_file_url = Mock(return_value=json.dumps({ 'url': 'https://fileserver/document' }))
+        with patch('sendsecure.client.http_download', return_value=(10, 'checksum')) as http_download:
+            document = Document({ 'id': '97334293-23c2-4c94-8cee-369ddfabb678', 'name': 'Test file.pdf' })
+            result = self.client.download_document(self.safebox, document, '/tmp/document.pdf', part_size=1024)
+        self.client.json_client.get_file_url.assert_called_once_with(self.safebox.guid, document.guid, self.safebox.user_email)
+        http_download.assert_called_once_with('https://fileserver/document', '/tmp/document.pdf', 4, 1024, retries=3, open_stream=ANY)
+        self.assertEqual(result, (10, 'checksum'))
+
+    def test_download_document_should_fail_when_document_GUID_is_missing(self):
+        with self.assertRaises(SendSecureException) as context:
+            self.client.download_document(self.safebox, Document({ 'name': 'Test file.pdf' }), io.BytesIO())
+        self.assertIn('Document GUID cannot be null', context.exception.message)
+
     def test_get_safeboxes(self):
         expected_response = json.dumps({ 'count': 2,
                                          'previous_page_url': None,
@@ -1110,12 +1210,41 @@ class TestClient(unittest.TestCase):
         self.assertEqual(len(result[0].documents), 1)
         self.assertEqual(result[0].documents[0].id, '5a3df276aaa24e43af5aca9b2204a535')
 
+    def test_iter_safebox_messages(self):
+        expected_response = json.dumps({ 'messages': [
+                                             { 'note': 'Lorem Ipsum...', 'documents': [{ 'id': '5a3df276aaa24e43af5aca9b2204a535' }] },
+                                             { 'note': 'Dolor sit amet', 'documents': [] }]
+                                       })
+        self.client.json_client.get_safebox_messages_stream = Mock(return_value=io.BytesIO(expected_response.encode('utf-8')))
+        result = self.client.iter_safebox_messages(self.safebox)
+        first = next(result)
+        self.assertIsInstance(first, Message)
+        self.assertEqual(first.documents[0].id, '5a3df276aaa24e43af5aca9b2204a535')
+        self.assertEqual([message.note for message in result], ['Dolor sit amet'])
+        self.client.json_client.get_safebox_messages_stream.assert_called_once_with(self.safebox.guid)
+
     def test_get_safebox_messages_should_fail_when_safebox_GUID_is_missing(self):
         sb = Safebox(params=json.dumps({ 'guid': None }))
         with self.assertRaises(SendSecureException) as context:
             self.client.get_safebox_messages(sb)
         self.assertIn('SafeBox GUID cannot be null', context.exception.message)
 
+    def test_iter_safeboxes(self):
+        expected_response = json.dumps({ 'count': 2,
+                                         'previous_page_url': None,
+                                         'next_page_url': None,
+                                         'safeboxes': [
+                                             { 'safebox': { 'guid': '73af62f766ee459e81f46e4f533085a4', 'status': 'in_progress' }},
+                                             { 'safebox': { 'guid': '73af62f7ruwehdfjwweg85eore853085a4', 'status': 'closed' }}]
+                                       })
+        self.client.json_client.get_safeboxes_stream = Mock(return_value=io.BytesIO(expected_response.encode('utf-8')))
+        result = list(self.client.iter_safeboxes(search_params={'status': 'unread'}))
+        self.client.json_client.get_safeboxes_stream.assert_called_once_with(None, {'status': 'unread'})
+        self.assertEqual(len(result), 2)
+        self.assertIsInstance(result[0], Safebox)
+        self.assertEqual(result[0].guid, '73af62f766ee459e81f46e4f533085a4')
+        self.assertEqual(result[1].status, 'closed')
+
     def test_get_safebox_security_options(self):
         expected_response = json.dumps({ 'security_options': {
                                              'security_code_length': 4,
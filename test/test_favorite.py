@@ -50,6 +50,26 @@ class TestFavorite(unittest.TestCase):
         self.assertIsInstance(favorite.contact_methods[0], ContactMethod)
         self.assertEqual(favorite.contact_methods[0].id, 1)
 
+    def test_contact_methods_merged_by_id(self):
+        favorite = Favorite(params={ 'email': "favorite@example.com",
+                                     'contact_methods': [{ 'id': i, 'destination': str(i) } for i in range(500)] })
+        local_contact = ContactMethod({ 'destination': "514-555-0009" })
+        favorite.contact_methods.append(local_contact)
+        first = favorite.contact_methods[0]
+        kept = [{ 'id': i, 'destination': 'updated ' + str(i) } for i in reversed(range(0, 500, 2))]
+        favorite.update_attributes({ 'contact_methods': kept })
+        self.assertEqual([contact.id for contact in favorite.contact_methods[:-1]], [contact['id'] for contact in kept])
+        self.assertEqual(favorite.contact_methods[-2].destination, 'updated 0')
+        self.assertIs(favorite.contact_methods[-2], first)
+        self.assertIs(favorite.contact_methods[-1], local_contact)
+
+    def test_contact_methods_removed_when_consecutive(self):
+        favorite = Favorite(params=self.favorite_params)
+        favorite.contact_methods.append(ContactMethod({'id': 2, 'destination': "514-555-0002"}))
+        favorite.contact_methods.append(ContactMethod({'id': 3, 'destination': "514-555-0003"}))
+        favorite.update_attributes(self.favorite_params)
+        self.assertEqual([contact.id for contact in favorite.contact_methods], [1])
+
     def test_contact_methods_removed(self):
         favorite = Favorite(email="favorite@example.com")
         favorite.contact_methods.append(ContactMethod({'id': 2, 'destination': "514-555-0001"}))
@@ -106,5 +126,49 @@ class TestFavorite(unittest.TestCase):
         favorite.contact_methods[0]._destroy = True
         self.assertEqual(favorite.to_json(), json.dumps(expected_json, sort_keys=True))
 
+    def test_to_patch_json_only_has_changes(self):
+        favorite = Favorite().update_attributes(self.favorite_params)
+        self.assertFalse(favorite.is_dirty())
+        self.assertEqual(favorite.to_patch_json(), json.dumps({"favorite": {"email": "favorite@example.com"}}, sort_keys=True))
+        favorite.last_name = "Renamed"
+        favorite.contact_methods.append(ContactMethod({ 'destination': "514-555-0002", 'destination_type': "home_phone" }))
+        expected_json = {"favorite": {
+                            "email": "favorite@example.com",
+                            "last_name": "Renamed",
+                            "contact_methods": [{
+                                "destination": "514-555-0002",
+                                "destination_type": "home_phone"
+                            }]
+                        }
+                    }
+        self.assertEqual(favorite.changed_fields(), ['contact_methods', 'last_name'])
+        self.assertTrue(favorite.is_dirty('last_name'))
+        self.assertFalse(favorite.is_dirty('first_name'))
+        self.assertEqual(favorite.to_patch_json(), json.dumps(expected_json, sort_keys=True))
+
+    def test_to_patch_json_after_update_attributes(self):
+        params = json.loads(json.dumps(self.favorite_params))
+        favorite = Favorite(params=params)._mark_clean(params)
+        # the server state is a copy of the params
+        params['contact_methods'][0]['destination'] = 'changed'
+        favorite.prepare_to_destroy_contact([1])
+        expected_json = {"favorite": {
+                            "email": "favorite@example.com",
+                            "contact_methods": [{ "id": 1, "_destroy": True }]
+                        }
+                    }
+        self.assertEqual(favorite.to_patch_json(), json.dumps(expected_json, sort_keys=True))
+        favorite.update_attributes({ 'first_name': "Updated", 'contact_methods': [] })
+        self.assertEqual(favorite.changed_fields(), [])
+        favorite.company_name = "Other Company"
+        self.assertEqual(favorite.to_patch_dict(), { 'email': "favorite@example.com", 'company_name': "Other Company" })
+
+    def test_to_patch_json_without_server_state(self):
+        favorite = Favorite(email="favorite@example.com")
+        self.assertEqual(favorite.to_patch_json(), favorite.to_json())
+        favorite = Favorite(params=self.favorite_params)
+        self.assertTrue(favorite.is_dirty())
+        self.assertEqual(favorite.to_patch_json(), favorite.to_json())
+
 if __name__ == '__main__':
     unittest.main()
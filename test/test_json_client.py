@@ -1,10 +1,14 @@
 import path
 from sendsecure import *
+import sendsecure.utils
+import time
+import socket
+import threading
 import unittest
 try:
-    from unittest.mock import Mock
+    from unittest.mock import Mock, patch
 except ImportError:
-    from mock import Mock
+    from mock import Mock, patch
 
 class TestJsonClient(unittest.TestCase):
     client = JsonClient({ 'api_token': 'USER|489b3b1f-b411-428e-be5b-2abbace87689',
@@ -485,6 +489,27 @@ class TestJsonClient(unittest.TestCase):
                                                        'application/json')
         self.assertEqual(len(result['results']), 3)
 
+    def test_search_recipient_encodes_term(self):
+        self.client._do_get = Mock(return_value=json.dumps({ 'results': [] }))
+        self.client.search_recipient('john doe&co')
+        self.client._do_get.assert_called_once_with('https://awesome.sendsecure.portal/api/v2/recipients/autocomplete?term=john%20doe%26co',
+                                                       'application/json')
+
+    def test_route_encodes_path_values(self):
+        self.client._do_patch = Mock(return_value=json.dumps({ 'result': True }))
+        self.client.update_participant(self.safebox_guid, 'a/b c', '{}')
+        self.client._do_patch.assert_called_once_with('https://awesome.sendsecure.portal/api/v2/safeboxes/7a3c51e00a004917a8f5db807180fcc5/participants/a%2Fb%20c.json',
+                                                      'application/json', '{}', 'application/json')
+
+    def test_locale_is_appended_to_query(self):
+        client = JsonClient({ 'token': 'USER|489b3b1f-b411-428e-be5b-2abbace87689', 'locale': 'fr' })
+        client._get = Mock(return_value='{}')
+        client._do_get('https://awesome.sendsecure.portal/api/v2/safeboxes.json', 'application/json')
+        client._get.assert_called_with('https://awesome.sendsecure.portal/api/v2/safeboxes.json?locale=fr', 'application/json')
+        client.locale = 'en'
+        client._do_get('https://awesome.sendsecure.portal/api/v2/safeboxes.json?status=unread', 'application/json')
+        client._get.assert_called_with('https://awesome.sendsecure.portal/api/v2/safeboxes.json?status=unread&locale=en', 'application/json')
+
     def test_reply_success(self):
         reply_json = json.dumps({ 'safebox': {
                                       'message': 'Test reply message',
@@ -1080,5 +1105,101 @@ class TestJsonClient(unittest.TestCase):
         self.assertIn('The requested URL cannot be found.', context.exception.message)
 
 
+    def _json_client(self, **options):
+        client = JsonClient(dict({ 'token': 'USER|489b3b1f-b411-428e-be5b-2abbace87689',
+                                   'user_id': '123456',
+                                   'enterprise_account': 'acme',
+                                   'endpoint': 'https://awesome.portal' }, **options))
+        client.sendsecure_endpoint = 'https://awesome.sendsecure.portal/'
+        return client
+
+    def test_timeout_is_passed_to_requests(self):
+        client = self._json_client(timeout=5)
+        with patch('sendsecure.json_client.http_get', return_value=(200, 'OK', '{}')) as http_get:
+            client.get_user_settings()
+        self.assertEqual(http_get.call_args[1]['timeout'], 5)
+
+    def test_deadline_bounds_request_timeouts(self):
+        client = self._json_client(timeout=5)
+        with patch('sendsecure.json_client.http_get', return_value=(200, 'OK', '{}')) as http_get:
+            with client.deadline(2):
+                client.get_user_settings()
+                with client.deadline(10):
+                    client.get_user_settings()
+            client.get_user_settings()
+        timeouts = [call[1]['timeout'] for call in http_get.call_args_list]
+        self.assertTrue(1 < timeouts[0] <= 2)
+        self.assertTrue(1 < timeouts[1] <= 2)
+        self.assertEqual(timeouts[2], 5)
+
+    def test_expired_deadline_fails_fast(self):
+        client = self._json_client()
+        with patch('sendsecure.json_client.http_get', return_value=(200, 'OK', '{}')) as http_get:
+            with self.assertRaises(DeadlineExceededException):
+                with client.deadline(Deadline(0)):
+                    client.get_user_settings()
+        self.assertEqual(http_get.call_count, 0)
+
+    def test_timeouts_raise_typed_exceptions(self):
+        client = self._json_client(timeout=0.01)
+        with patch('sendsecure.json_client.http_get', side_effect=socket.timeout('timed out')):
+            with self.assertRaises(RequestTimeoutException) as context:
+                client.get_user_settings()
+            self.assertNotIsInstance(context.exception, DeadlineExceededException)
+        def expire(*args, **kwargs):
+            time.sleep(kwargs['timeout'])
+            raise urllib.error.URLError(socket.timeout('timed out'))
+        client = self._json_client()
+        with patch('sendsecure.json_client.http_get', side_effect=expire):
+            with self.assertRaises(DeadlineExceededException):
+                with client.deadline(0.05):
+                    client.get_user_settings()
+
+    def test_deadline_is_per_thread(self):
+        client = self._json_client()
+        seen = []
+        with client.deadline(1):
+            thread = threading.Thread(target=lambda: seen.append(getattr(client._local, 'deadline', None)))
+            thread.start()
+            thread.join()
+        self.assertEqual(seen, [None])
+
+    def test_file_stream_opener_uses_the_timeout_and_deadline_of_the_caller(self):
+        client = self._json_client(timeout=5)
+        with patch('sendsecure.json_client.http_get_stream', return_value=Mock(status=206)) as http_get_stream:
+            with client.deadline(2):
+                open_stream = client.get_file_stream_opener()
+            thread = threading.Thread(target=open_stream, args=('https://fileserver/document', { 'Range': 'bytes=0-9' }))
+            thread.start()
+            thread.join()
+            client.get_file_stream_opener()('https://fileserver/document')
+        self.assertEqual(http_get_stream.call_args_list[0][0], ('https://fileserver/document', '*/*', None, { 'Range': 'bytes=0-9' }))
+        self.assertTrue(1 < http_get_stream.call_args_list[0][1]['timeout'] <= 2)
+        self.assertEqual(http_get_stream.call_args_list[1][1]['timeout'], 5)
+
+    def test_endpoint_is_looked_up_once_by_concurrent_threads(self):
+        client = JsonClient({ 'token': 'USER|token', 'user_id': '123456', 'enterprise_account': 'acme', 'endpoint': 'https://awesome.portal' })
+        def http_get(url, *args, **kwargs):
+            if url.endswith('/sendsecure/server/url'):
+                time.sleep(0.05)
+                return (200, 'OK', 'https://awesome.sendsecure.portal/')
+            return (200, 'OK', '{}')
+        with patch('sendsecure.json_client.http_get', side_effect=http_get) as mock:
+            threads = [threading.Thread(target=client.get_user_settings) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        urls = [call[0][0] for call in mock.call_args_list]
+        self.assertEqual(urls.count('https://awesome.portal/services/acme/sendsecure/server/url'), 1)
+        self.assertEqual(urls.count('https://awesome.sendsecure.portal/api/v2/enterprises/acme/users/123456/settings.json?locale=en'), 8)
+
+    def test_state_is_reset_after_fork(self):
+        client = self._json_client()
+        client._endpoint_lock.acquire()
+        sendsecure.utils._after_fork_in_child()
+        self.assertTrue(client._endpoint_lock.acquire(False))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,98 @@
+from sendsecure import *
+import os
+import shutil
+import tempfile
+import unittest
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
+class TestSafeboxMirror(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.client = Client({ 'token': 'USER|489b3b1f-b411-428e-be5b-2abbace87689',
+                               'user_id': '123456',
+                               'enterprise_account': 'acme',
+                               'endpoint': 'https://awesome.portal' })
+        self.safeboxes = [self._summary(i) for i in range(5)]
+        self.client.json_client.get_safeboxes = Mock(side_effect=self._get_safeboxes)
+        self.client.json_client.get_safebox_info = Mock(side_effect=self._get_safebox_info)
+        self.mirror = SafeboxMirror(self.client, os.path.join(self.directory, 'mirror.db'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _summary(self, i, status='in_progress'):
+        return { 'guid': 'safebox%d' % i,
+                 'subject': 'Subject %d' % i,
+                 'status': status,
+                 'unread_count': 0,
+                 'updated_at': '2017-05-24T14:45:35.589Z',
+                 'latest_activity': '2017-05-%02dT14:45:35.544Z' % (20 - i) }
+
+    def _get_safeboxes(self, url, search_params):
+        safeboxes = [safebox for safebox in self.safeboxes if search_params.get('status') in (None, safebox['status'])]
+        page = int(url.split('=')[-1]) if url else 1
+        per_page = search_params['per_page']
+        items = safeboxes[(page - 1) * per_page:page * per_page]
+        next_page_url = 'api/v2/safeboxes?page=%d' % (page + 1) if page * per_page < len(safeboxes) else None
+        return json.dumps({ 'count': len(safeboxes), 'next_page_url': next_page_url,
+                            'safeboxes': [{ 'safebox': safebox } for safebox in items] })
+
+    def _get_safebox_info(self, safebox_guid, sections):
+        return json.dumps({ 'safebox': { 'guid': safebox_guid,
+                                         'participants': [{ 'id': 'p1', 'email': safebox_guid + '@acme.com', 'first_name': 'John', 'last_name': 'Doe' }],
+                                         'messages': [{ 'id': 1, 'note': 'Hello', 'documents': [] }],
+                                         'event_history': [{ 'type': 'safebox_created_owner', 'message': 'created' }] } })
+
+    def test_sync_and_query(self):
+        report = self.mirror.sync(per_page=2)
+        self.assertEqual(report, { 'listed': 5, 'refreshed': 5, 'removed': 0 })
+        self.client.json_client.get_safebox_info.assert_any_call('safebox0', 'participants,messages,event_history')
+        self.assertEqual([safebox.guid for safebox in self.mirror.search()], ['safebox0', 'safebox1', 'safebox2', 'safebox3', 'safebox4'])
+        self.assertEqual([safebox.guid for safebox in self.mirror.search(limit=2, offset=1)], ['safebox1', 'safebox2'])
+        self.assertEqual([safebox.guid for safebox in self.mirror.search('Subject 3')], ['safebox3'])
+        self.assertEqual([safebox.guid for safebox in self.mirror.search('safebox4@acme')], ['safebox4'])
+        self.assertEqual(self.mirror.count('doe'), 5)
+        self.assertEqual(self.mirror.count('100%'), 0)
+        safebox = self.mirror.get_safebox('safebox2')
+        self.assertEqual(safebox.subject, 'Subject 2')
+        self.assertEqual(safebox.participants[0].email, 'safebox2@acme.com')
+        self.assertEqual(safebox.messages[0].note, 'Hello')
+        self.assertIsNone(self.mirror.get_safebox('unknown'))
+        self.assertEqual(self.mirror.get_participants('safebox1')[0].first_name, 'John')
+        self.assertEqual(self.mirror.get_messages('safebox1')[0].id, 1)
+        self.assertEqual(self.mirror.get_event_history('safebox1')[0].type, 'safebox_created_owner')
+
+    def test_incremental_sync_only_refreshes_changed_safeboxes(self):
+        self.mirror.sync(per_page=2)
+        self.client.json_client.get_safebox_info.reset_mock()
+        self.client.json_client.get_safeboxes.reset_mock()
+        self.safeboxes[1] = dict(self.safeboxes[1], unread_count=1)
+        report = self.mirror.sync(per_page=2)
+        self.assertEqual(report['refreshed'], 1)
+        self.client.json_client.get_safebox_info.assert_called_once_with('safebox1', 'participants,messages,event_history')
+        report = self.mirror.sync(per_page=2)
+        self.assertEqual(report['refreshed'], 0)
+        self.assertEqual(self.client.json_client.get_safeboxes.call_count, 3)
+
+    def test_full_sync_removes_unlisted_safeboxes(self):
+        self.mirror.sync(per_page=2)
+        del self.safeboxes[3]
+        report = self.mirror.sync(full=True, per_page=2)
+        self.assertEqual(report, { 'listed': 4, 'refreshed': 0, 'removed': 1 })
+        self.assertIsNone(self.mirror.get_safebox('safebox3'))
+        self.assertEqual(self.mirror.get_participants('safebox3'), [])
+
+    def test_sync_by_status(self):
+        self.safeboxes[2] = self._summary(2, 'closed')
+        report = self.mirror.sync(statuses=['closed'])
+        self.assertEqual(report['listed'], 1)
+        self.assertEqual(self.mirror.count(status='closed'), 1)
+        self.assertEqual(self.mirror.count(status='in_progress'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
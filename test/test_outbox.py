@@ -0,0 +1,113 @@
+from sendsecure import *
+import os
+import shutil
+import tempfile
+import unittest
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
+class TestSafeboxOutbox(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.client = Client({ 'token': 'USER|489b3b1f-b411-428e-be5b-2abbace87689',
+                               'user_id': '123456',
+                               'enterprise_account': 'acme',
+                               'endpoint': 'https://awesome.portal' })
+        self.client.json_client.get_enterprise_settings = Mock(return_value=json.dumps({ 'default_security_profile_id': 10 }))
+        self.client.json_client.get_security_profiles = Mock(return_value=json.dumps({ 'security_profiles': [{ 'id': 10 }] }))
+        self.client.json_client.new_safebox = Mock(return_value=json.dumps({ 'guid': '1c820789a50747df8746aa5d71922a3f',
+                                                                              'public_encryption_key': 'key',
+                                                                              'upload_url': 'upload_url' }))
+        self.client.json_client.upload_file = Mock(side_effect=lambda url, source, *args: json.dumps({ 'temporary_document': { 'document_guid': 'doc-' + source } }))
+        self.client.json_client.commit_safebox = Mock(return_value=json.dumps({ 'guid': '1c820789a50747df8746aa5d71922a3f',
+                                                                                 'status': 'in_progress' }))
+        self.outbox = SafeboxOutbox(self.client, os.path.join(self.directory, 'outbox.db'), max_attempts=2, retry_delay=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _safebox(self):
+        safebox = Safebox(user_email='user@acme.com')
+        safebox.subject = 'Family matters'
+        participant = Participant(email='recipient@test.xmedius.com')
+        participant.guest_options.contact_methods.append(ContactMethod({ 'destination': '+15145550000',
+                                                                          'destination_type': 'cell_phone' }))
+        safebox.participants.append(participant)
+        safebox.attachments.append(Attachment({ 'source': 'first.pdf', 'content_type': 'application/pdf' }))
+        safebox.attachments.append(Attachment({ 'source': 'second.pdf', 'content_type': 'application/pdf' }))
+        return safebox
+
+    def test_enqueue_and_process(self):
+        job_id = self.outbox.enqueue(self._safebox())
+        self.assertEqual(self.outbox.get_job(job_id).status, OutboxJob.PENDING)
+        self.assertEqual(self.outbox.run(), 1)
+        job = self.outbox.get_job(job_id)
+        self.assertEqual(job.status, OutboxJob.COMMITTED)
+        self.assertEqual(job.safebox.guid, '1c820789a50747df8746aa5d71922a3f')
+        self.assertEqual(job.safebox.security_profile_id, 10)
+        self.assertEqual(job.safebox.participants[0].guest_options.contact_methods[0].destination, '+15145550000')
+        self.assertEqual([a.guid for a in job.safebox.attachments], ['doc-first.pdf', 'doc-second.pdf'])
+        committed = json.loads(self.client.json_client.commit_safebox.call_args[0][0])['safebox']
+        self.assertEqual(committed['subject'], 'Family matters')
+        self.assertEqual(committed['document_ids'], ['doc-first.pdf', 'doc-second.pdf'])
+        self.assertEqual(committed['recipients'][0]['contact_methods'][0]['destination'], '+15145550000')
+        self.assertIsNone(self.outbox.process_next())
+
+    def test_resume_after_failure(self):
+        def upload_file(url, source, *args):
+            if source == 'second.pdf' and upload_file.fail:
+                upload_file.fail = False
+                raise SendSecureException(500, 'Connection reset', '')
+            return json.dumps({ 'temporary_document': { 'document_guid': 'doc-' + source } })
+        upload_file.fail = True
+        self.client.json_client.upload_file = Mock(side_effect=upload_file)
+        job_id = self.outbox.enqueue(self._safebox())
+
+        job = self.outbox.process_next('worker-1')
+        self.assertEqual(job.attempts, 1)
+        job = self.outbox.get_job(job_id)
+        self.assertEqual(job.status, OutboxJob.INITIALIZED)
+        self.assertEqual(job.error, '500: Connection reset')
+        self.assertEqual([a.guid for a in job.safebox.attachments], ['doc-first.pdf', None])
+
+        self.outbox.process_next('worker-2')
+        self.assertEqual(self.outbox.get_job(job_id).status, OutboxJob.COMMITTED)
+        self.assertEqual(self.client.json_client.new_safebox.call_count, 1)
+        self.assertEqual([c[0][1] for c in self.client.json_client.upload_file.call_args_list],
+                         ['first.pdf', 'second.pdf', 'second.pdf'])
+
+    def test_claimed_job_is_not_processed_twice(self):
+        job_id = self.outbox.enqueue(self._safebox())
+        self.assertEqual(self.outbox._claim('worker-1').id, job_id)
+        self.assertIsNone(self.outbox._claim('worker-2'))
+
+    def test_expired_lease_is_resumed(self):
+        self.outbox.lease_seconds = -1
+        job_id = self.outbox.enqueue(self._safebox())
+        self.outbox._claim('crashed-worker')
+        self.assertEqual(self.outbox.process_next('worker-2').id, job_id)
+        self.assertEqual(self.outbox.get_job(job_id).status, OutboxJob.COMMITTED)
+
+    def test_job_fails_after_max_attempts(self):
+        self.client.json_client.commit_safebox = Mock(side_effect=SendSecureException(400, 'Bad request', ''))
+        job_id = self.outbox.enqueue(self._safebox())
+        self.outbox.run()
+        job = self.outbox.get_job(job_id)
+        self.assertEqual(job.status, OutboxJob.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(self.outbox.counts(), { OutboxJob.FAILED: 1 })
+
+    def test_enqueue_rejects_streams(self):
+        safebox = self._safebox()
+        safebox.attachments.append(Attachment({ 'source': open(__file__, 'rb') }))
+        safebox.attachments[-1].source.close()
+        with self.assertRaises(SendSecureException) as context:
+            self.outbox.enqueue(safebox)
+        self.assertIn('file path', context.exception.message)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -122,5 +122,20 @@ class TestParticipant(unittest.TestCase):
         participant.guest_options.contact_methods[0]._destroy = True
         self.assertEqual(participant.to_json(), json.dumps(expected_json, sort_keys=True))
 
+    def test_to_patch_json_only_has_changes(self):
+        participant = Participant().update_attributes(self.participant_params)
+        participant.guest_options.company_name = "Other Company"
+        participant.guest_options.contact_methods[0].destination = "514-555-0002"
+        expected_json = {"participant": {
+                            "email": "participant@example.com",
+                            "company_name": "Other Company",
+                            "contact_methods": [{ "id": 1, "destination": "514-555-0002" }]
+                        }
+                    }
+        self.assertEqual(participant.changed_fields(), ['company_name', 'contact_methods'])
+        self.assertEqual(participant.to_patch_json(), json.dumps(expected_json, sort_keys=True))
+        participant.update_attributes({ 'guest_options': { 'company_name': "Other Company" } })
+        self.assertEqual(participant.to_patch_dict(), { 'email': "participant@example.com" })
+
 if __name__ == '__main__':
     unittest.main()
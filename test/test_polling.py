@@ -0,0 +1,160 @@
+from sendsecure import *
+import os
+import shutil
+import tempfile
+import unittest
+try:
+    from unittest.mock import Mock, patch
+except ImportError:
+    from mock import Mock, patch
+
+class TestSafeboxPoller(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = patch('sendsecure.polling.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = Client({ 'token': 'USER|489b3b1f-b411-428e-be5b-2abbace87689',
+                               'user_id': '123456',
+                               'enterprise_account': 'acme',
+                               'endpoint': 'https://awesome.portal' })
+        self.messages = { 'safebox1': [self._message(1, '2017-04-05T14:49:35.198Z')], 'safebox2': [] }
+        self.events = { 'safebox1': [{ 'type': 'safebox_created_owner', 'date': '2017-03-30T18:09:05.966Z', 'message': 'created' }], 'safebox2': [] }
+        self.client.iter_safebox_messages = Mock(side_effect=lambda safebox: iter([Message(m) for m in self.messages[safebox.guid]]))
+        self.client.iter_safebox_event_history = Mock(side_effect=lambda safebox: iter([EventHistory(e) for e in self.events[safebox.guid]]))
+        self.poller = SafeboxPoller(self.client, min_interval=10, max_interval=80, backoff=2)
+
+    def _message(self, id, created_at):
+        return { 'id': id, 'note': 'Message %d' % id, 'created_at': created_at }
+
+    def _results(self):
+        return dict((result.safebox.guid, result) for result in self.poller.poll_due())
+
+    def test_poll_returns_only_new_items(self):
+        self.poller.watch(Safebox(params={ 'guid': 'safebox1' }))
+        result = self._results()['safebox1']
+        self.assertEqual([message.id for message in result.messages], [1])
+        self.assertEqual(len(result.events), 1)
+        self.assertEqual(self._results(), {})
+        self.now += 10
+        self.messages['safebox1'].append(self._message(2, '2017-04-06T10:00:00.000Z'))
+        self.messages['safebox1'].append(self._message(3, '2017-04-06T10:00:00.000Z'))
+        result = self._results()['safebox1']
+        self.assertEqual([message.id for message in result.messages], [2, 3])
+        self.assertEqual(result.events, [])
+        self.now += 10
+        self.assertFalse(self._results()['safebox1'].changed)
+
+    def test_skip_existing_and_resume_from_cursors(self):
+        self.poller.watch(Safebox(params={ 'guid': 'safebox1' }), skip_existing=True)
+        self.now += 10
+        self.assertFalse(self._results()['safebox1'].changed)
+        cursors = self.poller.cursors()
+        self.assertEqual(cursors['safebox1']['messages'], { 'timestamp': '2017-04-05T14:49:35.198Z', 'keys': ['1'] })
+        self.messages['safebox1'].append(self._message(2, '2017-04-06T10:00:00.000Z'))
+        poller = SafeboxPoller(self.client)
+        poller.watch(Safebox(params={ 'guid': 'safebox1' }), cursors=cursors['safebox1'])
+        result = poller.poll_due()[0]
+        self.assertEqual([message.id for message in result.messages], [2])
+
+    def test_idle_safeboxes_back_off(self):
+        self.poller.watch(Safebox(params={ 'guid': 'safebox1' }))
+        self.poller.watch(Safebox(params={ 'guid': 'safebox2' }))
+        polls = { 'safebox1': [], 'safebox2': [] }
+        for t in range(0, 200, 10):
+            self.now = 1000.0 + t
+            if t == 80:
+                self.messages['safebox2'].append(self._message(1, '2017-04-06T10:00:00.000Z'))
+            for guid in self._results():
+                polls[guid].append(t)
+        self.assertEqual(polls['safebox1'], [0, 10, 30, 70, 150])
+        # the new message is found at the next scheduled poll, then safebox2 is polled quickly again
+        self.assertEqual(polls['safebox2'], [0, 20, 60, 140, 150, 170])
+
+    def test_errors_are_reported_and_backed_off(self):
+        self.poller.watch(Safebox(params={ 'guid': 'safebox1' }))
+        self.client.iter_safebox_event_history = Mock(side_effect=SendSecureException(500, 'Server error', ''))
+        result = self._results()['safebox1']
+        self.assertEqual(result.error.code, 500)
+        self.assertEqual(self.poller.next_poll_in(), 20)
+        self.assertEqual(self.poller.cursors()['safebox1']['messages']['timestamp'], None)
+
+    def test_unwatch(self):
+        self.poller.watch(Safebox(params={ 'guid': 'safebox1' }))
+        self.poller.unwatch('safebox1')
+        self.assertEqual(self.poller.poll_due(), [])
+        self.assertIsNone(self.poller.next_poll_in())
+
+    def test_watch_requires_guid(self):
+        with self.assertRaises(SendSecureException):
+            self.poller.watch(Safebox(params={ 'guid': None }))
+
+
+
+class TestUnreadWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.client = Client({ 'token': 'USER|489b3b1f-b411-428e-be5b-2abbace87689',
+                               'user_id': '123456',
+                               'enterprise_account': 'acme',
+                               'endpoint': 'https://awesome.portal' })
+        self.unread = [self._safebox(1), self._safebox(2), self._safebox(3)]
+        self.client.json_client.get_safeboxes = Mock(side_effect=self._get_safeboxes)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _safebox(self, i, activity='2017-05-24T14:45:35.544Z'):
+        return { 'guid': 'safebox%d' % i, 'status': 'in_progress', 'unread_count': 1, 'latest_activity': activity }
+
+    def _get_safeboxes(self, url, search_params):
+        self.assertEqual(search_params['status'], 'unread')
+        page = int(url.split('=')[-1]) if url else 1
+        per_page = search_params['per_page']
+        items = self.unread[(page - 1) * per_page:page * per_page]
+        next_page_url = 'api/v2/safeboxes?page=%d' % (page + 1) if page * per_page < len(self.unread) else None
+        return json.dumps({ 'count': len(self.unread), 'next_page_url': next_page_url,
+                            'safeboxes': [{ 'safebox': safebox } for safebox in items] })
+
+    def test_poll_reports_transitions(self):
+        events = []
+        watcher = UnreadWatcher(self.client, on_unread=lambda safebox: events.append(('unread', safebox.guid)),
+                                on_read=lambda guid: events.append(('read', guid)), per_page=2)
+        (became_unread, became_read) = watcher.poll()
+        self.assertEqual([safebox.guid for safebox in became_unread], ['safebox1', 'safebox2', 'safebox3'])
+        self.assertEqual(watcher.poll(), ([], []))
+        del self.unread[1]
+        self.unread[0] = self._safebox(1, '2017-05-25T10:00:00.000Z')
+        self.unread.append(self._safebox(4))
+        (became_unread, became_read) = watcher.poll()
+        self.assertEqual([safebox.guid for safebox in became_unread], ['safebox1', 'safebox4'])
+        self.assertEqual(became_read, ['safebox2'])
+        self.assertEqual(sorted(watcher.unread), ['safebox1', 'safebox3', 'safebox4'])
+        self.assertEqual(events[-3:], [('unread', 'safebox1'), ('unread', 'safebox4'), ('read', 'safebox2')])
+        self.assertEqual(self.client.json_client.get_safeboxes.call_count, 6)
+
+    def test_skip_existing(self):
+        watcher = UnreadWatcher(self.client)
+        self.assertEqual(watcher.poll(skip_existing=True), ([], []))
+        self.unread.append(self._safebox(4))
+        self.assertEqual([safebox.guid for safebox in watcher.poll(skip_existing=True)[0]], ['safebox4'])
+
+    def test_transitions_are_reported_by_one_process(self):
+        path = os.path.join(self.directory, 'unread.db')
+        first = UnreadWatcher(self.client, path=path)
+        second = UnreadWatcher(self.client, path=path)
+        self.assertEqual(len(first.poll()[0]), 3)
+        self.assertEqual(second.poll(), ([], []))
+        del self.unread[0]
+        self.unread.append(self._safebox(4))
+        (became_unread, became_read) = second.poll()
+        self.assertEqual([safebox.guid for safebox in became_unread], ['safebox4'])
+        self.assertEqual(became_read, ['safebox1'])
+        self.assertEqual(first.poll(), ([], []))
+        self.assertEqual(sorted(first.unread), sorted(second.unread))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+from sendsecure import *
+import sendsecure.utils
+import time
+import threading
+import unittest
+try:
+    from unittest.mock import Mock, patch
+except ImportError:
+    from mock import Mock, patch
+
+class TestClientPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ClientPool({ 'endpoint': 'https://awesome.portal', 'locale': 'fr' }, max_requests_per_tenant=2)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_get_returns_one_client_per_tenant_and_user(self):
+        client = self.pool.get('acme', '1', 'USER|token1')
+        self.assertIs(self.pool.get('acme', '1', 'USER|token1'), client)
+        self.assertIsNot(self.pool.get('acme', '2', 'USER|token2'), client)
+        self.assertIsNot(self.pool.get('other', '1', 'USER|token3'), client)
+        self.assertEqual(len(self.pool), 3)
+        self.assertEqual(client.json_client.enterprise_account, 'acme')
+        self.assertEqual(client.json_client.user_id, '1')
+        self.assertEqual(client.json_client.locale, 'fr')
+        self.assertEqual(client.json_client.endpoint, 'https://awesome.portal')
+
+    def test_get_updates_token(self):
+        client = self.pool.get('acme', '1', 'USER|token1')
+        self.assertIs(self.pool.get('acme', '1', 'USER|token2'), client)
+        self.assertEqual(client.json_client.token, 'USER|token2')
+
+    def test_clients_share_connections_and_limits(self):
+        acme1 = self.pool.get('acme', '1', 'USER|token1').json_client
+        acme2 = self.pool.get('acme', '2', 'USER|token2').json_client
+        other = self.pool.get('other', '1', 'USER|token3').json_client
+        self.assertIs(acme1.connection_pool, self.pool.connection_pool)
+        self.assertIs(other.connection_pool, self.pool.connection_pool)
+        self.assertIs(acme1.request_limiter, acme2.request_limiter)
+        self.assertIsNot(acme1.request_limiter, other.request_limiter)
+
+    def test_endpoint_discovery_is_shared(self):
+        with patch('sendsecure.json_client.http_get', return_value=(200, 'OK', 'https://awesome.sendsecure.portal/')) as http_get:
+            for user_id in ('1', '2', '3'):
+                json_client = self.pool.get('acme', user_id, 'USER|token').json_client
+                self.assertEqual(json_client._get_sendsecure_endpoint(), 'https://awesome.sendsecure.portal/')
+        http_get.assert_called_once_with('https://awesome.portal/services/acme/sendsecure/server/url', 'text/plain', 'USER|token', pool=self.pool.connection_pool, timeout=None)
+
+    def test_requests_are_limited_per_tenant(self):
+        running = []
+        peak = []
+        lock = threading.Lock()
+        def http_get(*args, **kwargs):
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.1)
+            with lock:
+                running.pop()
+            return (200, 'OK', '{}')
+        with patch('sendsecure.json_client.http_get', side_effect=http_get):
+            threads = [threading.Thread(target=self.pool.get('acme', str(i), 'USER|token').json_client._get, args=('https://awesome.portal', 'application/json'))
+                       for i in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(max(peak), 2)
+
+    def test_state_is_reset_after_fork(self):
+        json_client = self.pool.get('acme', '1', 'USER|token').json_client
+        self.pool._lock.acquire()
+        json_client.request_limiter.acquire()
+        json_client.request_limiter.acquire()
+        sendsecure.utils._after_fork_in_child()
+        self.assertTrue(self.pool._lock.acquire(False))
+        self.assertTrue(json_client.request_limiter.acquire(False))
+        self.assertIs(self.pool._get_limiter('acme'), json_client.request_limiter)
+
+    def test_least_recently_used_clients_are_discarded(self):
+        pool = ClientPool(max_clients=2)
+        client = pool.get('acme', '1', 'USER|token1')
+        pool.get('acme', '2', 'USER|token2')
+        pool.get('acme', '1', 'USER|token1')
+        pool.get('acme', '3', 'USER|token3')
+        self.assertEqual(len(pool), 2)
+        self.assertIs(pool.get('acme', '1', 'USER|token1'), client)
+        pool.discard('acme', '1')
+        self.assertEqual(len(pool), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -131,6 +131,33 @@ class TestSafebox(unittest.TestCase):
         self.assertIsInstance(safebox.messages[0].documents[0], Document)
         self.assertIsInstance(safebox.event_history[0], EventHistory)
 
+    def test_lazy_initialization(self):
+        safebox = Safebox(params=self.safebox_params, lazy=True)
+        self.assertEqual(safebox.guid, "b4d898ada15f42f293e31905c514607f")
+        self.assertNotIn('messages', safebox.__dict__)
+        self.assertNotIn('participants', safebox.__dict__)
+        messages = safebox.messages
+        self.assertIsInstance(messages[0], Message)
+        self.assertIsInstance(messages[0].documents[0], Document)
+        self.assertIs(safebox.messages, messages)
+        self.assertIsInstance(safebox.participants[0], Participant)
+        self.assertIsInstance(safebox.security_options, SecurityOptions)
+        with self.assertRaises(AttributeError):
+            safebox.unknown_attribute
+
+    def test_lazy_initialization_to_json(self):
+        eager = Safebox(params=self.safebox_params)
+        lazy = Safebox(params=self.safebox_params, lazy=True)
+        self.assertEqual(lazy.to_json(), eager.to_json())
+        self.assertNotIn('_lazy_values', lazy.__dict__)
+
+    def test_lazy_initialization_update_attributes(self):
+        safebox = Safebox(params=self.safebox_params, lazy=True)
+        safebox.update_attributes({ 'event_history': [{ 'type': 'safebox_closed' }] })
+        self.assertIsInstance(safebox.event_history[0], EventHistory)
+        self.assertEqual(safebox.event_history[0].type, 'safebox_closed')
+        self.assertIsInstance(safebox.messages[0], Message)
+
     def test_initialization_without_params(self):
         safebox = Safebox(user_email="user@example.com")
         self.assertEqual(len(safebox.participants), 0)
@@ -228,5 +255,20 @@ class TestSafebox(unittest.TestCase):
         safebox = Safebox(params=self.safebox_params)
         self.assertEqual(safebox.to_json(), json.dumps(expected_json, sort_keys=True))
 
+    def test_to_json_without_sorted_keys(self):
+        safebox = Safebox(params=self.safebox_params)
+        self.assertEqual(json.loads(safebox.to_json(sort_keys=False)), json.loads(safebox.to_json()))
+
+    def test_to_json_with_fast_json(self):
+        safebox = Safebox(params=self.safebox_params)
+        expected_json = safebox.to_json()
+        try:
+            if not enable_fast_json():
+                self.skipTest('orjson is not installed')
+            self.assertEqual(json.loads(safebox.to_json()), json.loads(expected_json))
+        finally:
+            enable_fast_json(False)
+        self.assertEqual(safebox.to_json(), expected_json)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,112 @@
+from sendsecure import *
+import time
+import unittest
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
+class TestFavoriteSynchronizer(unittest.TestCase):
+    existing_favorites = [{ 'id': 1,
+                            'email': 'john.smith@example.com',
+                            'first_name': 'John',
+                            'last_name': 'Smith',
+                            'company_name': 'Acme',
+                            'contact_methods': [{ 'id': 10, 'destination': '+15145550000', 'destination_type': 'office_phone' },
+                                                { 'id': 11, 'destination': '+15145550001', 'destination_type': 'cell_phone' }] },
+                          { 'id': 2,
+                            'email': 'jane.doe@example.com',
+                            'first_name': 'Jane',
+                            'last_name': 'Doe',
+                            'contact_methods': [] },
+                          { 'id': 3,
+                            'email': 'old.contact@example.com',
+                            'contact_methods': [] }]
+
+    def setUp(self):
+        self.client = Client({ 'token': 'USER|489b3b1f-b411-428e-be5b-2abbace87689',
+                               'user_id': '123456',
+                               'enterprise_account': 'acme',
+                               'endpoint': 'https://awesome.portal' })
+        self.client.json_client.get_favorites = Mock(return_value=json.dumps({ 'favorites': self.existing_favorites }))
+        self.client.json_client.create_favorite = Mock(side_effect=lambda favorite_json: json.dumps(dict(json.loads(favorite_json)['favorite'], id=4)))
+        self.client.json_client.update_favorite = Mock(return_value=json.dumps({}))
+        self.client.json_client.delete_favorite = Mock(return_value='')
+
+    def _desired(self):
+        john = Favorite(email='John.Smith@example.com')
+        john.company_name = 'Acme Corp'
+        john.contact_methods.append(ContactMethod({ 'destination': '+15145550000', 'destination_type': 'office_phone' }))
+        john.contact_methods.append(ContactMethod({ 'destination': '+15145550002', 'destination_type': 'home_phone' }))
+        jane = Favorite(email='jane.doe@example.com')
+        jane.first_name = 'Jane'
+        new = Favorite(email='new.contact@example.com')
+        new.first_name = 'New'
+        return [john, jane, new]
+
+    def test_plan(self):
+        (actions, unchanged) = FavoriteSynchronizer(self.client).plan(self._desired())
+        self.assertEqual(unchanged, 1)
+        self.assertEqual([(action.type, action.favorite.email) for action in actions],
+                         [('update', 'john.smith@example.com'), ('create', 'new.contact@example.com'), ('delete', 'old.contact@example.com')])
+        self.assertEqual(actions[0].changes, ['company_name', 'contact_methods'])
+        self.assertEqual(actions[0].favorite.to_patch_dict(), { 'email': 'john.smith@example.com',
+                                                                'company_name': 'Acme Corp',
+                                                                'contact_methods': [{ 'id': 11, '_destroy': True },
+                                                                                    { 'destination': '+15145550002', 'destination_type': 'home_phone' }] })
+
+    def test_dry_run_sends_nothing(self):
+        report = self.client.sync_favorites(self._desired(), dry_run=True)
+        self.assertTrue(report.dry_run)
+        self.assertEqual((len(report.created), len(report.updated), len(report.deleted), report.unchanged), (1, 1, 1, 1))
+        self.client.json_client.create_favorite.assert_not_called()
+        self.client.json_client.update_favorite.assert_not_called()
+        self.client.json_client.delete_favorite.assert_not_called()
+
+    def test_sync(self):
+        report = self.client.sync_favorites(self._desired(), workers=2)
+        self.assertFalse(report.failed)
+        self.assertEqual(report.created[0].favorite.id, 4)
+        self.assertEqual(self.client.json_client.update_favorite.call_args[0][0], 1)
+        self.client.json_client.delete_favorite.assert_called_once_with(3)
+
+    def test_sync_without_deletion(self):
+        report = self.client.sync_favorites(self._desired(), delete_missing=False)
+        self.assertFalse(report.deleted)
+        self.client.json_client.delete_favorite.assert_not_called()
+
+    def test_failures_are_reported(self):
+        self.client.json_client.delete_favorite = Mock(side_effect=SendSecureException(500, 'Server error', ''))
+        report = self.client.sync_favorites(self._desired())
+        self.assertEqual([action.type for action in report.failed], ['delete'])
+        self.assertEqual(report.failed[0].error.code, 500)
+        self.assertTrue(report.created[0].succeeded)
+
+    def test_duplicate_emails_are_rejected(self):
+        with self.assertRaises(SendSecureException) as context:
+            self.client.sync_favorites([Favorite(email='a@example.com'), Favorite(email='A@example.com')])
+        self.assertIn('Duplicate favorite email', context.exception.message)
+        self.client.json_client.create_favorite.assert_not_called()
+
+    def test_plan_with_incomplete_existing_favorites(self):
+        existing = [Favorite().update_attributes({ 'id': 5, 'email': None, 'contact_methods': [] }),
+                    Favorite().update_attributes({ 'id': 6,
+                                                   'email': 'partial@example.com',
+                                                   'contact_methods': [{ 'id': 60, 'destination': '+15145550000' }] })]
+        partial = Favorite(email='partial@example.com')
+        partial.contact_methods.append(ContactMethod({ 'destination': '+15145550000', 'destination_type': 'cell_phone' }))
+        (actions, unchanged) = FavoriteSynchronizer(self.client).plan([partial], existing)
+        self.assertEqual(unchanged, 0)
+        self.assertEqual([(action.type, action.favorite.id) for action in actions], [('update', 6), ('delete', 5)])
+        self.assertEqual(actions[0].favorite.to_patch_dict()['contact_methods'],
+                         [{ 'id': 60, '_destroy': True },
+                          { 'destination': '+15145550000', 'destination_type': 'cell_phone' }])
+
+    def test_requests_are_rate_limited(self):
+        start = time.monotonic()
+        self.client.sync_favorites(self._desired(), workers=3, max_requests_per_second=20)
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+
+if __name__ == '__main__':
+    unittest.main()
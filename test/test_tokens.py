@@ -0,0 +1,127 @@
+from sendsecure import *
+import sendsecure.utils
+import os
+import base64
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import HTTPServer, BaseHTTPRequestHandler
+try:
+    from unittest.mock import Mock, patch
+except ImportError:
+    from mock import Mock, patch
+
+class ReversedCipher:
+    def encrypt(self, data):
+        return base64.b64encode(data[::-1])
+
+    def decrypt(self, data):
+        return base64.b64decode(data)[::-1]
+
+
+class _TokenCheckingHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200 if self.headers.get('authorization-token') == 'token2' else 401)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+class TestTokenManager(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'tokens')
+        self.tokens = iter(['token%d' % i for i in range(1, 10)])
+        patcher = patch.object(Client, 'get_user_token', side_effect=lambda *args: { 'token': next(self.tokens), 'user_id': 12 })
+        self.get_user_token = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_token_is_cached(self):
+        manager = TokenManager()
+        self.assertEqual(manager.get_token('acme', 'jdoe', 'secret', 'device1', 'laptop'), { 'token': 'token1', 'user_id': 12 })
+        self.assertEqual(manager.get_token('acme', 'jdoe', 'secret', 'device1', 'laptop')['token'], 'token1')
+        self.assertEqual(manager.get_token('acme', 'jdoe', 'secret', 'device2', 'phone')['token'], 'token2')
+        self.get_user_token.assert_any_call('acme', 'jdoe', 'secret', 'device1', 'laptop', 'SendSecure Python', 'https://portal.xmedius.com', '')
+        self.assertEqual(self.get_user_token.call_count, 2)
+
+    def test_invalidate(self):
+        manager = TokenManager()
+        manager.get_token('acme', 'jdoe', 'secret', 'device1', 'laptop')
+        manager.invalidate('acme', 'jdoe', 'device1')
+        self.assertEqual(manager.get_token('acme', 'jdoe', 'secret', 'device1', 'laptop')['token'], 'token2')
+        manager.invalidate('acme', 'jdoe', 'device1', 'token1')
+        self.assertEqual(manager.get_token('acme', 'jdoe', 'secret', 'device1', 'laptop')['token'], 'token2')
+
+    def test_with_token_reacquires_rejected_token(self):
+        manager = TokenManager()
+        def call(token):
+            if token['token'] == 'token1':
+                raise SendSecureException(401, 'Unauthorized', '')
+            return token['token']
+        self.assertEqual(manager.with_token(call, 'acme', 'jdoe', 'secret', 'device1', 'laptop'), 'token2')
+        self.assertEqual(manager.with_token(call, 'acme', 'jdoe', 'secret', 'device1', 'laptop'), 'token2')
+        self.assertEqual(self.get_user_token.call_count, 2)
+
+    def test_with_token_reacquires_token_rejected_by_urlopen(self):
+        httpd = HTTPServer(('127.0.0.1', 0), _TokenCheckingHandler)
+        thread = threading.Thread(target=httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(httpd.server_close)
+        self.addCleanup(httpd.shutdown)
+        url = 'http://127.0.0.1:%d/settings' % httpd.server_address[1]
+        manager = TokenManager()
+        result = manager.with_token(lambda token: http_get(url, auth_token=token['token']), 'acme', 'jdoe', 'secret', 'device1', 'laptop')
+        self.assertEqual(result[0], 200)
+        self.assertEqual(manager.get_token('acme', 'jdoe', 'secret', 'device1', 'laptop')['token'], 'token2')
+
+    def test_with_token_raises_other_errors(self):
+        manager = TokenManager()
+        with self.assertRaises(SendSecureException):
+            manager.with_token(Mock(side_effect=SendSecureException(403, 'Forbidden', '')), 'acme', 'jdoe', 'secret', 'device1', 'laptop')
+        self.assertEqual(manager.get_token('acme', 'jdoe', 'secret', 'device1', 'laptop')['token'], 'token1')
+
+    def test_store_is_shared_and_encrypted(self):
+        first = TokenManager(self.path, ReversedCipher())
+        second = TokenManager(self.path, ReversedCipher())
+        first.get_token('acme', 'jdoe', 'secret', 'device1', 'laptop')
+        self.assertEqual(second.get_token('acme', 'jdoe', 'secret', 'device1', 'laptop')['token'], 'token1')
+        second.get_token('acme', 'other', 'secret', 'device1', 'laptop')
+        self.assertEqual(first.get_token('acme', 'other', 'secret', 'device1', 'laptop')['token'], 'token2')
+        self.assertEqual(self.get_user_token.call_count, 2)
+        with open(self.path, 'rb') as f:
+            self.assertNotIn(b'token1', f.read())
+
+    def test_store_keeps_token_renewed_by_another_process(self):
+        first = TokenManager(self.path, ReversedCipher())
+        second = TokenManager(self.path, ReversedCipher())
+        first.get_token('acme', 'jdoe', 'secret', 'device1', 'laptop')
+        second.invalidate('acme', 'jdoe', 'device1', 'token1')
+        self.assertEqual(second.get_token('acme', 'jdoe', 'secret', 'device1', 'laptop')['token'], 'token2')
+        first.invalidate('acme', 'jdoe', 'device1', 'token1')
+        self.assertEqual(first.get_token('acme', 'jdoe', 'secret', 'device1', 'laptop')['token'], 'token2')
+
+    def test_state_is_reset_after_fork(self):
+        manager = TokenManager()
+        manager._get_key_lock(('acme', 'jdoe', 'device1')).acquire()
+        manager._lock.acquire()
+        sendsecure.utils._after_fork_in_child()
+        self.assertTrue(manager._lock.acquire(False))
+        manager._lock.release()
+        self.assertTrue(manager._get_key_lock(('acme', 'jdoe', 'device1')).acquire(False))
+
+    def test_store_requires_a_cipher(self):
+        with self.assertRaises(SendSecureException):
+            TokenManager(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+from sendsecure import *
+import sendsecure.transport
+import ssl
+import threading
+import unittest
+from http.server import HTTPServer, BaseHTTPRequestHandler
+try:
+    from unittest.mock import Mock, patch
+except ImportError:
+    from mock import Mock, patch
+
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8')
+        self.requests.append((self.command, self.path, self.headers.get('authorization-token'), body))
+        status = 404 if self.path.startswith('/missing') else 200
+        content = json.dumps({ 'method': self.command, 'body': body }).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PATCH = do_DELETE = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+class TestTransport(unittest.TestCase):
+
+    def _serve(self):
+        handler = type('Handler', (_JsonHandler,), { 'requests': [] })
+        httpd = HTTPServer(('127.0.0.1', 0), handler)
+        thread = threading.Thread(target=httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(httpd.server_close)
+        self.addCleanup(httpd.shutdown)
+        return (handler, 'http://127.0.0.1:%d' % httpd.server_address[1])
+
+    def test_urllib_transport_returns_error_statuses(self):
+        (handler, url) = self._serve()
+        transport = UrllibTransport()
+        (status, reason, body) = transport.request('POST', url + '/create', b'{"a": 1}', { 'Content-Type': 'application/json' })
+        self.assertEqual((status, json.loads(body)), (200, { 'method': 'POST', 'body': '{"a": 1}' }))
+        (status, reason, body) = transport.request('GET', url + '/missing')
+        self.assertEqual(status, 404)
+        self.assertEqual(json.loads(body)['method'], 'GET')
+
+    def test_create_transport(self):
+        self.assertIsInstance(create_transport('urllib'), UrllibTransport)
+        self.assertIsInstance(create_transport('pooled'), ConnectionPool)
+        self.assertIsInstance(create_transport(), ConnectionPool if sendsecure.transport.urllib3 is None else Urllib3Transport)
+        with self.assertRaises(SendSecureException) as context:
+            create_transport('carrier-pigeon')
+        self.assertIn('Unknown transport', context.exception.message)
+
+    @unittest.skipIf(sendsecure.transport.urllib3 is not None, 'urllib3 is installed')
+    def test_urllib3_transport_requires_urllib3(self):
+        with self.assertRaises(SendSecureException) as context:
+            Urllib3Transport()
+        self.assertIn('urllib3', context.exception.message)
+
+    @unittest.skipIf(sendsecure.transport.urllib3 is None, 'urllib3 is not installed')
+    def test_urllib3_transport(self):
+        (handler, url) = self._serve()
+        transport = Urllib3Transport()
+        self.addCleanup(transport.close)
+        (status, reason, body) = transport.request('PATCH', url + '/update', b'{}', { 'Content-Type': 'application/json' })
+        self.assertEqual((status, json.loads(body)['method']), (200, 'PATCH'))
+        self.assertEqual(transport.request('GET', url + '/missing')[0], 404)
+
+    @unittest.skipIf(sendsecure.transport.httpx is not None, 'httpx is installed')
+    def test_http2_transport_requires_httpx(self):
+        with self.assertRaises(SendSecureException) as context:
+            create_transport('http2')
+        self.assertIn('httpx', context.exception.message)
+
+    @unittest.skipIf(sendsecure.transport.httpx is None, 'httpx is not installed')
+    def test_http2_transport(self):
+        (handler, url) = self._serve()
+        transport = Http2Transport(max_streams_per_host=2)
+        self.addCleanup(transport.close)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(transport.request('GET', url + '/info')[0])) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [200] * 5)
+        self.assertEqual(transport.request('DELETE', url + '/missing')[0], 404)
+
+    def test_http2_transport_verifies_certificates(self):
+        httpx = Mock()
+        with patch('sendsecure.transport.httpx', httpx):
+            Http2Transport()
+        context = httpx.Client.call_args[1]['verify']
+        self.assertIsInstance(context, ssl.SSLContext)
+        self.assertEqual(context.verify_mode, ssl.CERT_REQUIRED)
+        self.assertTrue(context.check_hostname)
+        self.assertTrue(httpx.Client.call_args[1]['http2'])
+
+    def test_json_client_sends_requests_through_transport(self):
+        for name in (None, 'urllib', 'pooled'):
+            (handler, url) = self._serve()
+            client = JsonClient({ 'token': 'USER|token', 'enterprise_account': 'acme', 'user_id': '1', 'transport': name })
+            self.addCleanup(client.close)
+            client.sendsecure_endpoint = url + '/'
+            self.assertEqual(json.loads(client.create_favorite('{"favorite": {}}'))['body'], '{"favorite": {}}')
+            with self.assertRaises(SendSecureException) as context:
+                client._get(url + '/missing', 'application/json')
+            self.assertEqual(context.exception.code, 404)
+            self.assertEqual([(method, token) for (method, path, token, body) in handler.requests],
+                             [('POST', 'USER|token'), ('GET', 'USER|token')])
+
+    def test_json_client_closes_created_transports_only(self):
+        with patch.object(ConnectionPool, 'close') as close:
+            with JsonClient({ 'token': 'USER|token', 'transport': 'pooled' }) as client:
+                self.assertIsInstance(client.transport, ConnectionPool)
+            self.assertEqual(close.call_count, 1)
+            pool = ConnectionPool()
+            with Client({ 'token': 'USER|token', 'connection_pool': pool }) as client:
+                self.assertIs(client.json_client.transport, pool)
+            self.assertEqual(close.call_count, 1)
+        self.assertIsInstance(JsonClient({ 'token': 'USER|token' }).transport, UrllibTransport)
+
+    def test_json_client_uses_transport_object(self):
+        transport = Mock()
+        transport.request = Mock(return_value=(200, 'OK', '{"favorites": []}'))
+        client = JsonClient({ 'token': 'USER|token', 'enterprise_account': 'acme', 'user_id': '1', 'transport': transport })
+        client.sendsecure_endpoint = 'https://awesome.sendsecure.portal/'
+        self.assertEqual(client.get_favorites(), '{"favorites": []}')
+        transport.request.assert_called_once_with('GET', 'https://awesome.sendsecure.portal/api/v2/enterprises/acme/users/1/favorites.json?locale=en',
+                                                  b'', { 'Content-type': 'application/json', 'Accept': 'application/json', 'authorization-token': 'USER|token' }, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,276 @@
+from sendsecure import *
+import io
+import os
+import shutil
+import hashlib
+import tempfile
+import socket
+import threading
+import http.client
+import unittest
+from http.server import HTTPServer, ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class _FileServerHandler(BaseHTTPRequestHandler):
+    content = bytes(range(256)) * 1000
+    ranges = True
+    failures = 0
+    requests = []
+
+    def do_GET(self):
+        server = type(self)
+        content = server.content
+        header = self.headers.get('Range')
+        server.requests.append(header)
+        if header and server.ranges:
+            (start, end) = header[len('bytes='):].split('-')
+            (start, end) = (int(start), min(int(end or len(content) - 1), len(content) - 1))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end, len(content)))
+            body = content[start:end + 1]
+        else:
+            self.send_response(200)
+            body = content
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if start_failure(server) and len(body) > 10:
+            # drop the connection in the middle of the body
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    connections = []
+
+    def do_POST(self):
+        type(self).connections.append(self.client_address)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        content = json.dumps({ 'path': self.path, 'body': body.decode('utf-8'), 'token': self.headers.get('authorization-token') }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_failure(server):
+    if server.failures > 0:
+        server.failures -= 1
+        return True
+    return False
+
+class TestUtils(unittest.TestCase):
+    document = { 'count': 3,
+                 'previous_page_url': None,
+                 'safeboxes': [
+                     { 'safebox': { 'guid': 'a', 'subject': 'Café ☃', 'unread_count': 10 } },
+                     { 'safebox': { 'guid': 'b', 'subject': None, 'unread_count': 0 } },
+                     { 'safebox': { 'guid': 'c', 'subject': '[{"nested": "json"}]', 'unread_count': 123456 } }
+                 ],
+                 'next_page_url': 'api/v2/safeboxes?page=2' }
+
+    def test_iter_json_array(self):
+        stream = io.BytesIO(json.dumps(self.document, indent=2).encode('utf-8'))
+        result = list(iter_json_array(stream, 'safeboxes'))
+        self.assertEqual(result, self.document['safeboxes'])
+
+    def test_iter_json_array_with_tiny_chunks(self):
+        stream = io.BytesIO(json.dumps(self.document, ensure_ascii=False).encode('utf-8'))
+        result = list(iter_json_array(stream, 'safeboxes', chunk_size=1))
+        self.assertEqual(result, self.document['safeboxes'])
+
+    def test_iter_json_array_is_lazy(self):
+        stream = io.BytesIO(json.dumps({ 'messages': [{ 'id': i } for i in range(1000)] }).encode('utf-8'))
+        result = iter_json_array(stream, 'messages', chunk_size=64)
+        self.assertEqual(next(result), { 'id': 0 })
+        self.assertLess(stream.tell(), 128)
+
+    def test_iter_json_array_without_key(self):
+        stream = io.BytesIO(json.dumps({ 'count': 0 }).encode('utf-8'))
+        self.assertEqual(list(iter_json_array(stream, 'safeboxes')), [])
+
+    def test_iter_json_array_with_empty_array(self):
+        stream = io.BytesIO(b'{"messages": [], "count": 0}')
+        self.assertEqual(list(iter_json_array(stream, 'messages')), [])
+
+    def test_iter_json_array_with_malformed_json(self):
+        stream = io.BytesIO(b'{"messages": [{"id": 1} {"id": 2}]}')
+        with self.assertRaises(ValueError):
+            list(iter_json_array(stream, 'messages'))
+
+    def test_iter_json_array_with_truncated_json(self):
+        stream = io.BytesIO(b'{"messages": [{"id": 1}, {"id": ')
+        with self.assertRaises(ValueError):
+            list(iter_json_array(stream, 'messages'))
+
+
+    def test_copy_stream_to_path(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'audit.pdf')
+            (size, checksum) = copy_stream(io.BytesIO(b'%PDF-1.4 content'), path, chunk_size=3)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'%PDF-1.4 content')
+            self.assertEqual(size, 16)
+            self.assertEqual(checksum, hashlib.sha256(b'%PDF-1.4 content').hexdigest())
+            self.assertEqual(os.listdir(directory), ['audit.pdf'])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_copy_stream_to_path_removes_partial_file(self):
+        class FailingStream:
+            def read(self, size):
+                raise IOError('connection reset')
+        directory = tempfile.mkdtemp()
+        try:
+            with self.assertRaises(IOError):
+                copy_stream(FailingStream(), os.path.join(directory, 'audit.pdf'))
+            self.assertEqual(os.listdir(directory), [])
+        finally:
+            shutil.rmtree(directory)
+
+
+    def _serve(self, base=_FileServerHandler, **attributes):
+        handler = type('Handler', (base,), dict({ 'requests': [] }, **attributes))
+        httpd = HTTPServer(('127.0.0.1', 0), handler)
+        thread = threading.Thread(target=httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(httpd.server_close)
+        self.addCleanup(httpd.shutdown)
+        return (handler, 'http://127.0.0.1:%d' % httpd.server_address[1])
+
+    def _download(self, url, **options):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'document.bin')
+        result = http_download(url, path, **options)
+        with open(path, 'rb') as f:
+            return (result, f.read(), os.listdir(directory))
+
+    def test_http_download_with_ranges(self):
+        (handler, url) = self._serve()
+        (result, content, files) = self._download(url, max_workers=3, part_size=10000)
+        self.assertEqual(content, handler.content)
+        self.assertEqual(result, (len(handler.content), hashlib.sha256(handler.content).hexdigest()))
+        self.assertEqual(len(handler.requests), 26)
+        self.assertEqual(files, ['document.bin'])
+
+    def test_http_download_resumes_interrupted_ranges(self):
+        (handler, url) = self._serve(failures=2)
+        (result, content, files) = self._download(url, max_workers=2, part_size=100000)
+        self.assertEqual(content, handler.content)
+        self.assertEqual(len(handler.requests), 5)
+        self.assertTrue(all(request.startswith('bytes=') for request in handler.requests))
+
+    def test_http_download_without_range_support(self):
+        (handler, url) = self._serve(ranges=False)
+        (result, content, files) = self._download(url, part_size=10000)
+        self.assertEqual(content, handler.content)
+        self.assertEqual(len(handler.requests), 1)
+
+    def test_http_download_resumes_single_stream(self):
+        (handler, url) = self._serve(failures=1)
+        (result, content, files) = self._download(url, part_size=len(_FileServerHandler.content))
+        self.assertEqual(content, handler.content)
+        self.assertEqual(handler.requests, ['bytes=0-%d' % (len(handler.content) - 1), 'bytes=%d-' % (len(handler.content) // 2)])
+        dest = io.BytesIO()
+        (handler, url) = self._serve(failures=1)
+        http_download(url, dest, max_workers=1)
+        self.assertEqual(dest.getvalue(), handler.content)
+        self.assertEqual(len(handler.requests), 2)
+
+    def test_http_download_failed_range_cancels_the_others(self):
+        (handler, url) = self._serve(failures=100)
+        with self.assertRaises(http.client.HTTPException):
+            self._download(url, max_workers=2, part_size=1000, retries=0)
+        # 256 ranges without the cancellation
+        self.assertLess(len(handler.requests), 64)
+
+    def test_http_download_uses_open_stream(self):
+        (handler, url) = self._serve()
+        opened = []
+        def open_stream(url, headers=None):
+            opened.append(headers)
+            return http_get_stream(url, '*/*', headers=headers, timeout=5)
+        (result, content, files) = self._download(url, max_workers=2, part_size=100000, open_stream=open_stream)
+        self.assertEqual(content, handler.content)
+        self.assertEqual(opened, [{ 'Range': 'bytes=0-99999' }, { 'Range': 'bytes=100000-199999' }, { 'Range': 'bytes=200000-255999' }])
+
+    def test_http_download_small_file(self):
+        (handler, url) = self._serve(content=b'small document')
+        (result, content, files) = self._download(url)
+        self.assertEqual(content, b'small document')
+        self.assertEqual(result[0], 14)
+
+    def test_http_download_to_file_object(self):
+        (handler, url) = self._serve()
+        dest = io.BytesIO()
+        http_download(url, dest, part_size=10000)
+        self.assertEqual(dest.getvalue(), handler.content)
+
+
+    def test_connection_pool_reuses_connections(self):
+        (handler, url) = self._serve(_KeepAliveHandler, connections=[])
+        pool = ConnectionPool()
+        self.addCleanup(pool.close)
+        url += '/api/v2/safeboxes.json?locale=en'
+        for i in range(3):
+            (status, reason, content) = http_post(url, 'application/json', '{"n": %d}' % i, auth_token='token', pool=pool)
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(content), { 'path': '/api/v2/safeboxes.json?locale=en', 'body': '{"n": %d}' % i, 'token': 'token' })
+        self.assertEqual(len(handler.connections), 3)
+        self.assertEqual(len(set(handler.connections)), 1)
+
+    def test_connection_pool_retries_stale_connections(self):
+        (handler, url) = self._serve(_KeepAliveHandler, connections=[])
+        pool = ConnectionPool()
+        self.addCleanup(pool.close)
+        pool.request('POST', url, b'', {})
+        for connections in pool._idle.values():
+            for connection in connections:
+                # simulates the server closing the idle connection
+                connection.sock.shutdown(socket.SHUT_RDWR)
+        self.assertEqual(pool.request('POST', url, b'', {})[0], 200)
+        self.assertEqual(len(set(handler.connections)), 2)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'os.fork is not available')
+    def test_connection_pool_is_not_inherited_by_forked_processes(self):
+        handler = type('Handler', (_KeepAliveHandler,), { 'connections': [] })
+        httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        httpd.daemon_threads = True
+        thread = threading.Thread(target=httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(httpd.server_close)
+        self.addCleanup(httpd.shutdown)
+        url = 'http://127.0.0.1:%d' % httpd.server_address[1]
+        pool = ConnectionPool()
+        self.addCleanup(pool.close)
+        pool.request('POST', url, b'', {})
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                if not pool._idle and pool.request('POST', url, b'', {})[0] == 200:
+                    code = 0
+            finally:
+                os._exit(code)
+        (_, status) = os.waitpid(pid, 0)
+        self.assertEqual(os.WEXITSTATUS(status), 0)
+        # the connection of the parent is still usable
+        self.assertEqual(pool.request('POST', url, b'', {})[0], 200)
+        self.assertEqual(len(handler.connections), 3)
+        self.assertEqual(len(set(handler.connections)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()